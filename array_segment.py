@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+
+
+@dataclass
+class ArraySegment:
+    """
+    Track segment stored as contiguous NumPy arrays.
+
+    All arrays have the same length. Missing elevations and timestamps are stored as NaN, timestamps are seconds since
+    the Unix epoch.
+    """
+
+    longitude: np.ndarray
+    latitude: np.ndarray
+    elevation: np.ndarray
+    time: np.ndarray
+
+    def __post_init__(self) -> None:
+        self.longitude = np.ascontiguousarray(self.longitude, dtype=float)
+        self.latitude = np.ascontiguousarray(self.latitude, dtype=float)
+        self.elevation = np.ascontiguousarray(self.elevation, dtype=float)
+        self.time = np.ascontiguousarray(self.time, dtype=float)
+
+        assert (
+            self.longitude.shape
+            == self.latitude.shape
+            == self.elevation.shape
+            == self.time.shape
+        ), "Arrays of segment do not have the same shape"
+        assert self.longitude.ndim == 1, "Arrays of segment should be one-dimensional"
+
+    def __len__(self) -> int:
+        return self.longitude.shape[0]
+
+    def __getitem__(self, index: Union[slice, np.ndarray]) -> "ArraySegment":
+        """
+        Return the points selected by index as new segment.
+
+        Slicing returns views of the underlying arrays, index arrays return copies.
+        """
+        return ArraySegment(
+            self.longitude[index],
+            self.latitude[index],
+            self.elevation[index],
+            self.time[index],
+        )
+
+    @classmethod
+    def from_array(
+        cls, segment_data: np.array, time: Optional[np.array] = None
+    ) -> "ArraySegment":
+        """
+        Create segment from array with longitudes, latitudes and elevations as columns.
+
+        :param: segment_data:   Track data as array of shape (num_points, 3)
+        :param: time:           Optional timestamps in seconds since the epoch
+        :return: Array segment
+        """
+        assert (
+            segment_data.shape[1] == 3
+        ), "Length of data items does not have the right shape"
+
+        if time is None:
+            time = np.full(segment_data.shape[0], np.nan)
+
+        return cls(segment_data[:, 0], segment_data[:, 1], segment_data[:, 2], time)
+
+    def to_array(self) -> np.array:
+        "Return longitudes, latitudes and elevations as columns of an array."
+        return np.column_stack([self.longitude, self.latitude, self.elevation])
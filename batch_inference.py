@@ -0,0 +1,192 @@
+"""Script for predicting hiking times of many GPX tracks and writing the results to a CSV or JSON Lines file."""
+
+import argparse
+import csv
+import glob
+import json
+import os
+from typing import Any, Dict, List, Optional, TextIO
+
+from config import BACKENDS, PREDICTOR_TYPES
+from gpx_discovery import discover_gpx_files
+from elevation_model import ElevationModel
+from predictor import TrackPrediction, load_predictor
+
+OUTPUT_COLUMNS: List[str] = [
+    "file_name",
+    "num_segments",
+    "moving_time_s",
+    "moving_time_std_s",
+    "standard_estimate_s",
+    "true_moving_time_s",
+    "error",
+]
+
+
+def collect_input_files(
+    inputs: List[str], file_list_name: Optional[str] = None
+) -> List[str]:
+    """
+    Collect GPX files from directories, glob patterns and file names.
+
+    Directories are searched recursively. Files that are given several times are only returned once.
+
+    :param: inputs:             Directories, glob patterns or names of GPX files
+    :param: file_list_name:     Optional name of text file with one GPX file name per line
+
+    :return: List of GPX file names in the order in which they were given
+    """
+    file_names: List[str] = []
+
+    for input_name in inputs:
+        if os.path.isdir(input_name):
+            file_names.extend(entry.path for entry in discover_gpx_files(input_name))
+        elif glob.has_magic(input_name):
+            file_names.extend(sorted(glob.glob(input_name, recursive=True)))
+        else:
+            file_names.append(input_name)
+
+    if file_list_name is not None:
+        with open(file_list_name, "r") as file_list:
+            file_names.extend(line.strip() for line in file_list if line.strip())
+
+    return list(dict.fromkeys(file_names))
+
+
+def get_result_row(
+    file_name: str, prediction: Optional[TrackPrediction], error: Optional[str]
+) -> Dict[str, Any]:
+    "Convert prediction or error of a track to output row."
+    row: Dict[str, Any] = {column: None for column in OUTPUT_COLUMNS}
+    row["file_name"] = file_name
+    row["error"] = error
+    if prediction is not None:
+        row.update(prediction.to_dict())
+
+    return row
+
+
+class ResultWriter(object):
+    "Writer of prediction results, one row per track, in CSV or JSON Lines format."
+
+    def __init__(self, output_file: TextIO, output_format: str) -> None:
+        """
+        Construct ResultWriter object.
+
+        :param: output_file:    Text file opened for writing
+        :param: output_format:  "csv" or "jsonl"
+        """
+        if output_format not in ["csv", "jsonl"]:
+            raise ValueError(f"Encountered bad output format {output_format}.")
+
+        self.output_file = output_file
+        self.output_format = output_format
+
+        if output_format == "csv":
+            self.csv_writer = csv.DictWriter(output_file, fieldnames=OUTPUT_COLUMNS)
+            self.csv_writer.writeheader()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        "Write result row."
+        if self.output_format == "csv":
+            self.csv_writer.writerow(row)
+        else:
+            self.output_file.write(json.dumps(row) + "\n")
+
+
+def get_output_format(output_file_name: str) -> str:
+    "Return output format from the extension of the output file name."
+    return "jsonl" if output_file_name.endswith((".jsonl", ".json")) else "csv"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Estimate walking times for many GPX tracks."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="Directories to be searched recursively, glob patterns or names of GPX files.",
+    )
+    parser.add_argument(
+        "--file-list", default=None, help="Text file with one GPX file per line."
+    )
+    parser.add_argument(
+        "--model-type", choices=PREDICTOR_TYPES, default="mixed", help="Name of model."
+    )
+    parser.add_argument(
+        "--model-folder",
+        default=".",
+        help="Folder containing the models and train_dataset_stats.csv.",
+    )
+    parser.add_argument(
+        "--output",
+        default="predictions.csv",
+        help="Output file, JSON Lines if it ends with .jsonl and CSV otherwise.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=65536,
+        help="Number of segments of several tracks that are predicted at once.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes for reading GPX files.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="tensorflow",
+        help="Run the SavedModel with TensorFlow or the model exported by export_numpy_model.py with NumPy.",
+    )
+    parser.add_argument(
+        "--dem-folder",
+        default=None,
+        help="Folder with SRTM tiles (.hgt files) for filling in missing elevations.",
+    )
+    parser.add_argument(
+        "--replace-elevations",
+        action="store_true",
+        help="Replace all GPS elevations by elevations of the tiles in --dem-folder.",
+    )
+    cmd_line_args = vars(parser.parse_args())
+
+    file_list = collect_input_files(cmd_line_args["inputs"], cmd_line_args["file_list"])
+    print("Estimating walking times for {} tracks.".format(len(file_list)))
+
+    elevation_model = (
+        ElevationModel(
+            cmd_line_args["dem_folder"], replace=cmd_line_args["replace_elevations"]
+        )
+        if cmd_line_args["dem_folder"] is not None
+        else None
+    )
+
+    predictor = load_predictor(
+        cmd_line_args["model_type"],
+        cmd_line_args["model_folder"],
+        backend=cmd_line_args["backend"],
+        elevation_model=elevation_model,
+    )
+
+    num_errors = 0
+    with open(cmd_line_args["output"], "w", newline="") as output_file:
+        writer = ResultWriter(output_file, get_output_format(cmd_line_args["output"]))
+
+        for file_name, prediction, error in predictor.predict_tracks(
+            file_list,
+            batch_size=cmd_line_args["batch_size"],
+            jobs=cmd_line_args["jobs"],
+        ):
+            if error is not None:
+                num_errors += 1
+            writer.write(get_result_row(file_name, prediction, error))
+
+    print(
+        "Wrote results for {} tracks to '{}', {} tracks could not be processed.".format(
+            len(file_list), cmd_line_args["output"], num_errors
+        )
+    )
@@ -0,0 +1,711 @@
+"""Benchmarks of the data preparation stages and of inference on synthetic GPX tracks, with results saved as JSON."""
+
+import argparse
+import dataclasses
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import gpx_array_stats
+from array_segment import ArraySegment
+from config import (
+    BACKENDS,
+    DEFAULT_DATA_PREPARATION_CONFIG,
+    MODEL_TYPES,
+    DataPreparationConfig,
+)
+from geodesy import thin_by_distance
+from gpx_stream_parser import parse_gpx_files
+from prepare_data import write_data_to_hdf5
+
+DEFAULT_SIZES: List[int] = [1000, 10000, 100000, 1000000]
+
+# Variants of tracks by whether their points have timestamps and elevations
+VARIANTS: Dict[str, Tuple[bool, bool]] = {
+    "full": (True, True),
+    "no_time": (False, True),
+    "no_elevation": (True, False),
+    "positions_only": (False, False),
+}
+
+# Start of synthetic tracks, in the Alps like most of the training data
+START_LONGITUDE: float = 8.0
+START_LATITUDE: float = 47.0
+START_TIME: np.datetime64 = np.datetime64("2021-06-01T08:00:00", "ms")
+
+METERS_PER_DEGREE_LATITUDE: float = 111195.0
+
+
+@dataclass
+class BenchmarkResult:
+    "Run times of one stage on a track of a given size and variant in seconds, over several repetitions."
+
+    stage: str
+    num_points: int
+    variant: str
+    min_time_s: float
+    median_time_s: float
+    repeats: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        "Convert result to dictionary, with points per second of the fastest repetition, for example for JSON output."
+        return {
+            **dataclasses.asdict(self),
+            "points_per_s": self.num_points / max(self.min_time_s, 1e-12),
+        }
+
+
+def generate_track(
+    num_points: int, seed: int, with_time: bool = True, with_elevation: bool = True
+) -> ArraySegment:
+    """
+    Generate a deterministic synthetic hike.
+
+    The hiker walks about 3 m between points with slowly changing heading and rests at about every fifth point. The
+    elevation changes smoothly with some noise, and points are recorded every 1 to 10 s.
+
+    :param: num_points:     Number of points
+    :param: seed:           Seed of the random number generator, the same seed always gives the same track
+    :param: with_time:      Whether points have timestamps, NaN otherwise
+    :param: with_elevation: Whether points have elevations, NaN otherwise
+
+    :return: Array segment with the points of the track
+    """
+    rng = np.random.default_rng(seed)
+
+    heading = np.cumsum(rng.normal(scale=0.2, size=num_points))
+    step_m = rng.gamma(shape=4.0, scale=0.75, size=num_points)
+    step_m[rng.random(num_points) < 0.2] = 0.0
+    step_m[0] = 0.0
+
+    latitude = START_LATITUDE + np.cumsum(step_m * np.cos(heading)) / (
+        METERS_PER_DEGREE_LATITUDE
+    )
+    longitude = START_LONGITUDE + np.cumsum(step_m * np.sin(heading)) / (
+        METERS_PER_DEGREE_LATITUDE * np.cos(np.radians(latitude))
+    )
+
+    elevation = np.full(num_points, np.nan)
+    if with_elevation:
+        distance_m = np.cumsum(step_m)
+        elevation = (
+            1000.0
+            + 300.0 * np.sin(distance_m / 2000.0)
+            + np.cumsum(rng.normal(scale=0.3, size=num_points))
+        )
+
+    time_s = np.full(num_points, np.nan)
+    if with_time:
+        time_s = START_TIME.astype("datetime64[s]").astype(float) + np.cumsum(
+            rng.integers(1, 11, size=num_points)
+        )
+
+    return ArraySegment(longitude, latitude, elevation, time_s)
+
+
+def format_gpx(segment: ArraySegment) -> str:
+    """
+    Format a segment as GPX document with one track and one track segment.
+
+    :param: segment:    Array segment, missing elevations and timestamps are left out
+
+    :return: Content of GPX file
+    """
+    elevations = [
+        "" if np.isnan(elevation) else f"<ele>{elevation:.2f}</ele>"
+        for elevation in segment.elevation.tolist()
+    ]
+
+    times = [""] * len(segment)
+    has_time = ~np.isnan(segment.time)
+    if np.any(has_time):
+        time_strings = np.datetime_as_string(
+            segment.time[has_time].astype("datetime64[s]"), unit="s"
+        )
+        for i, time_string in zip(np.flatnonzero(has_time), time_strings):
+            times[i] = f"<time>{time_string}Z</time>"
+
+    points = [
+        f'<trkpt lat="{latitude:.7f}" lon="{longitude:.7f}">{elevation}{time_element}</trkpt>\n'
+        for latitude, longitude, elevation, time_element in zip(
+            segment.latitude.tolist(), segment.longitude.tolist(), elevations, times
+        )
+    ]
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="benchmark" xmlns="http://www.topografix.com/GPX/1/1">\n'
+        "<trk><name>Synthetic hike</name><trkseg>\n"
+        + "".join(points)
+        + "</trkseg></trk>\n</gpx>\n"
+    )
+
+
+def write_synthetic_gpx_file(
+    file_name: str,
+    num_points: int,
+    seed: int,
+    with_time: bool = True,
+    with_elevation: bool = True,
+) -> None:
+    """
+    Write a synthetic hike generated by generate_track to a GPX file.
+
+    :param: file_name:      Name of GPX file
+    :param: num_points:     Number of points
+    :param: seed:           Seed of the random number generator
+    :param: with_time:      Whether points have timestamps
+    :param: with_elevation: Whether points have elevations
+    """
+    with open(file_name, "w") as gpx_file:
+        gpx_file.write(
+            format_gpx(generate_track(num_points, seed, with_time, with_elevation))
+        )
+
+
+def time_function(
+    function: Callable[..., Any],
+    repeats: int,
+    setup: Optional[Callable[[], Sequence[Any]]] = None,
+) -> Tuple[List[float], Any]:
+    """
+    Measure run times of a function.
+
+    :param: function:   Function to be timed
+    :param: repeats:    Number of calls
+    :param: setup:      Function returning the arguments of every call, which is not timed, for functions that modify
+                        their arguments in place
+
+    :return: Run times in seconds and result of the last call
+    """
+    times = []
+    result = None
+    for _ in range(repeats):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+
+    return times, result
+
+
+def _copy_segments(segments_list: List[ArraySegment]) -> List[ArraySegment]:
+    return [
+        ArraySegment(
+            segment.longitude.copy(),
+            segment.latitude.copy(),
+            segment.elevation.copy(),
+            segment.time.copy(),
+        )
+        for segment in segments_list
+    ]
+
+
+def benchmark_track(
+    file_name: str,
+    num_points: int,
+    variant: str,
+    predictors: Dict[str, Any],
+    repeats: int = 3,
+    config: DataPreparationConfig = DEFAULT_DATA_PREPARATION_CONFIG,
+) -> List[BenchmarkResult]:
+    """
+    Time every stage of data preparation and inference on one GPX file.
+
+    Every stage gets the output of the previous stage as input, as in prepare_data.process_segments. Segments are not
+    filtered by filter_bad_segments, so tracks without elevations or timestamps are benchmarked completely.
+
+    :param: file_name:      Name of GPX file
+    :param: num_points:     Number of points in the file
+    :param: variant:        Name of the variant of the track, see VARIANTS
+    :param: predictors:     Dictionary mapping model types to predictors, whose predict_segments method is timed
+    :param: repeats:        Number of repetitions of every stage
+    :param: config:         Configuration of data preparation
+
+    :return: Results of all stages
+    """
+    results = []
+
+    def _run(
+        stage: str,
+        function: Callable[..., Any],
+        setup: Optional[Callable[[], Sequence[Any]]] = None,
+    ) -> Any:
+        times, result = time_function(function, repeats, setup)
+        results.append(
+            BenchmarkResult(
+                stage,
+                num_points,
+                variant,
+                min(times),
+                statistics.median(times),
+                repeats,
+            )
+        )
+        return result
+
+    segments_list = _run("parse_gpx_files", lambda: list(parse_gpx_files([file_name])))
+
+    def _smoothen(segments: List[ArraySegment]) -> List[ArraySegment]:
+        gpx_array_stats.smoothen_coordinates(
+            segments,
+            window_size=config.smoothing_window_size,
+            kernel=config.smoothing_kernel,
+        )
+        return segments
+
+    # Smoothing works in place, so every repetition gets fresh copies of the parsed segments
+    smoothed_segments = _run(
+        "smoothen_coordinates", _smoothen, lambda: (_copy_segments(segments_list),)
+    )
+    filtered_segments = _run(
+        "filter_segments",
+        lambda: gpx_array_stats.filter_segments(
+            smoothed_segments, min_distance_m=config.min_distance_m
+        ),
+    )
+    split_segments = _run(
+        "split_segments_by_length",
+        lambda: gpx_array_stats.split_segments_by_length(
+            filtered_segments,
+            max_length_m=config.max_length_m,
+            split_mode=config.split_mode,
+        ),
+    )
+    _run(
+        "extract_stats",
+        lambda: gpx_array_stats.extract_stats(
+            split_segments, num_points_path=config.num_points_path
+        ),
+    )
+    gpx_data = _run(
+        "extract_stats_batch",
+        lambda: gpx_array_stats.extract_stats_batch(
+            split_segments, num_points_path=config.num_points_path
+        ),
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _run(
+            "write_data_to_hdf5",
+            lambda: write_data_to_hdf5(
+                gpx_data,
+                os.path.join(tmp_dir, "benchmark.hdf5"),
+                config.num_points_path,
+            ),
+        )
+
+    for model_type, predictor in predictors.items():
+        _run(f"inference_{model_type}", lambda: predictor.predict_segments(gpx_data))
+
+    return results
+
+
+def run_benchmarks(
+    sizes: List[int] = DEFAULT_SIZES,
+    variants: List[str] = list(VARIANTS),
+    predictors: Optional[Dict[str, Any]] = None,
+    repeats: int = 3,
+    seed: int = 0,
+    config: DataPreparationConfig = DEFAULT_DATA_PREPARATION_CONFIG,
+) -> List[BenchmarkResult]:
+    """
+    Benchmark all stages on synthetic tracks of every size and variant.
+
+    Tracks of the same size share their positions across variants, so variants only differ in the data they lack.
+
+    :param: sizes:      Numbers of points of the tracks
+    :param: variants:   Names of variants, see VARIANTS
+    :param: predictors: Dictionary mapping model types to predictors, inference is not timed if None
+    :param: repeats:    Number of repetitions of every stage
+    :param: seed:       Seed of the track generator
+    :param: config:     Configuration of data preparation
+
+    :return: Results of all stages, sizes and variants
+    """
+    for variant in variants:
+        if variant not in VARIANTS:
+            raise ValueError(f"Encountered bad variant {variant}.")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_points in sizes:
+            for variant in variants:
+                file_name = os.path.join(tmp_dir, f"track_{num_points}_{variant}.gpx")
+                write_synthetic_gpx_file(
+                    file_name, num_points, seed, *VARIANTS[variant]
+                )
+
+                track_results = benchmark_track(
+                    file_name, num_points, variant, predictors or {}, repeats, config
+                )
+                for result in track_results:
+                    print(
+                        "{:>26} {:>8} points {:>15}: {:10.4f} s".format(
+                            result.stage, num_points, variant, result.min_time_s
+                        )
+                    )
+                results.extend(track_results)
+                os.remove(file_name)
+
+    return results
+
+
+def generate_track_with_stops(
+    num_points: int, seed: int, stop_length: int = 40, period: int = 100
+) -> ArraySegment:
+    """
+    Generate a synthetic hike without timestamps and elevations that stops regularly.
+
+    :param: num_points:     Number of points
+    :param: seed:           Seed of the random number generator, see generate_track
+    :param: stop_length:    Number of points of every stop, during which the position does not change
+    :param: period:         Number of points from the start of one stop to the start of the next one
+
+    :return: Array segment with the points of the track
+    """
+    track = generate_track(num_points, seed, with_time=False, with_elevation=False)
+
+    indices = np.arange(num_points)
+    position_in_period = indices % period
+    stopped = position_in_period >= period - stop_length
+    indices[stopped] -= position_in_period[stopped] - (period - stop_length - 1)
+
+    return track[indices]
+
+
+def benchmark_stops(
+    sizes: List[int] = DEFAULT_SIZES,
+    repeats: int = 3,
+    seed: int = 0,
+    min_distance_m: float = DEFAULT_DATA_PREPARATION_CONFIG.min_distance_m,
+) -> List[BenchmarkResult]:
+    """
+    Time thinning of points by distance on hikes with long stops, where the search after every stop is the expensive
+    part.
+
+    The run time per point is printed, which should not grow with the size of the track.
+
+    :param: sizes:          Numbers of points of the tracks
+    :param: repeats:        Number of repetitions
+    :param: seed:           Seed of the track generator
+    :param: min_distance_m: Minimum distance between kept points
+
+    :return: Results for every size, with stage "thin_by_distance_stops"
+    """
+    results = []
+    for num_points in sizes:
+        track = generate_track_with_stops(num_points, seed)
+        times, _ = time_function(
+            lambda: thin_by_distance(track.latitude, track.longitude, min_distance_m),
+            repeats,
+        )
+        result = BenchmarkResult(
+            "thin_by_distance_stops",
+            num_points,
+            "positions_only",
+            min(times),
+            statistics.median(times),
+            repeats,
+        )
+        print(
+            "{:>26} {:>8} points {:>15}: {:10.4f} s, {:8.3f} us per point".format(
+                result.stage,
+                num_points,
+                result.variant,
+                result.min_time_s,
+                1e6 * result.min_time_s / num_points,
+            )
+        )
+        results.append(result)
+
+    return results
+
+
+def benchmark_startup(
+    num_points: int = 1000,
+    model_type: str = "standard",
+    repeats: int = 3,
+    seed: int = 0,
+) -> BenchmarkResult:
+    """
+    Time inference.py in a new Python process, including imports and loading of the model.
+
+    :param: num_points: Number of points of the synthetic hike that is predicted
+    :param: model_type: Model type passed to inference.py, the standard model needs no trained model
+    :param: repeats:    Number of runs of inference.py
+    :param: seed:       Seed of the track generator
+
+    :return: Result with stage "startup_<model_type>"
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = os.path.join(tmp_dir, "track.gpx")
+        write_synthetic_gpx_file(file_name, num_points, seed)
+        times, _ = time_function(
+            lambda: subprocess.run(
+                [sys.executable, "inference.py", file_name, model_type],
+                cwd=folder,
+                stdout=subprocess.DEVNULL,
+                check=True,
+            ),
+            repeats,
+        )
+
+    result = BenchmarkResult(
+        f"startup_{model_type}",
+        num_points,
+        "full",
+        min(times),
+        statistics.median(times),
+        repeats,
+    )
+    print(
+        "{:>26} {:>8} points {:>15}: {:10.4f} s".format(
+            result.stage, num_points, result.variant, result.min_time_s
+        )
+    )
+
+    return result
+
+
+def get_environment() -> Dict[str, str]:
+    "Return versions of Python, NumPy and the platform, which are stored with results."
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def save_results(results: List[BenchmarkResult], file_name: str, **metadata) -> None:
+    """
+    Save benchmark results to a JSON file.
+
+    :param: results:    Benchmark results
+    :param: file_name:  Name of JSON file
+    :param: metadata:   Further entries of the metadata, for example the arguments of the run
+    """
+    with open(file_name, "w") as output_file:
+        json.dump(
+            {
+                "environment": get_environment(),
+                "metadata": metadata,
+                "results": [result.to_dict() for result in results],
+            },
+            output_file,
+            indent=2,
+        )
+
+
+def load_results(file_name: str) -> List[BenchmarkResult]:
+    """
+    Load benchmark results saved by save_results.
+
+    :param: file_name:  Name of JSON file
+
+    :return: Benchmark results
+    """
+    with open(file_name, "r") as input_file:
+        content = json.load(input_file)
+
+    field_names = [field.name for field in dataclasses.fields(BenchmarkResult)]
+    return [
+        BenchmarkResult(**{name: entry[name] for name in field_names})
+        for entry in content["results"]
+    ]
+
+
+def compare_results(
+    baseline: List[BenchmarkResult],
+    results: List[BenchmarkResult],
+    threshold: float = 0.2,
+    min_time_s: float = 1e-3,
+) -> List[Tuple[BenchmarkResult, BenchmarkResult]]:
+    """
+    Find stages that became slower than a baseline.
+
+    Results are matched by stage, size and variant, and the fastest repetitions are compared, which are least affected
+    by other load on the machine.
+
+    :param: baseline:   Results of an earlier run
+    :param: results:    Results of the current run
+    :param: threshold:  Relative slowdown above which a stage counts as regression
+    :param: min_time_s: Stages faster than this in both runs are ignored, since their times are mostly noise
+
+    :return: Pairs of baseline and current result of all regressions
+    """
+    baseline_results = {
+        (result.stage, result.num_points, result.variant): result for result in baseline
+    }
+
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get(
+            (result.stage, result.num_points, result.variant)
+        )
+        if baseline_result is None:
+            continue
+        if max(result.min_time_s, baseline_result.min_time_s) < min_time_s:
+            continue
+        if result.min_time_s > (1 + threshold) * baseline_result.min_time_s:
+            regressions.append((baseline_result, result))
+
+    return regressions
+
+
+def load_benchmark_predictors(
+    model_types: List[str],
+    model_folder: str = ".",
+    stats_file: Optional[str] = None,
+    backend: str = "numpy",
+) -> Dict[str, Any]:
+    """
+    Load predictors for timing inference, skipping models that cannot be loaded.
+
+    :param: model_types:    Model types, "simple", "recurrent" or "mixed"
+    :param: model_folder:   Folder containing the models
+    :param: stats_file:     File with normalization statistics, see predictor.HikingTimePredictor
+    :param: backend:        "tensorflow" or "numpy"
+
+    :return: Dictionary mapping model types to predictors
+    """
+    from predictor import HikingTimePredictor
+
+    predictors = {}
+    for model_type in model_types:
+        try:
+            predictors[model_type] = HikingTimePredictor(
+                model_type, model_folder, stats_file, backend=backend
+            )
+        except Exception as e:
+            print(
+                f"Skipping inference with {model_type} model: {type(e).__name__}: {e}"
+            )
+
+    return predictors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark data preparation and inference on synthetic GPX tracks."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Numbers of points of the synthetic tracks.",
+    )
+    parser.add_argument(
+        "--variants",
+        nargs="+",
+        choices=list(VARIANTS),
+        default=list(VARIANTS),
+        help="Variants of tracks, with or without timestamps and elevations.",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="Number of repetitions of every stage."
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the track generator."
+    )
+    parser.add_argument(
+        "--model-types",
+        nargs="*",
+        choices=MODEL_TYPES,
+        default=MODEL_TYPES,
+        help="Models used for timing inference, none if no types are given.",
+    )
+    parser.add_argument(
+        "--model-folder",
+        default=".",
+        help="Folder containing the models and train_dataset_stats.csv.",
+    )
+    parser.add_argument(
+        "--stats-file",
+        default=None,
+        help="File with normalization statistics, train_dataset_stats.csv in the model folder by default.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="numpy",
+        help="Run the SavedModels with TensorFlow or the models exported by export_numpy_model.py with NumPy.",
+    )
+    parser.add_argument(
+        "--output", default="benchmark_results.json", help="JSON file for results."
+    )
+    parser.add_argument(
+        "--compare",
+        default=None,
+        help="JSON file with results of an earlier run, regressions are reported and fail the run.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown compared to the earlier run that counts as regression.",
+    )
+    cmd_line_args = vars(parser.parse_args())
+
+    benchmark_results = run_benchmarks(
+        cmd_line_args["sizes"],
+        cmd_line_args["variants"],
+        load_benchmark_predictors(
+            cmd_line_args["model_types"],
+            cmd_line_args["model_folder"],
+            cmd_line_args["stats_file"],
+            cmd_line_args["backend"],
+        ),
+        repeats=cmd_line_args["repeats"],
+        seed=cmd_line_args["seed"],
+    )
+    benchmark_results.extend(
+        benchmark_stops(
+            cmd_line_args["sizes"],
+            repeats=cmd_line_args["repeats"],
+            seed=cmd_line_args["seed"],
+        )
+    )
+    benchmark_results.append(
+        benchmark_startup(repeats=cmd_line_args["repeats"], seed=cmd_line_args["seed"])
+    )
+    save_results(benchmark_results, cmd_line_args["output"], arguments=cmd_line_args)
+    print(
+        "Wrote {} results to '{}'.".format(
+            len(benchmark_results), cmd_line_args["output"]
+        )
+    )
+
+    if cmd_line_args["compare"] is not None:
+        regressions = compare_results(
+            load_results(cmd_line_args["compare"]),
+            benchmark_results,
+            cmd_line_args["threshold"],
+        )
+        for baseline_result, result in regressions:
+            print(
+                "Regression of {} with {} points ({}): {:.4f} s instead of {:.4f} s".format(
+                    result.stage,
+                    result.num_points,
+                    result.variant,
+                    result.min_time_s,
+                    baseline_result.min_time_s,
+                )
+            )
+        print("Found {} regressions.".format(len(regressions)))
+        if len(regressions) > 0:
+            sys.exit(1)
@@ -0,0 +1,206 @@
+"""Execution of trained models with inputs padded to a few fixed batch sizes, so that no new shapes are traced later."""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from config import DEFAULT_DATA_PREPARATION_CONFIG, MODEL_TYPES
+from normalization import DATA_COLUMNS
+
+DEFAULT_BUCKET_SIZES: List[int] = [16, 64, 256, 1024, 4096]
+
+ModelInputs = Union[np.array, List[np.array]]
+
+
+def get_input_shapes(
+    model_type: str,
+    num_points_path: int = DEFAULT_DATA_PREPARATION_CONFIG.num_points_path,
+) -> List[Tuple[int, ...]]:
+    """
+    Return shapes of the inputs of a model without the batch dimension, see predictor.get_model_inputs.
+
+    :param: model_type:         Model type, "simple", "recurrent" or "mixed"
+    :param: num_points_path:    Number of points in path feature
+
+    :return: List with one shape for simple and recurrent models and two shapes for mixed models
+    """
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Encountered bad model type {model_type}.")
+
+    features_shape = (len(DATA_COLUMNS),)
+    path_shape = (num_points_path, 3)
+
+    if model_type == "simple":
+        return [features_shape]
+    if model_type == "recurrent":
+        return [path_shape]
+    return [features_shape, path_shape]
+
+
+def get_num_rows(inputs: ModelInputs) -> int:
+    "Return number of rows of model inputs."
+    return len(inputs[0]) if isinstance(inputs, list) else len(inputs)
+
+
+def slice_inputs(inputs: ModelInputs, start: int, stop: int) -> ModelInputs:
+    "Return rows start to stop of model inputs."
+    if isinstance(inputs, list):
+        return [array[start:stop] for array in inputs]
+    return inputs[start:stop]
+
+
+def pad_inputs(inputs: ModelInputs, num_rows: int) -> ModelInputs:
+    """
+    Append rows of zeros to model inputs.
+
+    :param: inputs:     Array or list of arrays with the same number of rows
+    :param: num_rows:   Number of rows after padding, at least the number of rows of inputs
+
+    :return: Padded inputs of the same type as inputs
+    """
+    if isinstance(inputs, list):
+        return [pad_inputs(array, num_rows) for array in inputs]
+
+    padding = [(0, num_rows - len(inputs))] + [(0, 0)] * (inputs.ndim - 1)
+    return np.pad(inputs, padding)
+
+
+def get_bucket_size(num_rows: int, bucket_sizes: List[int]) -> int:
+    """
+    Return smallest bucket size with at least num_rows rows, or the largest bucket size.
+
+    :param: num_rows:       Number of rows of inputs
+    :param: bucket_sizes:   Sorted list of bucket sizes
+    """
+    for bucket_size in bucket_sizes:
+        if bucket_size >= num_rows:
+            return bucket_size
+    return bucket_sizes[-1]
+
+
+def predict_in_buckets(
+    predict_bucket: Callable[[ModelInputs], np.array],
+    inputs: ModelInputs,
+    bucket_sizes: List[int],
+) -> np.array:
+    """
+    Predict inputs in chunks whose number of rows is one of the bucket sizes.
+
+    Inputs with more rows than the largest bucket size are split into chunks of the largest bucket size. The last
+    chunk is padded with zeros to the next bucket size and the predictions of the padding rows are discarded.
+
+    :param: predict_bucket: Function predicting inputs whose number of rows is one of the bucket sizes
+    :param: inputs:         Model inputs with any number of rows
+    :param: bucket_sizes:   Sorted list of bucket sizes
+
+    :return: Predictions with one row per row of inputs
+    """
+    num_rows = get_num_rows(inputs)
+    predictions = []
+
+    for start in range(0, num_rows, bucket_sizes[-1]):
+        chunk = slice_inputs(inputs, start, start + bucket_sizes[-1])
+        num_chunk_rows = get_num_rows(chunk)
+        bucket_size = get_bucket_size(num_chunk_rows, bucket_sizes)
+        predictions.append(
+            np.asarray(predict_bucket(pad_inputs(chunk, bucket_size)))[:num_chunk_rows]
+        )
+
+    if len(predictions) == 0:
+        return np.zeros((0, 2), dtype=np.float32)
+    return np.concatenate(predictions)
+
+
+class BucketedModel(object):
+    """
+    Wrapper of a loaded SavedModel that only calls it with a fixed set of input shapes.
+
+    One concrete function with a fixed input signature is traced per bucket size when the wrapper is constructed, and
+    all of them are called once with zeros for warm up. Inputs are padded to the next bucket size, so requests never
+    trigger tracing or shape-polymorphic execution.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        model_type: str,
+        bucket_sizes: Optional[List[int]] = None,
+        num_points_path: int = DEFAULT_DATA_PREPARATION_CONFIG.num_points_path,
+        warmup: bool = True,
+    ) -> None:
+        """
+        Construct BucketedModel object and trace the model for all bucket sizes.
+
+        :param: model:              Model loaded with tf.saved_model.load
+        :param: model_type:         Model type, "simple", "recurrent" or "mixed"
+        :param: bucket_sizes:       Batch sizes of the concrete functions, DEFAULT_BUCKET_SIZES if None
+        :param: num_points_path:    Number of points in path feature
+        :param: warmup:             Whether to call all concrete functions once
+        """
+        import tensorflow as tf
+
+        self.model = model
+        self.model_type = model_type
+        self.bucket_sizes = sorted(
+            set(DEFAULT_BUCKET_SIZES if bucket_sizes is None else bucket_sizes)
+        )
+        if len(self.bucket_sizes) == 0 or self.bucket_sizes[0] <= 0:
+            raise ValueError("Bucket sizes have to be positive.")
+
+        self.input_shapes = get_input_shapes(model_type, num_points_path)
+        self.tracing_counts: Dict[int, int] = {
+            bucket_size: 0 for bucket_size in self.bucket_sizes
+        }
+        self._convert_to_tensor = tf.convert_to_tensor
+        self.concrete_functions = {
+            bucket_size: self._get_concrete_function(tf, bucket_size)
+            for bucket_size in self.bucket_sizes
+        }
+
+        if warmup:
+            self.warmup()
+
+    def _get_concrete_function(self, tf: Any, bucket_size: int) -> Any:
+        def call_model(*tensors):
+            # Only executed while tracing, so this counts how often the model was traced for the bucket size
+            self.tracing_counts[bucket_size] += 1
+            return self.model(tensors[0] if len(tensors) == 1 else list(tensors))
+
+        return tf.function(call_model).get_concrete_function(
+            *[
+                tf.TensorSpec(shape=(bucket_size,) + shape, dtype=tf.float32)
+                for shape in self.input_shapes
+            ]
+        )
+
+    def _predict_bucket(self, inputs: ModelInputs) -> np.array:
+        arrays = inputs if isinstance(inputs, list) else [inputs]
+        concrete_function = self.concrete_functions[get_num_rows(inputs)]
+        return np.asarray(
+            concrete_function(
+                *[self._convert_to_tensor(array, dtype="float32") for array in arrays]
+            )
+        )
+
+    def warmup(self) -> None:
+        "Call the concrete functions of all bucket sizes once with zeros."
+        for bucket_size in self.bucket_sizes:
+            zeros = [
+                np.zeros((bucket_size,) + shape, dtype=np.float32)
+                for shape in self.input_shapes
+            ]
+            self._predict_bucket(zeros if len(zeros) > 1 else zeros[0])
+
+    def get_tracing_count(self) -> int:
+        "Return number of times the model was traced, which stays at the number of bucket sizes after construction."
+        return sum(self.tracing_counts.values())
+
+    def __call__(self, inputs: ModelInputs) -> np.array:
+        """
+        Predict model inputs with any number of rows.
+
+        :param: inputs:     Array for simple and recurrent models, list of features and paths for mixed models
+
+        :return: Array of shape (num_rows, 2) with predicted moving times and log variances
+        """
+        return predict_in_buckets(self._predict_bucket, inputs, self.bucket_sizes)
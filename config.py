@@ -1,4 +1,4 @@
-from typing import Final
+from typing import Final, List
 
 from dataclasses import dataclass
 from dataclasses_json import dataclass_json
@@ -12,6 +12,9 @@ class DataPreparationConfig:
     max_length_m: float
     max_elevation_diff_m: float
     filter_bad_segments: bool
+    split_mode: str = "halving"
+    smoothing_window_size: int = 3
+    smoothing_kernel: str = "moving_average"
 
 
 DEFAULT_DATA_PREPARATION_CONFIG: Final[DataPreparationConfig] = DataPreparationConfig(
@@ -21,3 +24,14 @@ DEFAULT_DATA_PREPARATION_CONFIG: Final[DataPreparationConfig] = DataPreparationC
     max_elevation_diff_m=100.0,
     filter_bad_segments=True,
 )
+
+
+MODEL_TYPES: Final[List[str]] = ["simple", "recurrent", "mixed"]
+
+# Standard estimate from track length and elevation changes, which needs no trained model and no TensorFlow
+STANDARD_MODEL_TYPE: Final[str] = "standard"
+
+PREDICTOR_TYPES: Final[List[str]] = [STANDARD_MODEL_TYPE] + MODEL_TYPES
+
+# Trained models are either loaded as SavedModels with TensorFlow or from files written by export_numpy_model.py
+BACKENDS: Final[List[str]] = ["tensorflow", "numpy"]
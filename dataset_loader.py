@@ -0,0 +1,240 @@
+"""Loader for prepared HDF5 datasets of segment statistics without per-row Python objects."""
+
+from typing import Generator, List, Optional, Tuple, Union
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from gpx_stats import GpxSegmentStatsBatch
+
+ArrayLike = Union[np.ndarray, h5py.Dataset]
+
+
+def _to_index_array(indices: np.array, num_rows: int) -> np.array:
+    "Convert boolean mask or integer indices to integer indices."
+    indices = np.asarray(indices)
+    if indices.dtype == bool:
+        assert len(indices) == num_rows, "Mask does not match number of rows"
+        return np.flatnonzero(indices)
+
+    return np.where(indices < 0, indices + num_rows, indices)
+
+
+def take_rows(
+    data: ArrayLike, indices: Optional[np.array] = None, chunk_rows: int = 65536
+) -> np.array:
+    """
+    Read selected rows of an array or HDF5 dataset.
+
+    HDF5 datasets are read in blocks of consecutive rows, which is much faster than point selections and keeps the
+    temporary memory bounded.
+
+    :param: data:           Array, memory-mapped array or HDF5 dataset
+    :param: indices:        Boolean mask or integer indices of rows in any order, all rows if None
+    :param: chunk_rows:     Number of consecutive rows read from HDF5 datasets at once
+
+    :return: Array with the selected rows
+    """
+    if indices is None:
+        return data[()] if isinstance(data, h5py.Dataset) else data
+
+    indices = _to_index_array(indices, len(data))
+    if not isinstance(data, h5py.Dataset):
+        return data[indices]
+
+    result = np.empty((len(indices),) + data.shape[1:], dtype=data.dtype)
+    order = np.argsort(indices, kind="stable")
+    sorted_indices = indices[order]
+
+    block_ids = sorted_indices // chunk_rows
+    block_starts = np.flatnonzero(np.diff(block_ids, prepend=-1))
+    block_stops = np.append(block_starts[1:], len(sorted_indices))
+
+    for start, stop in zip(block_starts, block_stops):
+        first_row = int(sorted_indices[start])
+        last_row = int(sorted_indices[stop - 1])
+        block = data[first_row : last_row + 1]
+        result[order[start:stop]] = block[sorted_indices[start:stop] - first_row]
+
+    return result
+
+
+class SegmentDataset(object):
+    """
+    Read-only view of an HDF5 file written by prepare_data.py.
+
+    Contiguous, uncompressed datasets are memory-mapped, so their columns are NumPy arrays whose pages are only read
+    from disk when they are accessed. Chunked or compressed datasets are returned as h5py datasets, which read data
+    lazily when they are sliced.
+    """
+
+    def __init__(self, file_name: str, memory_map: bool = True) -> None:
+        """
+        Construct SegmentDataset object.
+
+        :param: file_name:      Name of HDF5 file
+        :param: memory_map:     Whether to memory-map datasets where possible
+        """
+        self.file_name = file_name
+        self._file = h5py.File(file_name, "r")
+        self._columns = {
+            name: self._open_column(self._file[name], memory_map)
+            for name in GpxSegmentStatsBatch.get_header()
+        }
+
+    def _open_column(self, dataset: h5py.Dataset, memory_map: bool) -> ArrayLike:
+        offset = dataset.id.get_offset()
+        if (
+            not memory_map
+            or offset is None
+            or dataset.chunks is not None
+            or dataset.size == 0
+        ):
+            return dataset
+
+        return np.memmap(
+            self.file_name,
+            mode="r",
+            dtype=dataset.dtype,
+            shape=dataset.shape,
+            offset=offset,
+        )
+
+    def __enter__(self) -> "SegmentDataset":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        "Close the file, memory-mapped columns stay valid until they are deleted."
+        if self._file:
+            self._file.close()
+
+    def __len__(self) -> int:
+        return len(self._columns["Length2d"])
+
+    def __getitem__(self, name: str) -> ArrayLike:
+        "Return column as memory-mapped array or HDF5 dataset without reading it."
+        return self._columns[name]
+
+    def is_memory_mapped(self, name: str) -> bool:
+        "Return whether a column is memory-mapped."
+        return isinstance(self._columns[name], np.memmap)
+
+    def get_features(
+        self, columns: List[str], indices: Optional[np.array] = None
+    ) -> np.array:
+        """
+        Return scalar columns as array of shape (num_rows, len(columns)).
+
+        :param: columns:    Names of scalar columns
+        :param: indices:    Boolean mask or integer indices of rows, all rows if None
+        """
+        return np.stack(
+            [take_rows(self._columns[name], indices) for name in columns], axis=1
+        )
+
+    def get_paths(self, indices: Optional[np.array] = None) -> np.array:
+        """
+        Return path features as array of shape (num_rows, num_points_path, 3).
+
+        :param: indices:    Boolean mask or integer indices of rows, all rows if None
+        """
+        return take_rows(self._columns["Path"], indices)
+
+    def iter_row_blocks(
+        self, block_rows: int = 65536
+    ) -> Generator[Tuple[int, int], None, None]:
+        """
+        Yield start and stop indices of consecutive blocks of rows.
+
+        :param: block_rows:     Number of rows per block
+        """
+        for start in range(0, len(self), block_rows):
+            yield start, min(start + block_rows, len(self))
+
+    def get_valid_path_mask(self, block_rows: int = 65536) -> np.array:
+        "Return boolean mask of rows whose path feature does not contain NaN values."
+        paths = self._columns["Path"]
+        mask = np.empty(len(self), dtype=bool)
+        for start, stop in self.iter_row_blocks(block_rows):
+            mask[start:stop] = ~np.any(np.isnan(paths[start:stop]), axis=(1, 2))
+
+        return mask
+
+    def get_feature_statistics(
+        self,
+        columns: List[str],
+        indices: Optional[np.array] = None,
+        block_rows: int = 65536,
+    ) -> Tuple[np.array, np.array]:
+        """
+        Compute mean and sample standard deviation of scalar columns, as in pandas.DataFrame.describe.
+
+        Columns are read in blocks, so the statistics can be computed for datasets that do not fit into memory.
+
+        :param: columns:        Names of scalar columns
+        :param: indices:        Boolean mask of rows to include, all rows if None
+        :param: block_rows:     Number of rows read at once
+
+        :return: Arrays of means and standard deviations with an entry for every column
+        """
+        if indices is None:
+            mask = np.ones(len(self), dtype=bool)
+        else:
+            mask = np.zeros(len(self), dtype=bool)
+            mask[_to_index_array(indices, len(self))] = True
+
+        # Combine counts, means and sums of squared deviations of blocks with the parallel algorithm of Chan et al.
+        count = 0
+        mean = np.zeros(len(columns))
+        squared_deviations = np.zeros(len(columns))
+        for start, stop in self.iter_row_blocks(block_rows):
+            block = self.get_features(columns, np.arange(start, stop))
+            block = block[mask[start:stop]].astype(float)
+            if len(block) == 0:
+                continue
+
+            block_mean = np.mean(block, axis=0)
+            delta = block_mean - mean
+            new_count = count + len(block)
+
+            squared_deviations += (
+                np.sum((block - block_mean) ** 2, axis=0)
+                + delta**2 * count * len(block) / new_count
+            )
+            mean += delta * len(block) / new_count
+            count = new_count
+
+        if count == 0:
+            mean[:] = np.nan
+        if count < 2:
+            return mean, np.full(len(columns), np.nan)
+
+        return mean, np.sqrt(squared_deviations / (count - 1))
+
+    def to_data_frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Return scalar columns as data frame, without the path features.
+
+        :param: columns:    Names of scalar columns, all scalar columns if None
+        """
+        if columns is None:
+            columns = [
+                name for name in GpxSegmentStatsBatch.get_header() if name != "Path"
+            ]
+
+        return pd.DataFrame(
+            {name: np.asarray(take_rows(self._columns[name])) for name in columns}
+        )
+
+    def to_batch(self) -> GpxSegmentStatsBatch:
+        "Read all columns into a GpxSegmentStatsBatch."
+        return GpxSegmentStatsBatch(
+            {
+                name: np.asarray(take_rows(column))
+                for name, column in self._columns.items()
+            }
+        )
@@ -0,0 +1,296 @@
+"""Elevations of track points from local digital elevation model tiles, for tracks without usable GPS elevations."""
+
+import collections
+import hashlib
+import math
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from array_segment import ArraySegment
+from feature_cache import FeatureCacheStats
+
+# SRTM tiles cover one degree in both directions and are named by the coordinates of their south west corner
+HGT_FILE_PATTERN = re.compile(r"^([NS])(\d{2})([EW])(\d{3})\.hgt$", re.IGNORECASE)
+
+# Samples without elevation, for example over water or in radar shadows
+HGT_VOID_VALUE: int = -32768
+
+TileKey = Tuple[int, int]
+
+
+def get_tile_key(file_name: str) -> Optional[TileKey]:
+    """
+    Return latitude and longitude of the south west corner of an SRTM tile from its file name.
+
+    :param: file_name:  File name, for example "N47E008.hgt"
+
+    :return: Latitude and longitude in degrees, None if the name is not the name of an SRTM tile
+    """
+    match = HGT_FILE_PATTERN.match(os.path.basename(file_name))
+    if match is None:
+        return None
+
+    latitude = int(match.group(2)) * (1 if match.group(1).upper() == "N" else -1)
+    longitude = int(match.group(4)) * (1 if match.group(3).upper() == "E" else -1)
+    return latitude, longitude
+
+
+class DemTile(object):
+    """
+    Memory-mapped SRTM tile in HGT format.
+
+    HGT files contain square grids of big-endian 16 bit elevations in meters, with rows from north to south and
+    columns from west to east, 1201 samples per row for 3 arc seconds and 3601 for 1 arc second. Samples on the borders
+    of neighboring tiles coincide. Only the samples that are read are loaded from disk.
+    """
+
+    def __init__(self, file_name: str) -> None:
+        """
+        Construct DemTile object.
+
+        :param: file_name:  Name of HGT file, named after the south west corner of the tile
+        """
+        key = get_tile_key(file_name)
+        if key is None:
+            raise ValueError(f"File name of SRTM tile expected, got {file_name}.")
+
+        num_samples = math.isqrt(os.path.getsize(file_name) // 2)
+        if num_samples < 2 or 2 * num_samples**2 != os.path.getsize(file_name):
+            raise ValueError(f"SRTM tile {file_name} does not contain a square grid.")
+
+        self.south, self.west = key
+        self.num_samples = num_samples
+        self.elevation = np.memmap(
+            file_name, dtype=">i2", mode="r", shape=(num_samples, num_samples)
+        )
+
+    def sample(self, longitude: np.array, latitude: np.array) -> np.array:
+        """
+        Interpolate elevations bilinearly between the four samples around every point.
+
+        Void samples are left out and the weights of the others are renormalized.
+
+        :param: longitude:  Longitudes of points in the tile in degrees
+        :param: latitude:   Latitudes of points in the tile in degrees
+
+        :return: Elevations in meters, NaN if all surrounding samples are void
+        """
+        max_index = self.num_samples - 1
+        row = np.clip((self.south + 1 - latitude) * max_index, 0, max_index)
+        column = np.clip((longitude - self.west) * max_index, 0, max_index)
+
+        # The last row and column are only used with zero weight, so points on the border need no special case
+        top = np.minimum(row.astype(np.intp), max_index - 1)
+        left = np.minimum(column.astype(np.intp), max_index - 1)
+        row_fraction, column_fraction = row - top, column - left
+
+        elevations = np.zeros(len(row))
+        weights = np.zeros(len(row))
+        for row_offset, row_weight in [(0, 1 - row_fraction), (1, row_fraction)]:
+            for column_offset, column_weight in [
+                (0, 1 - column_fraction),
+                (1, column_fraction),
+            ]:
+                values = self.elevation[top + row_offset, left + column_offset]
+                weight = np.where(
+                    values != HGT_VOID_VALUE, row_weight * column_weight, 0
+                )
+                elevations += weight * values
+                weights += weight
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(weights > 1e-9, elevations / weights, np.nan)
+
+
+class ElevationModel(object):
+    """
+    Digital elevation model made of SRTM tiles in a local folder.
+
+    Tiles are memory-mapped when points in them are first looked up and kept in a least recently used cache of open
+    tiles, so lookups of many points only read the required samples. Points outside of all tiles get no elevation.
+    Lookups can be made from several threads, and the model can be passed to worker processes, which open their own
+    tiles.
+    """
+
+    def __init__(
+        self, tile_folder: str, max_open_tiles: int = 64, replace: bool = False
+    ) -> None:
+        """
+        Construct ElevationModel object.
+
+        :param: tile_folder:    Folder that is searched recursively for HGT files
+        :param: max_open_tiles: Maximum number of memory-mapped tiles, least recently used tiles are closed
+        :param: replace:        Whether correct_elevations replaces all GPS elevations instead of only missing ones
+        """
+        if max_open_tiles <= 0:
+            raise ValueError("Maximum number of open tiles has to be positive.")
+
+        self.tile_folder = tile_folder
+        self.max_open_tiles = max_open_tiles
+        self.replace = replace
+        self.stats = FeatureCacheStats()
+
+        self.tile_files: Dict[TileKey, str] = {}
+        for directory, _, file_names in os.walk(tile_folder):
+            for file_name in sorted(file_names):
+                key = get_tile_key(file_name)
+                if key is not None:
+                    self.tile_files.setdefault(key, os.path.join(directory, file_name))
+
+        self._tiles: "collections.OrderedDict[TileKey, DemTile]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[str] = None
+
+    def __getstate__(self) -> dict:
+        # Memory maps and locks cannot be pickled, so worker processes open tiles themselves
+        state = self.__dict__.copy()
+        state["_tiles"] = collections.OrderedDict()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get_fingerprint(self) -> str:
+        """
+        Return hash of the tile files and options, which changes whenever corrected elevations may change.
+
+        The hash is computed from the sizes and modification times of the tiles when it is first requested.
+        """
+        if self._fingerprint is None:
+            content = [f"replace={self.replace}"]
+            for key, file_name in sorted(self.tile_files.items()):
+                file_stat = os.stat(file_name)
+                content.append(f"{key}:{file_stat.st_size}:{file_stat.st_mtime_ns}")
+            self._fingerprint = hashlib.sha256("\n".join(content).encode()).hexdigest()
+
+        return self._fingerprint
+
+    def _get_tile(self, key: TileKey) -> DemTile:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self.stats.hits += 1
+                return tile
+
+            self.stats.misses += 1
+            tile = DemTile(self.tile_files[key])
+            self._tiles[key] = tile
+            self.stats.stores += 1
+            if len(self._tiles) > self.max_open_tiles:
+                self._tiles.popitem(last=False)
+                self.stats.evictions += 1
+
+            return tile
+
+    def get_elevations(self, longitude: np.array, latitude: np.array) -> np.array:
+        """
+        Look up elevations of points.
+
+        Points are grouped by tile, so every tile is accessed once per call.
+
+        :param: longitude:  Longitudes of points in degrees
+        :param: latitude:   Latitudes of points in degrees
+
+        :return: Elevations in meters, NaN for points outside of all tiles or in voids
+        """
+        longitude = np.asarray(longitude, dtype=float)
+        latitude = np.asarray(latitude, dtype=float)
+        elevations = np.full(len(longitude), np.nan)
+
+        valid = np.flatnonzero(np.isfinite(longitude) & np.isfinite(latitude))
+        if len(valid) == 0:
+            return elevations
+
+        # Tiles are numbered from south west to north east, so points can be grouped by one integer per point
+        south = np.floor(latitude[valid]).astype(np.int64)
+        west = np.floor(longitude[valid]).astype(np.int64)
+        tile_numbers = (south + 90) * 360 + (west + 180)
+
+        # Tracks usually lie in a single tile, which needs no sorting
+        if np.all(tile_numbers == tile_numbers[0]):
+            groups = [valid]
+        else:
+            order = np.argsort(tile_numbers, kind="stable")
+            boundaries = np.flatnonzero(np.diff(tile_numbers[order])) + 1
+            groups = np.split(valid[order], boundaries)
+
+        for group in groups:
+            key = (
+                int(np.floor(latitude[group[0]])),
+                int(np.floor(longitude[group[0]])),
+            )
+            if key not in self.tile_files:
+                continue
+
+            elevations[group] = self._get_tile(key).sample(
+                longitude[group], latitude[group]
+            )
+
+        return elevations
+
+    def correct_elevations(self, segments_list: List[ArraySegment]) -> int:
+        """
+        Fill in missing elevations of track segments in place, or replace all elevations if replace was set.
+
+        The points of all segments are looked up together. Points without elevation in the model keep their GPS
+        elevation.
+
+        :param: segments_list:  List of array segments
+
+        :return: Number of points whose elevation was set
+        """
+        selections = [
+            (
+                np.arange(len(segment))
+                if self.replace
+                else np.flatnonzero(np.isnan(segment.elevation))
+            )
+            for segment in segments_list
+        ]
+        if sum(len(selection) for selection in selections) == 0:
+            return 0
+
+        elevations = self.get_elevations(
+            np.concatenate(
+                [
+                    segment.longitude[selection]
+                    for segment, selection in zip(segments_list, selections)
+                ]
+            ),
+            np.concatenate(
+                [
+                    segment.latitude[selection]
+                    for segment, selection in zip(segments_list, selections)
+                ]
+            ),
+        )
+
+        num_corrected = 0
+        offset = 0
+        for segment, selection in zip(segments_list, selections):
+            segment_elevations = elevations[offset : offset + len(selection)]
+            offset += len(selection)
+
+            available = ~np.isnan(segment_elevations)
+            segment.elevation[selection[available]] = segment_elevations[available]
+            num_corrected += int(np.sum(available))
+
+        return num_corrected
+
+    def report(self) -> str:
+        "Return summary of tile usage."
+        return "Elevation model: {} tiles, {} lookups of open tiles, {} tiles opened, {} closed".format(
+            len(self.tile_files),
+            self.stats.hits,
+            self.stats.misses,
+            self.stats.evictions,
+        )
@@ -0,0 +1,439 @@
+"""
+Script for exporting the trained Keras models to npz files for numpy_model.NumpyModel.
+
+The architecture is read from keras_metadata.pb and the weights from the variables checkpoint of each SavedModel
+directory. Both files are parsed directly, so TensorFlow is not needed for the export either.
+"""
+
+import argparse
+import json
+import os
+import struct
+from dataclasses import dataclass, field
+from typing import Any, Dict, Generator, List, Tuple, Union
+
+import numpy as np
+
+from config import MODEL_TYPES
+from numpy_model import LAYER_WEIGHT_NAMES, NUMPY_MODEL_FILES, NumpyModel
+from predictor import MODEL_DIRECTORIES
+
+# Data types of the TensorFlow DataType enum that can occur in checkpoints of weights
+CHECKPOINT_DTYPES: Dict[int, str] = {1: "<f4", 2: "<f8", 3: "<i4", 9: "<i8"}
+DT_STRING: int = 7
+
+# Checkpoint key of the serialized graph of objects with variables
+OBJECT_GRAPH_KEY: str = "_CHECKPOINTABLE_OBJECT_GRAPH"
+
+# Inputs and predictions of the SavedModels in TensorFlow, see write_reference_predictions
+REFERENCE_FILE: str = "numpy_model_reference.npz"
+
+# Options of the layer configurations that are used by NumpyModel
+LAYER_OPTIONS: List[str] = [
+    "activation",
+    "padding",
+    "epsilon",
+    "axis",
+    "return_sequences",
+    "recurrent_activation",
+]
+
+
+def _read_varint(buffer: bytes, position: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return result, position
+
+
+def iter_protobuf_fields(buffer: bytes) -> Generator[Tuple[int, Any], None, None]:
+    """
+    Iterate over the fields of a serialized protocol buffer message.
+
+    :param: buffer:     Serialized message
+
+    :return: Generator of field number and value, an integer for varints and bytes otherwise
+    """
+    value: Union[int, bytes]
+    position = 0
+    while position < len(buffer):
+        tag, position = _read_varint(buffer, position)
+        field_number, wire_type = tag >> 3, tag & 7
+        if wire_type == 0:
+            value, position = _read_varint(buffer, position)
+        elif wire_type == 2:
+            length, position = _read_varint(buffer, position)
+            value = buffer[position : position + length]
+            position += length
+        elif wire_type in (1, 5):
+            length = 8 if wire_type == 1 else 4
+            value = buffer[position : position + length]
+            position += length
+        else:
+            raise ValueError(f"Encountered unsupported wire type {wire_type}.")
+        yield field_number, value
+
+
+def read_keras_config(model_dir: str) -> Dict[str, Any]:
+    """
+    Read configuration of the Keras model saved in a SavedModel directory.
+
+    :param: model_dir:  SavedModel directory
+
+    :return: Configuration of the model, as returned by Model.get_config
+    """
+    with open(os.path.join(model_dir, "keras_metadata.pb"), "rb") as metadata_file:
+        buffer = metadata_file.read()
+
+    # SavedMetadata has repeated SavedObject nodes (1) with node path (3) and JSON metadata (5)
+    for field_number, node in iter_protobuf_fields(buffer):
+        if field_number != 1:
+            continue
+        fields = dict(iter_protobuf_fields(node))
+        if fields.get(3) == b"root":
+            metadata = json.loads(fields[5].decode("utf-8"))
+            if metadata.get("class_name") != "Functional":
+                raise ValueError(
+                    f"Encountered unsupported model class {metadata.get('class_name')}."
+                )
+            return metadata["config"]
+
+    raise ValueError(f"No Keras model found in {model_dir}.")
+
+
+def _iter_table_block(
+    buffer: bytes, offset: int, size: int
+) -> Generator[Tuple[bytes, bytes], None, None]:
+    block = buffer[offset : offset + size]
+    num_restarts = struct.unpack("<I", block[-4:])[0]
+    end = len(block) - 4 - 4 * num_restarts
+
+    position = 0
+    key = b""
+    while position < end:
+        shared, position = _read_varint(block, position)
+        non_shared, position = _read_varint(block, position)
+        value_length, position = _read_varint(block, position)
+        key = key[:shared] + block[position : position + non_shared]
+        position += non_shared
+        yield key, block[position : position + value_length]
+        position += value_length
+
+
+def _read_checkpoint_entries(model_dir: str) -> Tuple[Dict[str, Dict[int, Any]], bytes]:
+    """
+    Read index and data file of the checkpoint in a SavedModel directory.
+
+    The index is an uncompressed table of BundleEntryProto messages with data type (1), shape (2), shard (3), offset
+    (4) and size (5) of each tensor in the data file.
+
+    :param: model_dir:  SavedModel directory
+
+    :return: Dictionary mapping checkpoint keys to entries with shape as list of dimensions, and content of data file
+    """
+    prefix = os.path.join(model_dir, "variables", "variables")
+    with open(prefix + ".index", "rb") as index_file:
+        index = index_file.read()
+
+    # Footer with handles of metaindex and index block, padded to 40 bytes, and magic number
+    _, position = _read_varint(index, len(index) - 48)
+    _, position = _read_varint(index, position)
+    index_offset, position = _read_varint(index, position)
+    index_size, _ = _read_varint(index, position)
+
+    entries: Dict[str, Dict[int, Any]] = {}
+    for _, handle in _iter_table_block(index, index_offset, index_size):
+        block_offset, position = _read_varint(handle, 0)
+        block_size, _ = _read_varint(handle, position)
+        for key, value in _iter_table_block(index, block_offset, block_size):
+            if not key:  # The entry with empty key is the header of the bundle
+                continue
+
+            entry: Dict[int, Any] = {1: 0, 2: [], 3: 0, 4: 0, 5: 0}
+            for field_number, field_value in iter_protobuf_fields(value):
+                if field_number == 2:
+                    entry[2] = [
+                        dict(iter_protobuf_fields(dimension)).get(1, 0)
+                        for _, dimension in iter_protobuf_fields(field_value)
+                    ]
+                else:
+                    entry[field_number] = field_value
+            entries[key.decode("utf-8")] = entry
+
+    with open(prefix + ".data-00000-of-00001", "rb") as data_file:
+        data = data_file.read()
+
+    return entries, data
+
+
+def read_checkpoint_variables(model_dir: str) -> Dict[str, np.array]:
+    """
+    Read all numeric variables of the checkpoint in a SavedModel directory.
+
+    :param: model_dir:  SavedModel directory
+
+    :return: Dictionary mapping checkpoint keys to arrays
+    """
+    entries, data = _read_checkpoint_entries(model_dir)
+
+    variables: Dict[str, np.array] = {}
+    for name, entry in entries.items():
+        dtype, shard_id, offset, size = entry[1], entry[3], entry[4], entry[5]
+        if dtype not in CHECKPOINT_DTYPES or shard_id != 0:
+            continue
+        variables[name] = np.frombuffer(
+            data[offset : offset + size], dtype=CHECKPOINT_DTYPES[dtype]
+        ).reshape(entry[2])
+
+    return variables
+
+
+@dataclass
+class CheckpointObject:
+    "Node of the object graph of a checkpoint, with node numbers of children and checkpoint keys of attributes."
+
+    children: Dict[str, int] = field(default_factory=dict)
+    attributes: Dict[str, str] = field(default_factory=dict)
+
+
+def read_checkpoint_object_graph(model_dir: str) -> List[CheckpointObject]:
+    """
+    Read the graph of objects whose variables are stored in the checkpoint of a SavedModel directory.
+
+    The graph is a TrackableObjectGraph message, stored as scalar string tensor whose data starts with its length and
+    a checksum. Every node (1) has children (1) with node number (1) and local name (2), and attributes (2) with name
+    (1) and checkpoint key (3). The root node is the Keras model, whose layers are children named "layer-<index>".
+
+    :param: model_dir:  SavedModel directory
+
+    :return: List of nodes, indexed by node number
+    """
+    entries, data = _read_checkpoint_entries(model_dir)
+    entry = entries.get(OBJECT_GRAPH_KEY)
+    if entry is None or entry[1] != DT_STRING or entry[2]:
+        raise ValueError(f"No object graph found in checkpoint of {model_dir}.")
+
+    length, position = _read_varint(data, entry[4])
+    position += 4
+    buffer = data[position : position + length]
+
+    nodes: List[CheckpointObject] = []
+    for field_number, node_buffer in iter_protobuf_fields(buffer):
+        if field_number != 1:
+            continue
+        node = CheckpointObject()
+        for node_field_number, value in iter_protobuf_fields(node_buffer):
+            if node_field_number == 1:
+                reference = dict(iter_protobuf_fields(value))
+                node.children[reference.get(2, b"").decode("utf-8")] = reference.get(
+                    1, 0
+                )
+            elif node_field_number == 2:
+                attribute = dict(iter_protobuf_fields(value))
+                node.attributes[attribute.get(1, b"").decode("utf-8")] = attribute.get(
+                    3, b""
+                ).decode("utf-8")
+        nodes.append(node)
+
+    return nodes
+
+
+def _get_layer_description(layer: Dict[str, Any]) -> Dict[str, Any]:
+    class_name = layer["class_name"]
+    config = layer["config"]
+
+    if class_name not in LAYER_WEIGHT_NAMES:
+        raise ValueError(f"Encountered unsupported layer {class_name}.")
+    if class_name in ["Dense", "Conv1D", "LSTM"] and not config["use_bias"]:
+        raise ValueError(f"Layer {layer['name']} without bias is not supported.")
+    if class_name == "Conv1D" and (
+        config["strides"]["items"] != [1]
+        or config["dilation_rate"]["items"] != [1]
+        or config["padding"] not in ["same", "valid"]
+        or config["data_format"] != "channels_last"
+    ):
+        raise ValueError(f"Options of convolution {layer['name']} are not supported.")
+    if class_name == "BatchNormalization" and (
+        not config["center"] or not config["scale"] or len(config["axis"]) != 1
+    ):
+        raise ValueError(
+            f"Options of batch normalization {layer['name']} are not supported."
+        )
+    if class_name == "LSTM" and (config["go_backwards"] or config["stateful"]):
+        raise ValueError(f"Options of LSTM {layer['name']} are not supported.")
+
+    inbound_nodes = layer.get("inbound_nodes", [])
+    return {
+        "class_name": class_name,
+        "name": layer["name"],
+        "inputs": [node[0] for node in inbound_nodes[0]] if inbound_nodes else [],
+        "config": {key: config[key] for key in LAYER_OPTIONS if key in config},
+    }
+
+
+def get_layer_weights(
+    layers: List[Dict[str, Any]],
+    variables: Dict[str, np.array],
+    object_graph: List[CheckpointObject],
+) -> Dict[str, np.array]:
+    """
+    Assign checkpoint variables to the weights of layers by name.
+
+    The layers of the model are found in the object graph of the checkpoint by their index in the configuration, and
+    their weights by name. Weights of recurrent layers are attributes of their cell.
+
+    :param: layers:         Layer configurations of a Keras functional model
+    :param: variables:      Checkpoint variables from read_checkpoint_variables
+    :param: object_graph:   Object graph from read_checkpoint_object_graph
+
+    :return: Dictionary mapping "<layer name>/<weight name>" to arrays
+    """
+    weights: Dict[str, np.array] = {}
+    root = object_graph[0]
+
+    for layer_index, layer in enumerate(layers):
+        weight_names = LAYER_WEIGHT_NAMES[layer["class_name"]]
+        if not weight_names:
+            continue
+
+        node_id = root.children.get(f"layer-{layer_index}")
+        if node_id is None:
+            raise ValueError(f"Layer {layer['name']} not found in checkpoint.")
+        node = object_graph[node_id]
+        if "cell" in node.children:
+            node = object_graph[node.children["cell"]]
+
+        for weight_name in weight_names:
+            key = None
+            if weight_name in node.children:
+                key = object_graph[node.children[weight_name]].attributes.get(
+                    "VARIABLE_VALUE"
+                )
+            if key not in variables:
+                raise ValueError(
+                    f"Weight {weight_name} of layer {layer['name']} not found in checkpoint."
+                )
+            weights[f"{layer['name']}/{weight_name}"] = variables[key]
+
+    return weights
+
+
+def export_model(model_dir: str, output_file: str) -> NumpyModel:
+    """
+    Export Keras model in a SavedModel directory to an npz file.
+
+    :param: model_dir:      SavedModel directory
+    :param: output_file:    Name of npz file
+
+    :return: Exported model
+    """
+    config = read_keras_config(model_dir)
+    layers = [_get_layer_description(layer) for layer in config["layers"]]
+    if len(config["output_layers"]) != 1:
+        raise ValueError("Models with several outputs are not supported.")
+
+    model = NumpyModel(
+        layers,
+        input_layers=[input_layer[0] for input_layer in config["input_layers"]],
+        output_layer=config["output_layers"][0][0],
+        weights=get_layer_weights(
+            config["layers"],
+            read_checkpoint_variables(model_dir),
+            read_checkpoint_object_graph(model_dir),
+        ),
+    )
+    model.save(output_file)
+
+    return model
+
+
+def write_reference_predictions(
+    model_folder: str = ".",
+    file_name: str = REFERENCE_FILE,
+    num_rows: int = 64,
+    seed: int = 0,
+) -> None:
+    """
+    Predict fixed random inputs with the SavedModels in TensorFlow and write inputs and predictions to an npz file.
+
+    The file is committed, so that the exported models are compared with TensorFlow in tests that do not need it.
+
+    :param: model_folder:   Folder containing the model directories
+    :param: file_name:      Name of npz file
+    :param: num_rows:       Number of rows of inputs
+    :param: seed:           Seed of random inputs
+    """
+    import tensorflow as tf
+
+    rng = np.random.default_rng(seed)
+    content: Dict[str, np.array] = {"tensorflow_version": np.array(tf.__version__)}
+
+    for model_type in MODEL_TYPES:
+        model_dir = os.path.join(model_folder, MODEL_DIRECTORIES[model_type])
+        config = read_keras_config(model_dir)
+        input_names = [input_layer[0] for input_layer in config["input_layers"]]
+
+        # Inputs are shared between models, so that they are generated once per input layer name
+        for layer in config["layers"]:
+            if layer["name"] in input_names and layer["name"] not in content:
+                shape = layer["config"]["batch_input_shape"]["items"][1:]
+                content[layer["name"]] = rng.standard_normal((num_rows, *shape)).astype(
+                    np.float32
+                )
+
+        keras_model = tf.keras.models.load_model(model_dir, compile=False)
+        content[f"predictions_{model_type}"] = keras_model(
+            [content[name] for name in input_names], training=False
+        ).numpy()
+
+    np.savez_compressed(file_name, **content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export trained models to npz files for predictions without TensorFlow."
+    )
+    parser.add_argument(
+        "--model-folder",
+        default=".",
+        help="Folder containing the model directories, the npz files are written to it as well.",
+    )
+    parser.add_argument(
+        "--model-types",
+        nargs="+",
+        choices=MODEL_TYPES,
+        default=MODEL_TYPES,
+        help="Model types to export.",
+    )
+    parser.add_argument(
+        "--reference-file",
+        default=None,
+        help="Instead of exporting, write predictions of the SavedModels in TensorFlow on fixed inputs to this file.",
+    )
+    cmd_line_args = vars(parser.parse_args())
+
+    if cmd_line_args["reference_file"] is not None:
+        write_reference_predictions(
+            cmd_line_args["model_folder"], cmd_line_args["reference_file"]
+        )
+        print(f"Wrote reference predictions to '{cmd_line_args['reference_file']}'.")
+    else:
+        for model_type in cmd_line_args["model_types"]:
+            output_file = os.path.join(
+                cmd_line_args["model_folder"], NUMPY_MODEL_FILES[model_type]
+            )
+            model = export_model(
+                os.path.join(
+                    cmd_line_args["model_folder"], MODEL_DIRECTORIES[model_type]
+                ),
+                output_file,
+            )
+            print(
+                "Exported {} weights of '{}' model to '{}'.".format(
+                    len(model.weights), model_type, output_file
+                )
+            )
@@ -0,0 +1,258 @@
+"""On-disk cache of segment statistics extracted from GPX files."""
+
+import collections
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from config import DataPreparationConfig
+from gpx_stats import GpxSegmentStatsBatch
+
+# Increase when the format of cache entries or the extraction of statistics changes
+CACHE_FORMAT_VERSION: int = 1
+
+CACHE_FILE_SUFFIX: str = ".npz"
+
+
+def get_file_hash(file_name: str, block_size: int = 1 << 20) -> str:
+    """
+    Compute SHA-256 hash of the content of a file.
+
+    :param: file_name:      Name of file
+    :param: block_size:     Number of bytes read at once
+
+    :return: Hexadecimal digest
+    """
+    file_hash = hashlib.sha256()
+    with open(file_name, "rb") as input_file:
+        for block in iter(lambda: input_file.read(block_size), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def get_config_hash(data_preparation_config: DataPreparationConfig) -> str:
+    """
+    Compute SHA-256 hash of a data preparation config and the cache format version.
+
+    :param: data_preparation_config:    Configuration of data preparation
+
+    :return: Hexadecimal digest
+    """
+    config_json = data_preparation_config.to_json(sort_keys=True)
+
+    return hashlib.sha256(
+        "{}:{}".format(CACHE_FORMAT_VERSION, config_json).encode()
+    ).hexdigest()
+
+
+@dataclass
+class FeatureCacheStats:
+    "Counters of feature cache accesses."
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def get_hit_rate(self) -> float:
+        "Return fraction of lookups that were answered from the cache."
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
+class FeatureCache(object):
+    """
+    Content-addressed cache of segment statistics of GPX files.
+
+    Entries are keyed by the hash of the file content and the hash of the data preparation config, so renamed files
+    are still found and changed files or configs never return stale data. If the cache grows beyond its maximum
+    size, least recently used entries are evicted.
+
+    For eviction, the cache folder is listed once and the sizes and order of use of the entries are then tracked in
+    memory. Entries stored by other processes sharing the folder are only considered for eviction by new instances.
+    """
+
+    def __init__(self, cache_dir: str, max_size_bytes: Optional[int] = None) -> None:
+        """
+        Construct FeatureCache object.
+
+        :param: cache_dir:          Folder in which cache entries are stored, created if it does not exist
+        :param: max_size_bytes:     Maximum total size of cache entries, unbounded if None
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.stats = FeatureCacheStats()
+
+        # Sizes of entries from the least to the most recently used one, listed when first needed for eviction
+        self._index: "Optional[collections.OrderedDict[str, int]]" = None
+        self._size_bytes = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_key(
+        self,
+        file_name: str,
+        data_preparation_config: DataPreparationConfig,
+        elevation_model: Optional[Any] = None,
+    ) -> str:
+        """
+        Return cache key of a GPX file processed with the given config.
+
+        :param: file_name:                  Name of GPX file
+        :param: data_preparation_config:    Configuration of data preparation
+        :param: elevation_model:            Elevation model used for correcting elevations, see elevation_model, whose
+                                            tiles and options become part of the key
+        """
+        key = "{}-{}".format(
+            get_file_hash(file_name), get_config_hash(data_preparation_config)[:16]
+        )
+        if elevation_model is not None:
+            key += "-" + elevation_model.get_fingerprint()[:16]
+
+        return key
+
+    def _get_entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    def contains(self, key: str) -> bool:
+        """
+        Check whether there is an entry for a key, lookups without entry are counted as misses.
+
+        :param: key:    Cache key, see get_key
+        """
+        if os.path.isfile(self._get_entry_path(key)):
+            return True
+
+        self.stats.misses += 1
+        return False
+
+    def load(self, key: str) -> Optional[GpxSegmentStatsBatch]:
+        """
+        Load cache entry.
+
+        :param: key:    Cache key, see get_key
+
+        :return: Cached statistics or None if there is no valid entry
+        """
+        entry_path = self._get_entry_path(key)
+
+        try:
+            with np.load(entry_path) as entry:
+                batch = GpxSegmentStatsBatch(
+                    {name: entry[name] for name in GpxSegmentStatsBatch.get_header()}
+                )
+        except (OSError, KeyError, ValueError, AssertionError):
+            self.stats.misses += 1
+            return None
+
+        # Mark entry as recently used
+        os.utime(entry_path)
+        if self._index is not None and entry_path in self._index:
+            self._index.move_to_end(entry_path)
+        self.stats.hits += 1
+
+        return batch
+
+    def store(self, key: str, batch: GpxSegmentStatsBatch) -> None:
+        """
+        Store cache entry and evict old entries if the cache is too large.
+
+        The entry is written to a temporary file first, so concurrent readers never see partial entries.
+
+        :param: key:    Cache key, see get_key
+        :param: batch:  Statistics of the segments of a GPX file
+        """
+        entry_path = self._get_entry_path(key)
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            suffix=".tmp", dir=self.cache_dir
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as entry_file:
+                np.savez(
+                    entry_file,
+                    **{name: batch[name] for name in GpxSegmentStatsBatch.get_header()}
+                )
+            os.replace(temporary_path, entry_path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+        if self._index is not None:
+            self._size_bytes -= self._index.pop(entry_path, 0)
+            self._index[entry_path] = os.path.getsize(entry_path)
+            self._size_bytes += self._index[entry_path]
+
+        self.stats.stores += 1
+        self.evict()
+
+    def _list_entries(self):
+        entry_list = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(CACHE_FILE_SUFFIX):
+                    entry_stat = entry.stat()
+                    entry_list.append(
+                        (entry_stat.st_mtime, entry_stat.st_size, entry.path)
+                    )
+
+        return entry_list
+
+    def _get_index(self) -> "collections.OrderedDict[str, int]":
+        if self._index is None:
+            self._index = collections.OrderedDict(
+                (entry_path, size)
+                for _, size, entry_path in sorted(self._list_entries())
+            )
+            self._size_bytes = sum(self._index.values())
+
+        return self._index
+
+    def get_size_bytes(self) -> int:
+        "Return total size of cache entries in bytes."
+        return sum(size for _, size, _ in self._list_entries())
+
+    def get_num_entries(self) -> int:
+        "Return number of cache entries."
+        return len(self._list_entries())
+
+    def evict(self) -> None:
+        "Remove least recently used entries until the cache fits into its maximum size."
+        if self.max_size_bytes is None:
+            return
+
+        index = self._get_index()
+        while self._size_bytes > self.max_size_bytes and len(index) > 0:
+            entry_path, size = index.popitem(last=False)
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            self._size_bytes -= size
+            self.stats.evictions += 1
+
+    def clear(self) -> None:
+        "Remove all cache entries."
+        for _, _, entry_path in self._list_entries():
+            os.remove(entry_path)
+        self._index = None
+
+    def report(self) -> str:
+        "Return summary of cache usage."
+        return (
+            "Feature cache '{}': {} hits, {} misses ({:.1%} hit rate), {} stored, {} evicted, "
+            "{} entries with {:.1f} MB".format(
+                self.cache_dir,
+                self.stats.hits,
+                self.stats.misses,
+                self.stats.get_hit_rate(),
+                self.stats.stores,
+                self.stats.evictions,
+                self.get_num_entries(),
+                self.get_size_bytes() / 1e6,
+            )
+        )
@@ -0,0 +1,265 @@
+"""Vectorized distance and projection functions for track coordinates."""
+
+from typing import Optional
+
+from gpxpy.geo import EARTH_RADIUS, ONE_DEGREE
+import numpy as np
+
+
+def haversine_distance(
+    latitude_1: np.array,
+    longitude_1: np.array,
+    latitude_2: np.array,
+    longitude_2: np.array,
+) -> np.array:
+    """
+    Compute haversine distances between points in meters.
+
+    :param: latitude_1:     Latitudes of first points in degrees
+    :param: longitude_1:    Longitudes of first points in degrees
+    :param: latitude_2:     Latitudes of second points in degrees
+    :param: longitude_2:    Longitudes of second points in degrees
+
+    :return: Distances along great circles
+    """
+    lat_1, lat_2 = np.radians(latitude_1), np.radians(latitude_2)
+    a = np.sin((lat_1 - lat_2) / 2) ** 2 + np.sin(
+        np.radians(np.subtract(longitude_1, longitude_2)) / 2
+    ) ** 2 * np.cos(lat_1) * np.cos(lat_2)
+
+    return EARTH_RADIUS * 2 * np.arcsin(np.sqrt(a))
+
+
+def distance(
+    latitude_1: np.array,
+    longitude_1: np.array,
+    elevation_1: Optional[np.array],
+    latitude_2: np.array,
+    longitude_2: np.array,
+    elevation_2: Optional[np.array],
+) -> np.array:
+    """
+    Compute distances between points in the same way as gpxpy.geo.distance.
+
+    Points that are far apart use the haversine distance, all others use a flat approximation around the first
+    point. Elevations are only taken into account for close points if they are not NaN in both points.
+
+    :param: latitude_1:     Latitudes of first points in degrees
+    :param: longitude_1:    Longitudes of first points in degrees
+    :param: elevation_1:    Elevations of first points in meters or None
+    :param: latitude_2:     Latitudes of second points in degrees
+    :param: longitude_2:    Longitudes of second points in degrees
+    :param: elevation_2:    Elevations of second points in meters or None
+
+    :return: Distances in meters
+    """
+    delta_latitude = np.subtract(latitude_1, latitude_2)
+    delta_longitude = np.subtract(longitude_1, longitude_2)
+
+    y = delta_longitude * np.cos(np.radians(latitude_1))
+    result = np.sqrt(delta_latitude * delta_latitude + y * y) * ONE_DEGREE
+
+    if elevation_1 is not None and elevation_2 is not None:
+        delta_elevation = np.subtract(elevation_1, elevation_2)
+        with_elevation = ~np.isnan(delta_elevation) & (delta_elevation != 0)
+        result = np.where(
+            with_elevation,
+            np.sqrt(result**2 + np.where(with_elevation, delta_elevation, 0.0) ** 2),
+            result,
+        )
+
+    far_apart = (np.abs(delta_latitude) > 0.2) | (np.abs(delta_longitude) > 0.2)
+    if np.any(far_apart):
+        result = np.where(
+            far_apart,
+            haversine_distance(latitude_1, longitude_1, latitude_2, longitude_2),
+            result,
+        )
+
+    return result
+
+
+def point_distances(
+    latitude: np.array, longitude: np.array, elevation: Optional[np.array] = None
+) -> np.array:
+    """
+    Compute distances between consecutive points of a track.
+
+    The distances equal those of gpxpy.geo.length_2d, or gpxpy.geo.length_3d if elevations are given.
+
+    :param: latitude:       Latitudes of track points in degrees
+    :param: longitude:      Longitudes of track points in degrees
+    :param: elevation:      Optional elevations of track points in meters
+
+    :return: Array of length len(latitude) - 1 with distances in meters
+    """
+    return distance(
+        latitude[1:],
+        longitude[1:],
+        None if elevation is None else elevation[1:],
+        latitude[:-1],
+        longitude[:-1],
+        None if elevation is None else elevation[:-1],
+    )
+
+
+def cumulative_distances(
+    latitude: np.array, longitude: np.array, elevation: Optional[np.array] = None
+) -> np.array:
+    """
+    Compute distances along a track from its first point.
+
+    The length of the part of the track between points i and j is cumulative_distances[j] - cumulative_distances[i].
+
+    :param: latitude:       Latitudes of track points in degrees
+    :param: longitude:      Longitudes of track points in degrees
+    :param: elevation:      Optional elevations of track points in meters
+
+    :return: Array of the same length as latitude, starting with zero
+    """
+    result = np.zeros(len(latitude))
+    np.cumsum(point_distances(latitude, longitude, elevation), out=result[1:])
+    return result
+
+
+def bearing(
+    latitude_1: np.array,
+    longitude_1: np.array,
+    latitude_2: np.array,
+    longitude_2: np.array,
+) -> np.array:
+    """
+    Compute initial great circle courses from first to second points.
+
+    :param: latitude_1:     Latitudes of first points in degrees
+    :param: longitude_1:    Longitudes of first points in degrees
+    :param: latitude_2:     Latitudes of second points in degrees
+    :param: longitude_2:    Longitudes of second points in degrees
+
+    :return: Courses in degrees clockwise from true north in [0, 360)
+    """
+    lat_1, lat_2 = np.radians(latitude_1), np.radians(latitude_2)
+    delta_longitude = np.radians(np.subtract(longitude_2, longitude_1))
+
+    y = np.sin(delta_longitude) * np.cos(lat_2)
+    x = np.cos(lat_1) * np.sin(lat_2) - np.sin(lat_1) * np.cos(lat_2) * np.cos(
+        delta_longitude
+    )
+
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def project_to_local_enu(
+    longitude: np.array,
+    latitude: np.array,
+    elevation: np.array,
+    origin_index: int = 0,
+) -> np.array:
+    """
+    Project track points to local east, north and up coordinates in meters.
+
+    The projection is a tangent plane approximation around the origin point, which is accurate for the short
+    segments used as path features.
+
+    :param: longitude:      Longitudes of track points in degrees
+    :param: latitude:       Latitudes of track points in degrees
+    :param: elevation:      Elevations of track points in meters
+    :param: origin_index:   Index of the point that is mapped to the origin
+
+    :return: Array of shape (len(longitude), 3) with east, north and up coordinates
+    """
+    coef = np.cos(np.radians(latitude[origin_index]))
+
+    return np.column_stack(
+        [
+            (longitude - longitude[origin_index]) * coef * ONE_DEGREE,
+            (latitude - latitude[origin_index]) * ONE_DEGREE,
+            elevation - elevation[origin_index],
+        ]
+    )
+
+
+def thin_by_distance(
+    latitude: np.array, longitude: np.array, min_distance_m: float
+) -> np.array:
+    """
+    Return indices of track points that are further away than min_distance_m from the previously kept point.
+
+    The first point is always kept. Distances from every point to the next few points are computed at once, so the
+    sequential selection of points only needs to follow precomputed indices.
+
+    :param: latitude:       Latitudes of track points in degrees
+    :param: longitude:      Longitudes of track points in degrees
+    :param: min_distance_m: Minimum distance between consecutive kept points
+
+    :return: Sorted array of indices of kept points
+    """
+    num_points = len(latitude)
+    if num_points == 0:
+        return np.zeros(0, dtype=int)
+
+    window_size = 16
+    offsets = np.arange(1, window_size + 1)
+
+    # Index of first following point within the window that is far enough away, -1 if there is none.
+    # Points are processed in chunks to bound the size of the intermediate arrays.
+    next_indices = np.full(num_points, -1)
+    chunk_size = 65536
+    for start in range(0, num_points, chunk_size):
+        indices = np.arange(start, min(start + chunk_size, num_points))
+        candidates = indices[:, None] + offsets[None, :]
+        valid = candidates < num_points
+        candidates = np.minimum(candidates, num_points - 1)
+
+        far_enough = valid & (
+            distance(
+                latitude[candidates],
+                longitude[candidates],
+                None,
+                latitude[indices, None],
+                longitude[indices, None],
+                None,
+            )
+            > min_distance_m
+        )
+
+        next_indices[indices] = np.where(
+            np.any(far_enough, axis=1), indices + np.argmax(far_enough, axis=1) + 1, -1
+        )
+
+    kept_indices = [0]
+    last_kept = 0
+    while True:
+        next_index = int(next_indices[last_kept])
+
+        if next_index < 0:
+            # No point within the window is far enough away, for example during a stop. Search the rest of the track
+            # in windows of growing size, so that the cost is proportional to the length of the stop.
+            search_start = last_kept + window_size + 1
+            search_size = 2 * window_size
+            while search_start < num_points:
+                search_end = min(search_start + search_size, num_points)
+                far_enough_indices = np.flatnonzero(
+                    distance(
+                        latitude[search_start:search_end],
+                        longitude[search_start:search_end],
+                        None,
+                        latitude[last_kept],
+                        longitude[last_kept],
+                        None,
+                    )
+                    > min_distance_m
+                )
+                if len(far_enough_indices) > 0:
+                    next_index = search_start + int(far_enough_indices[0])
+                    break
+                search_start = search_end
+                search_size *= 2
+
+            if next_index < 0:
+                break
+
+        kept_indices.append(next_index)
+        last_kept = next_index
+
+    return np.array(kept_indices)
@@ -0,0 +1,522 @@
+"""Versions of the data preparation stages in gpx_stats operating on array-backed segments."""
+
+import collections
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import gpx_stream_parser
+from array_segment import ArraySegment
+from config import DataPreparationConfig
+from geodesy import cumulative_distances, point_distances, thin_by_distance
+from gpx_stats import (
+    GpxSegmentStats,
+    GpxSegmentStatsBatch,
+    convert_path_array_to_feature,
+    convert_paths_to_features,
+    get_split_indices,
+)
+from moving_data import compute_moving_data, get_moving_data, get_moving_distances
+
+
+def _uphill_downhill(elevation: np.array) -> Tuple[float, float]:
+    "Compute total elevation gain and loss in the same way as gpxpy.geo.calculate_uphill_downhill."
+    elevation = elevation[~np.isnan(elevation)]
+
+    smoothed_elevation = elevation.copy()
+    smoothed_elevation[1:-1] = (
+        elevation[:-2] * 0.3 + elevation[1:-1] * 0.4 + elevation[2:] * 0.3
+    )
+    elevation_diff = np.diff(smoothed_elevation)
+
+    return (
+        float(np.sum(elevation_diff[elevation_diff > 0])),
+        float(-np.sum(elevation_diff[elevation_diff < 0])),
+    )
+
+
+def _duration(time: np.array) -> float:
+    "Compute duration in the same way as GPXTrackSegment.get_duration, returning -1 if it is not available."
+    if len(time) < 2:
+        return 0.0
+
+    first = time[0] if not np.isnan(time[0]) else time[1]
+    last = time[-1] if not np.isnan(time[-1]) else time[-2]
+
+    if np.isnan(first) or np.isnan(last) or last < first:
+        return -1.0
+
+    return float(last - first)
+
+
+class ArraySegmentStats(GpxSegmentStats):
+    "Object collecting statistical properties of an array segment."
+
+    def __init__(
+        self,
+        segment: ArraySegment,
+        num_points_path: int = 25,
+        path: Optional[np.array] = None,
+    ) -> None:
+        """
+        Construct ArraySegmentStats object.
+
+        :param: segment:         Array segment
+        :param: num_points_path: Maximal length of points in path features
+        :param: path:            Path feature of segment if it has been computed before
+        """
+        self.name = "NotAvailable"
+        self.length2d = float(
+            np.sum(point_distances(segment.latitude, segment.longitude))
+        )
+        self.length3d = float(
+            np.sum(
+                point_distances(segment.latitude, segment.longitude, segment.elevation)
+            )
+        )
+        self.duration = _duration(segment.time)
+
+        segment_moving_data = get_moving_data(segment)
+        self.moving_time = segment_moving_data.moving_time
+        self.stopped_time = segment_moving_data.stopped_time
+
+        self.total_uphill, self.total_downhill = _uphill_downhill(segment.elevation)
+
+        self.path = (
+            path
+            if path is not None
+            else convert_path_array_to_feature(segment.to_array(), num_points_path)
+        )
+
+
+class TrackSummary(NamedTuple):
+    "Length in meters, elevation gain and loss in meters and moving time in seconds of a track."
+
+    length_2d: float
+    uphill: float
+    downhill: float
+    moving_time: float
+
+
+def get_track_summary(segments_list: List[ArraySegment]) -> TrackSummary:
+    """
+    Compute summary of a track in the same way as GPXTrack.length_2d, get_uphill_downhill and get_moving_data
+
+    The segments are not modified, so the summary can be computed from the parsed segments before they are smoothed.
+
+    :param: segments_list:  Array segments of the track
+    :return: TrackSummary with the sums over all segments
+    """
+    length_2d = uphill = downhill = moving_time = 0.0
+    for segment in segments_list:
+        length_2d += float(np.sum(point_distances(segment.latitude, segment.longitude)))
+        segment_uphill, segment_downhill = _uphill_downhill(segment.elevation)
+        uphill += segment_uphill
+        downhill += segment_downhill
+        moving_time += get_moving_data(segment).moving_time
+
+    return TrackSummary(length_2d, uphill, downhill, moving_time)
+
+
+def parse_gpx_files_return_segments(file_name_list: List[str]) -> List[ArraySegment]:
+    """
+    Parse GPX files and return list of array segments
+
+    The files are read with the incremental parser from gpx_stream_parser, which does not build gpxpy objects.
+
+    :param: file_name_list: List of GPX files
+    :return: List of ArraySegment objects
+    """
+    segments_list = list(gpx_stream_parser.parse_gpx_files(file_name_list))
+
+    print("Finished reading", len(segments_list), "segments.")
+
+    return segments_list
+
+
+def get_smoothing_kernel(kernel: str, window_size: int) -> np.array:
+    """
+    Return normalized weights of a smoothing kernel
+
+    :param: kernel:         Either "moving_average", "savitzky_golay" (polynomial order 2) or "gaussian"
+    :param: window_size:    Number of weights, should be an odd number
+
+    :return: Array of weights summing to one
+    """
+    half_window_size = (window_size - 1) // 2
+    offsets = np.arange(window_size) - half_window_size
+
+    if kernel == "moving_average":
+        weights = np.ones(window_size)
+    elif kernel == "savitzky_golay":
+        # Weights of the value at the center of a least squares fit of a polynomial to the window
+        polynomial_order = min(2, window_size - 1)
+        vandermonde = offsets[:, None] ** np.arange(polynomial_order + 1)[None, :]
+        weights = np.linalg.pinv(vandermonde)[0]
+    elif kernel == "gaussian":
+        # The window covers two standard deviations on either side
+        sigma = max(half_window_size, 1) / 2
+        weights = np.exp(-0.5 * (offsets / sigma) ** 2)
+    else:
+        raise ValueError(f"Encountered bad smoothing kernel {kernel}.")
+
+    return weights / np.sum(weights)
+
+
+def _convolve_with_missing_values(values: np.array, weights: np.array) -> np.array:
+    """
+    Convolve values with weights, returning results for all complete windows
+
+    Windows with missing values are renormalized over the available values if all weights are positive. Otherwise, as
+    renormalized weights are not meaningful, the value at the center of these windows is kept. Missing values remain
+    missing.
+    """
+    missing = np.isnan(values)
+    if not np.any(missing):
+        return np.convolve(values, weights, mode="valid")
+
+    half_window_size = (len(weights) - 1) // 2
+    center_values = values[half_window_size : len(values) - half_window_size]
+
+    filled_values = np.where(missing, 0.0, values)
+    convolved_values = np.convolve(filled_values, weights, mode="valid")
+    num_missing = np.convolve(
+        missing.astype(float), np.ones(len(weights)), mode="valid"
+    )
+
+    smoothed_values = np.where(num_missing == 0, convolved_values, center_values)
+
+    if np.all(weights > 0):
+        weight_sums = np.convolve((~missing).astype(float), weights, mode="valid")
+        renormalize = (num_missing > 0) & ~np.isnan(center_values)
+        smoothed_values[renormalize] = (
+            convolved_values[renormalize] / weight_sums[renormalize]
+        )
+
+    return smoothed_values
+
+
+def smoothen_coordinates(
+    segments_list: List[ArraySegment],
+    window_size: int = 3,
+    kernel: str = "moving_average",
+) -> None:
+    """
+    Smoothen coordinates of array segments inplace
+
+    Coordinates of segments that are at least as long as the window are convolved with the smoothing kernel and
+    written back to the arrays of the segment. Segments are then replaced by views without the first and last points,
+    which do not have a complete window.
+
+    :param: segments_list:      List of array segments
+    :param: window_size:        Size of moving window for averaging
+    :param: kernel:             Smoothing kernel, see get_smoothing_kernel
+    """
+    assert window_size % 2, "Window size should be an odd number, {} given.".format(
+        window_size
+    )
+    half_window_size = (window_size - 1) // 2
+    weights = get_smoothing_kernel(kernel, window_size)
+
+    for idx in range(len(segments_list)):
+        segment = segments_list[idx]
+
+        if len(segment) >= window_size:
+            interior = slice(half_window_size, len(segment) - half_window_size)
+
+            segment.longitude[interior] = np.convolve(
+                segment.longitude, weights, mode="valid"
+            )
+            segment.latitude[interior] = np.convolve(
+                segment.latitude, weights, mode="valid"
+            )
+            segment.elevation[interior] = _convolve_with_missing_values(
+                segment.elevation, weights
+            )
+
+            segments_list[idx] = segment[interior]
+
+
+def filter_segments(
+    segments_list: List[ArraySegment], min_distance_m: float = 5
+) -> List[ArraySegment]:
+    """
+    Filter points from array segments that are too close to each other
+
+    :param: segments_list:          List of array segments to be processed
+    :param: min_distance_m:         Minimum distance between consecutive track points after filtering
+
+    :return: List of filtered array segments
+    """
+    return [
+        segment[thin_by_distance(segment.latitude, segment.longitude, min_distance_m)]
+        for segment in segments_list
+    ]
+
+
+def split_segments_by_length(
+    segments_list: List[ArraySegment],
+    *,
+    max_length_m: float,
+    split_mode: str = "halving",
+) -> List[ArraySegment]:
+    """
+    Split array segments until all are shorter than max_length_m
+
+    Segments are split in the same order as in gpx_stats.split_segments_by_length, but lengths of parts are looked
+    up from cumulative distances which are computed once per segment.
+
+    :param: segments_list:          List of array segments to be processed
+    :param: max_length_m:           Maximum length of track segment above which the segment should be split
+    :param: split_mode:             Either "halving", "fixed" or "equal"
+
+    :return: List of array segments that are all shorter than max_length_m
+    """
+    segments_cumulative_distances = [
+        cumulative_distances(segment.latitude, segment.longitude)
+        for segment in segments_list
+    ]
+
+    split_segments_list = []
+
+    if split_mode != "halving":
+        for segment, segment_cumulative_distances in zip(
+            segments_list, segments_cumulative_distances
+        ):
+            split_indices = get_split_indices(
+                segment_cumulative_distances, max_length_m, split_mode
+            )
+            split_segments_list.extend(
+                segment[start:stop]
+                for start, stop in zip(split_indices[:-1], split_indices[1:])
+            )
+
+        return split_segments_list
+
+    buffer = collections.deque(
+        (idx, 0, len(segment)) for idx, segment in enumerate(segments_list)
+    )
+
+    while len(buffer) > 0:
+        idx, start, stop = buffer.popleft()
+
+        length = (
+            segments_cumulative_distances[idx][stop - 1]
+            - segments_cumulative_distances[idx][start]
+            if stop - start > 1
+            else 0.0
+        )
+
+        if length < max_length_m:
+            split_segments_list.append(segments_list[idx][start:stop])
+
+        else:
+            middle = start + (stop - start) // 2
+            buffer.append((idx, start, middle))
+            buffer.append((idx, middle, stop))
+
+    return split_segments_list
+
+
+def get_padded_paths(
+    segments_list: List[ArraySegment], num_points_path: int
+) -> Tuple[np.array, np.array]:
+    """
+    Collect coordinates of array segments in a zero-padded array
+
+    :param: segments_list:          List of array segments
+    :param: num_points_path:        Maximum number of points in path features
+
+    :return: Array of shape (len(segments_list), num_points_path, 3) and number of points of each segment
+    """
+    lengths = np.array([len(segment) for segment in segments_list], dtype=int)
+
+    assert np.all(lengths > 0), "Path does not contain any points"
+    assert np.all(
+        lengths <= num_points_path
+    ), f"Path too long, got {np.max(lengths)} and expected less than {num_points_path}"
+
+    # Position of every point in the padded array
+    segment_indices = np.repeat(np.arange(len(segments_list)), lengths)
+    point_indices = np.arange(np.sum(lengths)) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+
+    paths = np.zeros((len(segments_list), num_points_path, 3))
+    for column, name in enumerate(["longitude", "latitude", "elevation"]):
+        paths[segment_indices, point_indices, column] = np.concatenate(
+            [getattr(segment, name) for segment in segments_list]
+        )
+
+    return paths, lengths
+
+
+def extract_stats(
+    segments_list: List[ArraySegment], num_points_path: int = 25
+) -> List[ArraySegmentStats]:
+    """
+    Extract some properties of array segments
+
+    :param: segments_list:          List of array segments to be processed
+    :param: num_points_path:        Maximum number of points in path features
+
+    :return: List of statistics of segments with moving time at least as large as stopped time
+    """
+    if len(segments_list) == 0:
+        return []
+
+    paths = convert_paths_to_features(*get_padded_paths(segments_list, num_points_path))
+
+    segments_stats = []
+    for segment, path in zip(segments_list, paths):
+        segment_stats = ArraySegmentStats(segment, num_points_path, path)
+        if segment_stats.moving_time >= segment_stats.stopped_time:
+            segments_stats.append(segment_stats)
+
+    return segments_stats
+
+
+def _get_durations(time: np.array, lengths: np.array) -> np.array:
+    "Compute durations of concatenated segments in the same way as _duration."
+    durations = np.zeros(len(lengths))
+
+    long_segments = lengths >= 2
+    starts = (np.cumsum(lengths) - lengths)[long_segments]
+    ends = starts + lengths[long_segments] - 1
+
+    first = np.where(np.isnan(time[starts]), time[starts + 1], time[starts])
+    last = np.where(np.isnan(time[ends]), time[ends - 1], time[ends])
+    segment_durations = last - first
+
+    durations[long_segments] = np.where(
+        np.isnan(segment_durations) | (segment_durations < 0), -1.0, segment_durations
+    )
+
+    return durations
+
+
+def _get_uphills_downhills(
+    elevation: np.array, segment_indices: np.array, num_segments: int
+) -> Tuple[np.array, np.array]:
+    "Compute total elevation gain and loss of concatenated segments in the same way as _uphill_downhill."
+    available = ~np.isnan(elevation)
+    elevation = elevation[available]
+    segment_indices = segment_indices[available]
+
+    same_segment = segment_indices[1:] == segment_indices[:-1]
+    interior = np.concatenate([[False], same_segment]) & np.concatenate(
+        [same_segment, [False]]
+    )
+
+    smoothed_elevation = elevation.copy()
+    smoothed_elevation[1:-1] = np.where(
+        interior[1:-1],
+        elevation[:-2] * 0.3 + elevation[1:-1] * 0.4 + elevation[2:] * 0.3,
+        elevation[1:-1],
+    )
+
+    elevation_diff = np.diff(smoothed_elevation)[same_segment]
+    diff_segment_indices = segment_indices[1:][same_segment]
+
+    return (
+        np.bincount(
+            diff_segment_indices,
+            weights=np.maximum(elevation_diff, 0.0),
+            minlength=num_segments,
+        ),
+        np.bincount(
+            diff_segment_indices,
+            weights=np.maximum(-elevation_diff, 0.0),
+            minlength=num_segments,
+        ),
+    )
+
+
+def extract_stats_batch(
+    segments_list: List[ArraySegment], num_points_path: int = 25
+) -> GpxSegmentStatsBatch:
+    """
+    Extract some properties of array segments as columns
+
+    All segments are concatenated, such that every column is computed with a few operations on the concatenated
+    arrays. The results equal those of extract_stats.
+
+    :param: segments_list:          List of array segments to be processed
+    :param: num_points_path:        Maximum number of points in path features
+
+    :return: Statistics of segments with moving time at least as large as stopped time
+    """
+    num_segments = len(segments_list)
+    if num_segments == 0:
+        return GpxSegmentStatsBatch.from_stats_list([], num_points_path)
+
+    lengths = np.array([len(segment) for segment in segments_list], dtype=int)
+    segment_indices = np.repeat(np.arange(num_segments), lengths)
+
+    longitude, latitude, elevation, time = (
+        np.concatenate([getattr(segment, name) for segment in segments_list])
+        for name in ["longitude", "latitude", "elevation", "time"]
+    )
+
+    # Distances between consecutive points of the same segment
+    same_segment = segment_indices[1:] == segment_indices[:-1]
+    distance_segment_indices = segment_indices[1:][same_segment]
+
+    def _get_lengths(distances: np.array) -> np.array:
+        return np.bincount(
+            distance_segment_indices,
+            weights=distances[same_segment],
+            minlength=num_segments,
+        )
+
+    moving_data = compute_moving_data(
+        time,
+        get_moving_distances(latitude, longitude, elevation),
+        np.where(same_segment, segment_indices[1:], -1),
+        num_segments,
+    )
+
+    total_uphill, total_downhill = _get_uphills_downhills(
+        elevation, segment_indices, num_segments
+    )
+
+    batch = GpxSegmentStatsBatch(
+        {
+            "Length2d": _get_lengths(point_distances(latitude, longitude)),
+            "Length3d": _get_lengths(point_distances(latitude, longitude, elevation)),
+            "Duration": _get_durations(time, lengths),
+            "MovingTime": moving_data.moving_time,
+            "StoppedTime": moving_data.stopped_time,
+            "TotalUphill": total_uphill,
+            "TotalDownhill": total_downhill,
+            "Path": convert_paths_to_features(
+                *get_padded_paths(segments_list, num_points_path)
+            ),
+        }
+    )
+
+    return batch.select(batch["MovingTime"] >= batch["StoppedTime"])
+
+
+def filter_bad_segments(
+    segments_list: List[ArraySegment],
+    data_preparation_config: DataPreparationConfig,
+) -> List[ArraySegment]:
+    """
+    Filter segments with obviously insensible data
+
+    Args:
+        segments_list: List of array segments
+        data_preparation_config: Config for data preparation
+
+    Returns:
+        Filtered list of array segments
+    """
+    max_elevation_diff = data_preparation_config.max_elevation_diff_m
+
+    def _elevation_predicate(segment: ArraySegment) -> bool:
+        uphill, downhill = _uphill_downhill(segment.elevation)
+
+        return uphill < max_elevation_diff and downhill < max_elevation_diff
+
+    return list(filter(_elevation_predicate, segments_list))
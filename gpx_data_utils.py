@@ -1,7 +1,14 @@
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
+
 import numpy as np
-import pandas as pd
 from gpxpy.gpx import GPXTrackPoint, GPXTrackSegment
 
+from array_segment import ArraySegment
+
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 def gpx_point_to_array(point: GPXTrackPoint) -> np.array:
     "Convert a GPX point to an array."
@@ -43,19 +50,21 @@ def gpx_segment_from_array(segment_data: np.array) -> GPXTrackSegment:
     return GPXTrackSegment(points)
 
 
-def gpx_segment_to_data_frame(segment: GPXTrackSegment) -> pd.DataFrame:
+def gpx_segment_to_data_frame(segment: GPXTrackSegment) -> "pd.DataFrame":
     """
     Create pandas dataframe from GPX track segment
 
     :param: segment: GPX track segment
     :return: Pandas dataframe
     """
+    import pandas as pd
+
     columns = ["longitude", "latitude", "elevation"]
 
     return pd.DataFrame(gpx_segment_to_array(segment), columns=columns)
 
 
-def gpx_segment_from_data_frame(df: pd.DataFrame) -> GPXTrackSegment:
+def gpx_segment_from_data_frame(df: "pd.DataFrame") -> GPXTrackSegment:
     """
     Create GPX track segment from data in Pandas DataFrame
 
@@ -69,3 +78,68 @@ def gpx_segment_from_data_frame(df: pd.DataFrame) -> GPXTrackSegment:
     ), "Wrong columns or wrong order of columns in dataframe"
 
     return gpx_segment_from_array(df.values)
+
+
+def datetime_to_timestamp(time: Optional[datetime]) -> float:
+    "Convert a datetime to seconds since the epoch, interpreting naive datetimes as UTC."
+    if time is None:
+        return np.nan
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return time.timestamp()
+
+
+def datetime_from_timestamp(timestamp: float) -> Optional[datetime]:
+    "Convert seconds since the epoch to a UTC datetime."
+    if np.isnan(timestamp):
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def gpx_segment_to_array_segment(segment: GPXTrackSegment) -> ArraySegment:
+    """
+    Convert GPX track segment into an array segment
+
+    :param: segment: GPX track segment
+    :return: Array segment with missing elevations and timestamps as NaN
+    """
+    points = segment.points
+    return ArraySegment(
+        longitude=np.fromiter(
+            (point.longitude for point in points), float, len(points)
+        ),
+        latitude=np.fromiter((point.latitude for point in points), float, len(points)),
+        elevation=np.fromiter(
+            (
+                np.nan if point.elevation is None else point.elevation
+                for point in points
+            ),
+            float,
+            len(points),
+        ),
+        time=np.fromiter(
+            (datetime_to_timestamp(point.time) for point in points), float, len(points)
+        ),
+    )
+
+
+def gpx_segment_from_array_segment(segment: ArraySegment) -> GPXTrackSegment:
+    """
+    Create GPX track segment from array segment
+
+    :param: segment: Array segment
+    :return: GPX track segment
+    """
+    points = [
+        GPXTrackPoint(
+            longitude=float(longitude),
+            latitude=float(latitude),
+            elevation=None if np.isnan(elevation) else float(elevation),
+            time=datetime_from_timestamp(time),
+        )
+        for longitude, latitude, elevation, time in zip(
+            segment.longitude, segment.latitude, segment.elevation, segment.time
+        )
+    ]
+
+    return GPXTrackSegment(points)
@@ -0,0 +1,309 @@
+"""Discovery of GPX files in directory trees with a persistent manifest for fast rescans."""
+
+import fnmatch
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from dataclasses_json import dataclass_json
+
+from utils import get_path_hash, get_pseudo_probability_from_hash
+
+# Hidden directories are skipped, as by glob.iglob with recursive=True
+DEFAULT_EXCLUDE_PATTERNS: List[str] = [".*"]
+
+MANIFEST_FORMAT_VERSION: int = 1
+
+
+def get_split(path_hash: str, train_fraction: float) -> str:
+    "Return dataset split, 'train' or 'test', of a file with the given path hash."
+    return (
+        "train"
+        if get_pseudo_probability_from_hash(path_hash) < train_fraction
+        else "test"
+    )
+
+
+@dataclass_json
+@dataclass
+class GpxFileEntry:
+    "Manifest entry of a GPX file."
+
+    path: str
+    size: int
+    mtime_ns: int
+    path_hash: str
+    split: str
+
+
+@dataclass_json
+@dataclass
+class DirectoryEntry:
+    "Manifest entry of a directory, with the names of its subdirectories and GPX files."
+
+    mtime_ns: int
+    subdirectories: List[str] = field(default_factory=list)
+    gpx_files: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ScanStats:
+    "Counters of a directory scan."
+
+    scanned_directories: int = 0
+    reused_directories: int = 0
+    stated_files: int = 0
+
+
+class GpxFileManifest(object):
+    """
+    Manifest of GPX files in a directory tree.
+
+    Directories are listed with os.scandir. The listing of a directory is stored with its modification time, which
+    changes whenever entries are added, removed or renamed. On rescans, directories with unchanged modification time
+    are not listed again and the stored entries of their files are reused, so only one stat call per directory is
+    needed. Editing a file in place does not change the modification time of its directory, so the stored size and
+    modification time of such files are stale until their directory changes. They are informational only, since the
+    path hash and split only depend on the path.
+
+    Symbolic links to directories are followed, as by glob.iglob with recursive=True, except for links to a directory
+    that is already being searched, which would lead into a cycle.
+    """
+
+    def __init__(
+        self,
+        train_fraction: float = 0.8,
+        exclude_patterns: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Construct empty GpxFileManifest object.
+
+        :param: train_fraction:     Fraction of files assigned to the training split
+        :param: exclude_patterns:   Patterns of names of directories that are not searched, see fnmatch
+        """
+        self.train_fraction = train_fraction
+        self.exclude_patterns = (
+            DEFAULT_EXCLUDE_PATTERNS if exclude_patterns is None else exclude_patterns
+        )
+        self.directories: Dict[str, DirectoryEntry] = {}
+        self.files: Dict[str, GpxFileEntry] = {}
+
+    def _is_excluded(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude_patterns)
+
+    def _make_file_entry(self, path: str, stat_result: os.stat_result) -> GpxFileEntry:
+        path_hash = get_path_hash(path)
+        return GpxFileEntry(
+            path=path,
+            size=stat_result.st_size,
+            mtime_ns=stat_result.st_mtime_ns,
+            path_hash=path_hash,
+            split=get_split(path_hash, self.train_fraction),
+        )
+
+    def update(self, folder: str) -> ScanStats:
+        """
+        Scan directory tree and update the manifest.
+
+        Entries of directories and files that are no longer reachable from folder are removed.
+
+        :param: folder:     Root folder of the directory tree
+
+        :return: Counters of scanned and reused directories
+        """
+        stats = ScanStats()
+        directories: Dict[str, DirectoryEntry] = {}
+        files: Dict[str, GpxFileEntry] = {}
+
+        # Directories are identified by device and inode, so that cycles of symbolic links can be detected
+        stack: List[Tuple[str, FrozenSet[Tuple[int, int]]]] = [(folder, frozenset())]
+        while stack:
+            directory, ancestors = stack.pop()
+            try:
+                stat_result = os.stat(directory)
+            except OSError:
+                continue
+
+            directory_id = (stat_result.st_dev, stat_result.st_ino)
+            if directory_id in ancestors:
+                continue
+            ancestors = ancestors | {directory_id}
+            mtime_ns = stat_result.st_mtime_ns
+
+            previous_entry = self.directories.get(directory)
+            if previous_entry is not None and previous_entry.mtime_ns == mtime_ns:
+                directory_entry = previous_entry
+                stats.reused_directories += 1
+
+                for name in directory_entry.gpx_files:
+                    path = os.path.join(directory, name)
+                    if path in self.files:
+                        files[path] = self.files[path]
+                    else:
+                        try:
+                            stat_result = os.stat(path)
+                        except OSError:
+                            continue
+                        stats.stated_files += 1
+                        files[path] = self._make_file_entry(path, stat_result)
+            else:
+                directory_entry = DirectoryEntry(mtime_ns=mtime_ns)
+                stats.scanned_directories += 1
+
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if entry.is_dir():
+                                if not self._is_excluded(entry.name):
+                                    directory_entry.subdirectories.append(entry.name)
+                            elif (
+                                entry.name.endswith(".gpx")
+                                and not entry.name.startswith(".")
+                                and entry.is_file()
+                            ):
+                                directory_entry.gpx_files.append(entry.name)
+                                stats.stated_files += 1
+                                files[entry.path] = self._make_file_entry(
+                                    entry.path, entry.stat()
+                                )
+                except OSError:
+                    continue
+
+                directory_entry.subdirectories.sort()
+                directory_entry.gpx_files.sort()
+
+            directories[directory] = directory_entry
+            stack.extend(
+                (os.path.join(directory, name), ancestors)
+                for name in reversed(directory_entry.subdirectories)
+            )
+
+        self.directories = directories
+        self.files = files
+
+        return stats
+
+    def select(
+        self, key_for_filtering: str = "", split: Optional[str] = None
+    ) -> List[GpxFileEntry]:
+        """
+        Return entries of files whose path contains a key, sorted by path.
+
+        :param: key_for_filtering:  String that should be contained in paths
+        :param: split:              Dataset split, 'train' or 'test', all files if None
+        """
+        return [
+            entry
+            for path, entry in sorted(self.files.items())
+            if key_for_filtering in path and (split is None or entry.split == split)
+        ]
+
+    def save(self, file_name: str) -> None:
+        """
+        Write manifest to JSON file, replacing an existing file atomically.
+
+        :param: file_name:  Name of manifest file
+        """
+        content = {
+            "version": MANIFEST_FORMAT_VERSION,
+            "train_fraction": self.train_fraction,
+            "exclude_patterns": self.exclude_patterns,
+            "directories": {
+                path: entry.to_dict() for path, entry in self.directories.items()
+            },
+            "files": [entry.to_dict() for entry in self.files.values()],
+        }
+
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            suffix=".tmp", dir=os.path.dirname(os.path.abspath(file_name))
+        )
+        try:
+            with os.fdopen(file_descriptor, "w") as manifest_file:
+                json.dump(content, manifest_file)
+            os.replace(temporary_path, file_name)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    @classmethod
+    def load(
+        cls,
+        file_name: str,
+        train_fraction: float = 0.8,
+        exclude_patterns: Optional[List[str]] = None,
+    ) -> "GpxFileManifest":
+        """
+        Read manifest from JSON file.
+
+        An empty manifest is returned if the file does not exist or was written with another format version or
+        other exclude patterns. Splits are recomputed if the train fraction changed.
+
+        :param: file_name:          Name of manifest file
+        :param: train_fraction:     Fraction of files assigned to the training split
+        :param: exclude_patterns:   Patterns of names of directories that are not searched, see fnmatch
+        """
+        manifest = cls(train_fraction, exclude_patterns)
+
+        try:
+            with open(file_name, "r") as manifest_file:
+                content = json.load(manifest_file)
+        except (OSError, ValueError):
+            return manifest
+
+        if (
+            content.get("version") != MANIFEST_FORMAT_VERSION
+            or content.get("exclude_patterns") != manifest.exclude_patterns
+        ):
+            return manifest
+
+        manifest.directories = {
+            path: DirectoryEntry.from_dict(entry)
+            for path, entry in content["directories"].items()
+        }
+        manifest.files = {
+            entry["path"]: GpxFileEntry.from_dict(entry) for entry in content["files"]
+        }
+
+        if content.get("train_fraction") != train_fraction:
+            for entry in manifest.files.values():
+                entry.split = get_split(entry.path_hash, train_fraction)
+
+        return manifest
+
+
+def discover_gpx_files(
+    folder: str,
+    key_for_filtering: str = "",
+    manifest_file: Optional[str] = None,
+    train_fraction: float = 0.8,
+    exclude_patterns: Optional[List[str]] = None,
+) -> List[GpxFileEntry]:
+    """
+    Find GPX files in folder recursively, reusing and updating a manifest file if given.
+
+    :param: folder:             Folder in which to search for GPX files recursively
+    :param: key_for_filtering:  String that should be contained in paths
+    :param: manifest_file:      Name of manifest file, no manifest is stored if None
+    :param: train_fraction:     Fraction of files assigned to the training split
+    :param: exclude_patterns:   Patterns of names of directories that are not searched, hidden directories if None
+
+    :return: List of file entries sorted by path
+    """
+    if manifest_file is None:
+        manifest = GpxFileManifest(train_fraction, exclude_patterns)
+    else:
+        manifest = GpxFileManifest.load(manifest_file, train_fraction, exclude_patterns)
+
+    stats = manifest.update(folder)
+    print(
+        "Scanned {} directories, reused {} directories from manifest.".format(
+            stats.scanned_directories, stats.reused_directories
+        )
+    )
+
+    if manifest_file is not None:
+        manifest.save(manifest_file)
+
+    return manifest.select(key_for_filtering)
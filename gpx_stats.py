@@ -7,6 +7,7 @@ from gpxpy.gpx import GPX, GPXTrackSegment
 import numpy as np
 
 from config import DataPreparationConfig
+from geodesy import cumulative_distances, thin_by_distance
 from gpx_data_utils import gpx_segment_to_array
 
 
@@ -34,32 +35,68 @@ def convert_path_to_feature(segment: GPXTrackSegment, num_points_path: int) -> n
 
     :return: Rotated and normalized GPX track segment
     """
+    assert len(segment.points) > 0, "Path does not contain any points"
 
-    def _get_rotation_matrix(phi):
-        cos_phi, sin_phi = np.cos(phi), np.sin(phi)
-        return np.array([np.array([cos_phi, -sin_phi]), np.array([sin_phi, cos_phi])])
+    return convert_path_array_to_feature(gpx_segment_to_array(segment), num_points_path)
 
-    data = np.zeros((num_points_path, 3))
 
-    assert len(segment.points) > 0, "Path does not contain any points"
+def convert_path_array_to_feature(
+    segment_data: np.array, num_points_path: int
+) -> np.array:
+    """
+    Convert track data with longitudes, latitudes and elevations as columns to feature.
+
+    :param: segment_data:    Track data as array of shape (num_points, 3)
+    :param: num_points_path: Maximal length of track points in path feature
+
+    :return: Rotated and normalized track data
+    """
+    num_points = len(segment_data)
+    assert num_points > 0, "Path does not contain any points"
     assert (
-        len(segment.points) <= num_points_path
-    ), f"Path too long, got {len(segment.points)} and expected less than {num_points_path}"
+        num_points <= num_points_path
+    ), f"Path too long, got {num_points} and expected less than {num_points_path}"
 
-    data[: len(segment.points)] = gpx_segment_to_array(segment)
+    paths = np.zeros((1, num_points_path, 3))
+    paths[0, :num_points] = segment_data
 
-    # Normalize coordinates
-    data[: len(segment.points)] -= data[0]
+    return convert_paths_to_features(paths, np.array([num_points]))[0]
+
+
+def convert_paths_to_features(paths: np.array, lengths: np.array) -> np.array:
+    """
+    Convert padded track data of many segments to features at once.
+
+    Each path is shifted to start at the origin and rotated such that the center of gravity of its points lies on the
+    x-axis. Entries beyond the length of a path are set to zero.
+
+    :param: paths:   Track data as array of shape (num_segments, num_points_path, 3)
+    :param: lengths: Number of track points of each segment
 
-    # Compute center of gravity of path
-    center = np.sum(data, axis=0) / len(segment.points)
-    phi = np.arctan2(center[1], center[0])
-    m = _get_rotation_matrix(
-        -phi
-    )  # Return points with angle that maps center to x-axis
+    :return: Rotated and normalized track data of shape (num_segments, num_points_path, 3)
+    """
+    num_points_path = paths.shape[1]
+
+    assert np.all(lengths > 0), "Path does not contain any points"
+    assert np.all(
+        lengths <= num_points_path
+    ), f"Path too long, got {np.max(lengths)} and expected less than {num_points_path}"
 
-    for idx in range(len(segment.points)):
-        data[idx][0:2] = np.dot(m, data[idx][0:2])
+    # Normalize coordinates
+    mask = np.arange(num_points_path)[None, :] < lengths[:, None]
+    data = np.where(mask[:, :, None], paths - paths[:, :1], 0.0)
+
+    # Compute center of gravity of paths
+    center = np.sum(data, axis=1) / lengths[:, None]
+    phi = np.arctan2(center[:, 1], center[:, 0])
+
+    # Rotate points with angle that maps center to x-axis
+    cos_phi, sin_phi = np.cos(-phi), np.sin(-phi)
+    rotation_matrices = np.stack(
+        [np.stack([cos_phi, -sin_phi], axis=-1), np.stack([sin_phi, cos_phi], axis=-1)],
+        axis=-2,
+    )
+    data[:, :, :2] = np.einsum("nij,npj->npi", rotation_matrices, data[:, :, :2])
 
     return data
 
@@ -145,6 +182,78 @@ class GpxSegmentStats(object):
         ]
 
 
+class GpxSegmentStatsBatch(object):
+    "Statistical properties of many GPX segments stored as one array per data entry."
+
+    def __init__(self, columns: Dict[str, np.array]) -> None:
+        """
+        Construct GpxSegmentStatsBatch object.
+
+        :param: columns: Dictionary with an array for every name in GpxSegmentStats.get_header(), the array for "Path"
+                         has shape (num_segments, num_points_path, 3)
+        """
+        assert set(columns.keys()) == set(
+            self.get_header()
+        ), "Columns do not match header"
+        assert (
+            len(set(len(column) for column in columns.values())) == 1
+        ), "Columns do not have the same length"
+
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns["Length2d"])
+
+    def __getitem__(self, name: str) -> np.array:
+        "Return column without copying."
+        return self.columns[name]
+
+    def select(self, indices: np.array) -> "GpxSegmentStatsBatch":
+        "Return statistics of segments selected by a boolean mask or indices."
+        return GpxSegmentStatsBatch(
+            {name: column[indices] for name, column in self.columns.items()}
+        )
+
+    @classmethod
+    def from_stats_list(
+        cls, stats_list: List[GpxSegmentStats], num_points_path: int
+    ) -> "GpxSegmentStatsBatch":
+        """
+        Collect data of GpxSegmentStats objects.
+
+        :param: stats_list:      List of objects containing statistical data on GPX track segments
+        :param: num_points_path: Maximum number of points in path feature
+        """
+        entries = [stats.to_dict() for stats in stats_list]
+        columns = {
+            name: np.array([entry[name] for entry in entries], dtype=float)
+            for name in cls.get_header()
+            if name != "Path"
+        }
+        columns["Path"] = np.zeros((len(entries), num_points_path, 3))
+        for i, entry in enumerate(entries):
+            columns["Path"][i] = entry["Path"]
+
+        return cls(columns)
+
+    @classmethod
+    def concatenate(
+        cls, batches: List["GpxSegmentStatsBatch"]
+    ) -> "GpxSegmentStatsBatch":
+        "Concatenate statistics of several batches."
+        return cls(
+            {
+                name: np.concatenate([batch[name] for batch in batches])
+                for name in cls.get_header()
+            }
+        )
+
+    @classmethod
+    def get_header(cls):
+        "Return names of data entries."
+        return GpxSegmentStats.get_header()
+
+
 def parse_gpx_files(file_name_list: List[str]) -> Generator[GPX, None, None]:
     """
     Parse GPX files and yield their content
@@ -248,32 +357,90 @@ def filter_segments(
     gpx_filtered_segments_list = []
 
     for segment in gpx_segments_list:
-        points = [segment.points[0]]
-        last_kept = segment.points[0]
+        latitude = np.array([point.latitude for point in segment.points])
+        longitude = np.array([point.longitude for point in segment.points])
 
-        for point in segment.points[1:]:
-            if GPXTrackSegment([last_kept, point]).length_2d() > min_distance_m:
-                points.append(point)
-                last_kept = point
+        kept_indices = thin_by_distance(latitude, longitude, min_distance_m)
 
-        gpx_filtered_segments_list.append(GPXTrackSegment(points))
+        gpx_filtered_segments_list.append(
+            GPXTrackSegment([segment.points[idx] for idx in kept_indices])
+        )
 
     return gpx_filtered_segments_list
 
 
+def get_split_indices(
+    cumulative_distances: np.array, max_length_m: float, split_mode: str
+) -> np.array:
+    """
+    Compute indices at which a track segment is split into parts shorter than max_length_m
+
+    With split_mode "fixed", parts are cut at multiples of max_length_m along the segment. With split_mode "equal",
+    the segment is cut into the smallest number of parts of equal length that are shorter than max_length_m. All
+    split points are found with a single search in the cumulative distances.
+
+    :param: cumulative_distances:   Distances of track points along the segment from its first point
+    :param: max_length_m:           Maximum length of parts
+    :param: split_mode:             Either "fixed" or "equal"
+
+    :return: Sorted indices of first points of parts, followed by the number of points
+    """
+    num_points = len(cumulative_distances)
+    total_length = cumulative_distances[-1] if num_points > 0 else 0.0
+    num_parts = int(total_length // max_length_m) + 1
+
+    if split_mode == "fixed":
+        part_length = max_length_m
+    elif split_mode == "equal":
+        part_length = total_length / num_parts
+    else:
+        raise ValueError(f"Encountered bad split mode {split_mode}.")
+
+    split_indices = np.searchsorted(
+        cumulative_distances, np.arange(1, num_parts) * part_length, side="left"
+    )
+
+    # Parts without any points result in repeated indices
+    return np.unique(np.concatenate([[0], split_indices, [num_points]]))
+
+
 def split_segments_by_length(
-    gpx_segments_list: List[GPXTrackSegment], *, max_length_m: float
+    gpx_segments_list: List[GPXTrackSegment],
+    *,
+    max_length_m: float,
+    split_mode: str = "halving",
 ) -> List[GPXTrackSegment]:
     """
     Split GPX track segments until all are shorter than max_length_m
 
+    With split_mode "halving", segments are split in halves repeatedly. With split_mode "fixed" or "equal", the
+    cumulative distance of each segment is computed once and the segment is split in one pass, see get_split_indices.
+
     :param: gpx_segments_list:      List of GPX track segments to be processed
     :param: max_length_m:           Maximum length of track segment above which the segment should be split
+    :param: split_mode:             Either "halving", "fixed" or "equal"
 
     :return: List of GPX track segments that are all shorter than max_length_m
     """
     gpx_split_segments_list = []
 
+    if split_mode != "halving":
+        for segment in gpx_segments_list:
+            split_indices = get_split_indices(
+                cumulative_distances(
+                    np.array([point.latitude for point in segment.points]),
+                    np.array([point.longitude for point in segment.points]),
+                ),
+                max_length_m,
+                split_mode,
+            )
+            gpx_split_segments_list.extend(
+                GPXTrackSegment(segment.points[start:stop])
+                for start, stop in zip(split_indices[:-1], split_indices[1:])
+            )
+
+        return gpx_split_segments_list
+
     buffer = collections.deque(gpx_segments_list)
 
     while len(buffer) > 0:
@@ -0,0 +1,168 @@
+"""Incremental parser reading track segments of GPX files directly into arrays."""
+
+import re
+from typing import BinaryIO, Generator, List, Optional, Union
+from xml.etree import ElementTree
+
+import numpy as np
+from gpxpy.gpxfield import parse_time
+
+from array_segment import ArraySegment
+from gpx_data_utils import datetime_to_timestamp
+
+_TIME_ZONE_OFFSET = re.compile(r"T.*[+-]\d{2}:?\d{2}$")
+
+
+def _parse_float(text: Optional[str]) -> float:
+    "Convert text to float, returning NaN if it is missing or invalid."
+    try:
+        return float(text) if text else np.nan
+    except ValueError:
+        return np.nan
+
+
+def parse_timestamps(time_strings: List[Optional[str]]) -> np.array:
+    """
+    Convert GPX timestamps to seconds since the epoch.
+
+    Timestamps in UTC are converted at once as int64 epoch microseconds. Only if some timestamps contain other time zone
+    information, they are parsed one by one with gpxpy. Timestamps without time zone are interpreted as UTC.
+
+    :param: time_strings: List of timestamps in ISO 8601 format, None for missing timestamps
+    :return: Array with seconds since the epoch, NaN for missing timestamps
+    """
+    timestamps = np.full(len(time_strings), np.nan)
+
+    available = [idx for idx, time_string in enumerate(time_strings) if time_string]
+    if len(available) == 0:
+        return timestamps
+
+    stripped_strings = [time_strings[idx].strip() for idx in available]
+    utc_strings = [
+        time_string[:-1] if time_string.endswith("Z") else time_string
+        for time_string in stripped_strings
+    ]
+
+    try:
+        if any(_TIME_ZONE_OFFSET.search(time_string) for time_string in utc_strings):
+            raise ValueError("Timestamps contain time zone offsets")
+
+        epoch_microseconds = np.array(utc_strings, dtype="datetime64[us]").astype(
+            np.int64
+        )
+        timestamps[available] = epoch_microseconds / 1e6
+    except ValueError:
+        timestamps[available] = [
+            datetime_to_timestamp(parse_time(time_string))
+            for time_string in stripped_strings
+        ]
+
+    return timestamps
+
+
+def _parse_gpx_elements(
+    file_name: Union[str, BinaryIO],
+) -> Generator[Optional[ArraySegment], None, None]:
+    """
+    Parse GPX file incrementally, yielding an array segment at the end of every track segment and None at the end of
+    every track.
+
+    :param: file_name: Name of GPX file or binary file object
+    """
+    longitudes: List[float] = []
+    latitudes: List[float] = []
+    elevations: List[float] = []
+    time_strings: List[Optional[str]] = []
+
+    root = None
+    current_segment = None
+
+    for event, element in ElementTree.iterparse(file_name, events=("start", "end")):
+        # Tags are compared by their ending to ignore namespaces
+        tag = element.tag
+
+        if event == "start":
+            if root is None:
+                root = element
+            elif tag.endswith("trkseg"):
+                current_segment = element
+            continue
+
+        if tag.endswith("trkpt") and current_segment is not None:
+            if "lat" not in element.attrib or "lon" not in element.attrib:
+                raise ValueError("Track point without latitude or longitude")
+            latitudes.append(float(element.attrib["lat"]))
+            longitudes.append(float(element.attrib["lon"]))
+
+            elevation_text, time_text = None, None
+            for child in element:
+                if child.tag.endswith("ele"):
+                    elevation_text = child.text
+                elif child.tag.endswith("time"):
+                    time_text = child.text
+            elevations.append(_parse_float(elevation_text))
+            time_strings.append(time_text)
+
+            current_segment.remove(element)
+
+        elif tag.endswith("trkseg"):
+            yield ArraySegment(
+                longitude=np.array(longitudes, dtype=float),
+                latitude=np.array(latitudes, dtype=float),
+                elevation=np.array(elevations, dtype=float),
+                time=parse_timestamps(time_strings),
+            )
+
+            longitudes, latitudes, elevations, time_strings = [], [], [], []
+            current_segment = None
+
+        elif root is not None and tag.endswith(("trk", "rte", "wpt", "metadata")):
+            root.clear()
+            if tag.endswith("trk"):
+                yield None
+
+
+def parse_gpx_file(
+    file_name: Union[str, BinaryIO],
+) -> Generator[ArraySegment, None, None]:
+    """
+    Parse track segments of GPX file and yield them as array segments
+
+    The file is parsed incrementally and elements are discarded after they have been read, such that the memory needed
+    does not grow with the size of the file beyond the data of the current segment.
+
+    :param: file_name: Name of GPX file or binary file object
+    """
+    for segment in _parse_gpx_elements(file_name):
+        if segment is not None:
+            yield segment
+
+
+def parse_gpx_file_tracks(file_name: Union[str, BinaryIO]) -> List[List[ArraySegment]]:
+    """
+    Parse GPX file and return the array segments of each track, including tracks without segments
+
+    :param: file_name: Name of GPX file or binary file object
+    :return: List with a list of array segments for every track
+    """
+    tracks: List[List[ArraySegment]] = []
+    segments_list: List[ArraySegment] = []
+
+    for segment in _parse_gpx_elements(file_name):
+        if segment is None:
+            tracks.append(segments_list)
+            segments_list = []
+        else:
+            segments_list.append(segment)
+
+    return tracks
+
+
+def parse_gpx_files(file_name_list: List[str]) -> Generator[ArraySegment, None, None]:
+    """
+    Parse GPX files and yield their track segments as array segments
+
+    :param: file_name_list:     List of GPX file names
+    """
+    for file_name in file_name_list:
+        yield from parse_gpx_file(file_name)
@@ -0,0 +1,232 @@
+"""Streaming writer for statistics of GPX track segments in HDF5 files."""
+
+import os
+import tempfile
+from typing import Iterable, List, Optional
+
+import h5py
+import numpy as np
+
+from gpx_stats import GpxSegmentStatsBatch
+
+COMPRESSION_TYPES = [None, "gzip", "lzf"]
+
+# Size of the default chunk cache of HDF5, larger chunks are read and decompressed again on every access
+MAX_CHUNK_BYTES: int = 1024 * 1024
+
+
+def get_chunk_rows(chunk_rows: int, row_bytes: int) -> int:
+    """
+    Return number of rows per chunk of a dataset, so that chunks do not exceed MAX_CHUNK_BYTES.
+
+    The result divides chunk_rows, so writes of multiples of chunk_rows rows always cover whole chunks.
+
+    :param: chunk_rows: Number of rows per chunk of datasets with small rows
+    :param: row_bytes:  Size of a row of the dataset in bytes
+    """
+    max_rows = max(1, MAX_CHUNK_BYTES // row_bytes)
+    if chunk_rows <= max_rows:
+        return chunk_rows
+
+    return max(rows for rows in range(1, max_rows + 1) if chunk_rows % rows == 0)
+
+
+class GpxStatsHdf5Writer(object):
+    """
+    Write batches of segment statistics to resizable, chunked HDF5 datasets.
+
+    Batches are buffered until a full chunk of rows is available and rows are written in multiples of chunk_rows, so
+    the HDF5 library only sees few large writes that cover whole chunks, and the memory needed does not depend on the
+    total number of segments. Chunks of paths are limited to MAX_CHUNK_BYTES and divide chunk_rows.
+
+    Rows are written to a temporary file next to the output file, which replaces the output file when the writer is
+    closed. If the writer is left because of an exception, the temporary file is removed and an existing output file
+    is kept, so there are never truncated output files that look complete.
+
+    With contiguous layout, the rows are first written to a temporary chunked file, since contiguous datasets cannot
+    be resized, and copied to uncompressed contiguous datasets when the writer is closed. dataset_loader.SegmentDataset
+    memory-maps such datasets.
+    """
+
+    def __init__(
+        self,
+        file_name: str,
+        num_points_path: int,
+        compression: Optional[str] = None,
+        compression_level: Optional[int] = None,
+        shuffle: bool = False,
+        dtype: np.dtype = np.float64,
+        chunk_rows: int = 4096,
+        contiguous: bool = False,
+    ) -> None:
+        """
+        Construct GpxStatsHdf5Writer object and create the datasets.
+
+        :param: file_name:          Name of HDF5 file, replaced when the writer is closed if it exists
+        :param: num_points_path:    Maximum number of points in path feature
+        :param: compression:        Compression filter, None, "gzip" or "lzf"
+        :param: compression_level:  Level of gzip compression between 0 and 9, None for the default level
+        :param: shuffle:            Whether to apply the byte shuffle filter, which improves compression of floats
+        :param: dtype:              Floating point type in which data is stored, for example np.float32
+        :param: chunk_rows:         Number of segments per HDF5 chunk of scalar features and per write
+        :param: contiguous:         Whether to store uncompressed contiguous datasets, which can be memory-mapped
+        """
+        if compression not in COMPRESSION_TYPES:
+            raise ValueError(f"Encountered bad compression type {compression}.")
+        if compression != "gzip" and compression_level is not None:
+            raise ValueError("Compression level is only supported for gzip.")
+        if contiguous and (compression is not None or shuffle):
+            raise ValueError("Contiguous datasets cannot be compressed.")
+
+        self.num_points_path = num_points_path
+        self.chunk_rows = chunk_rows
+        self.num_rows = 0
+
+        self._buffer: List[GpxSegmentStatsBatch] = []
+        self._buffer_rows = 0
+
+        self._file_name = file_name
+        self._contiguous = contiguous
+        self._temporary_file_name = self._create_temporary_file()
+
+        self._file = h5py.File(self._temporary_file_name, "w")
+        self._datasets = {}
+        for name in GpxSegmentStatsBatch.get_header():
+            row_shape = (num_points_path, 3) if name == "Path" else ()
+            row_bytes = int(np.prod(row_shape, dtype=int)) * np.dtype(dtype).itemsize
+            self._datasets[name] = self._file.create_dataset(
+                name,
+                shape=(0,) + row_shape,
+                maxshape=(None,) + row_shape,
+                chunks=(get_chunk_rows(chunk_rows, row_bytes),) + row_shape,
+                dtype=dtype,
+                compression=compression,
+                compression_opts=compression_level,
+                shuffle=shuffle,
+            )
+
+    def __enter__(self) -> "GpxStatsHdf5Writer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def _create_temporary_file(self) -> str:
+        file_descriptor, temporary_file_name = tempfile.mkstemp(
+            suffix=".tmp", dir=os.path.dirname(os.path.abspath(self._file_name))
+        )
+        os.close(file_descriptor)
+        return temporary_file_name
+
+    def write(self, batch: GpxSegmentStatsBatch) -> None:
+        """
+        Append statistics of segments.
+
+        :param: batch: Statistics of segments, with paths of num_points_path points
+        """
+        assert batch["Path"].shape[1:] == (
+            self.num_points_path,
+            3,
+        ), "Path features do not have the expected shape"
+
+        self._buffer.append(batch)
+        self._buffer_rows += len(batch)
+
+        if self._buffer_rows >= self.chunk_rows:
+            self._write_buffer(self._buffer_rows - self._buffer_rows % self.chunk_rows)
+
+    def flush(self) -> None:
+        "Write all buffered statistics to the file, including an incomplete chunk."
+        self._write_buffer(self._buffer_rows)
+
+    def _write_buffer(self, num_rows: int) -> None:
+        "Write the first num_rows buffered rows and keep the others buffered."
+        if num_rows == 0:
+            return
+
+        batch = (
+            self._buffer[0]
+            if len(self._buffer) == 1
+            else GpxSegmentStatsBatch.concatenate(self._buffer)
+        )
+        start, stop = self.num_rows, self.num_rows + num_rows
+
+        for name, dataset in self._datasets.items():
+            dataset.resize(stop, axis=0)
+            dataset[start:stop] = batch[name][:num_rows]
+
+        self.num_rows = stop
+        self._buffer = (
+            [] if num_rows == len(batch) else [batch.select(slice(num_rows, None))]
+        )
+        self._buffer_rows = len(batch) - num_rows
+
+    def _copy_to_contiguous_datasets(self, file_name: str) -> None:
+        "Copy the datasets of the temporary file to contiguous datasets of another file, chunk by chunk."
+        with h5py.File(file_name, "w") as output_file:
+            for name, dataset in self._datasets.items():
+                output_dataset = output_file.create_dataset(
+                    name, shape=dataset.shape, dtype=dataset.dtype
+                )
+                for start in range(0, self.num_rows, self.chunk_rows):
+                    stop = min(start + self.chunk_rows, self.num_rows)
+                    output_dataset[start:stop] = dataset[start:stop]
+
+    def close(self) -> None:
+        "Write remaining statistics, close the file and move it to the output file name."
+        if not self._file:
+            return
+
+        try:
+            self.flush()
+            if self._contiguous:
+                contiguous_file_name = self._create_temporary_file()
+                try:
+                    self._copy_to_contiguous_datasets(contiguous_file_name)
+                    os.replace(contiguous_file_name, self._file_name)
+                except BaseException:
+                    os.remove(contiguous_file_name)
+                    raise
+        except BaseException:
+            self.discard()
+            raise
+
+        self._file.close()
+        if self._contiguous:
+            os.remove(self._temporary_file_name)
+        else:
+            os.replace(self._temporary_file_name, self._file_name)
+
+    def discard(self) -> None:
+        "Close and remove the file without writing remaining statistics, the output file is not changed."
+        if not self._file:
+            return
+
+        self._file.close()
+        os.remove(self._temporary_file_name)
+
+
+def write_batches_to_hdf5(
+    batches: Iterable[GpxSegmentStatsBatch],
+    file_name: str,
+    num_points_path: int,
+    **kwargs,
+) -> int:
+    """
+    Write batches of segment statistics to HDF5 file.
+
+    :param: batches:            Iterable of batches, for example a generator processing one file after the other
+    :param: file_name:          Name of HDF5 file
+    :param: num_points_path:    Maximum number of points in path feature
+    :param: kwargs:             Options of GpxStatsHdf5Writer, for example compression or dtype
+
+    :return: Number of segments written
+    """
+    with GpxStatsHdf5Writer(file_name, num_points_path, **kwargs) as writer:
+        for batch in batches:
+            writer.write(batch)
+
+    return writer.num_rows
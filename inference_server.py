@@ -0,0 +1,290 @@
+"""Local HTTP server predicting hiking times of uploaded GPX tracks with models that are loaded once."""
+
+import argparse
+import dataclasses
+import io
+import json
+import time
+import traceback
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+from xml.etree import ElementTree
+
+from bucketed_model import DEFAULT_BUCKET_SIZES
+from config import BACKENDS, MODEL_TYPES, PREDICTOR_TYPES
+
+MAX_UPLOAD_SIZE_BYTES: int = 64 * 1024 * 1024
+
+
+def load_predictors(
+    model_types: List[str],
+    model_folder: str = ".",
+    bucket_sizes: Optional[List[int]] = DEFAULT_BUCKET_SIZES,
+    backend: str = "tensorflow",
+    prediction_cache: Optional[Any] = None,
+    elevation_model: Optional[Any] = None,
+) -> Dict[str, Any]:
+    """
+    Load predictors of the given model types.
+
+    With TensorFlow, segments are padded to fixed batch sizes by default, so that no request triggers tracing of a
+    model. The NumPy backend has no tracing, so bucket sizes are ignored for it.
+
+    :param: model_types:    Model types, for example ["standard", "simple", "recurrent", "mixed"]
+    :param: model_folder:   Folder containing the model directories and the normalization statistics
+    :param: bucket_sizes:   Batch sizes to which segments are padded, see bucketed_model.BucketedModel
+    :param: backend:        "tensorflow" or "numpy", see predictor.HikingTimePredictor
+    :param: prediction_cache:   Cache of segment predictions shared by all predictors, see prediction_cache
+    :param: elevation_model:    Elevation model shared by all predictors, see elevation_model
+
+    :return: Dictionary mapping model types to predictors
+    """
+    from predictor import load_predictor
+
+    return {
+        model_type: load_predictor(
+            model_type,
+            model_folder,
+            bucket_sizes=bucket_sizes if backend == "tensorflow" else None,
+            backend=backend,
+            prediction_cache=prediction_cache,
+            elevation_model=elevation_model,
+        )
+        for model_type in model_types
+    }
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler of prediction requests.
+
+    POST /predict?model_type=<type> with the content of a GPX file as body returns the prediction as JSON.
+    GET /health returns the loaded model types, how often their models were traced and the prediction cache usage.
+    """
+
+    # Set by create_server
+    predictors: Dict[str, Any] = {}
+    default_model_type: str = "mixed"
+    prediction_cache: Optional[Any] = None
+
+    def _send_json(self, status: HTTPStatus, content: Dict[str, Any]) -> None:
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if urlparse(self.path).path != "/health":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Unknown path."})
+            return
+
+        content = {
+            "status": "ok",
+            "model_types": sorted(self.predictors),
+            "tracing_counts": {
+                model_type: predictor.get_tracing_count()
+                for model_type, predictor in self.predictors.items()
+            },
+        }
+        if self.prediction_cache is not None:
+            content["prediction_cache"] = {
+                **dataclasses.asdict(self.prediction_cache.stats),
+                "hit_rate": self.prediction_cache.stats.get_hit_rate(),
+                "num_entries": len(self.prediction_cache),
+            }
+
+        self._send_json(HTTPStatus.OK, content)
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path != "/predict":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Unknown path."})
+            return
+
+        model_type = parse_qs(url.query).get("model_type", [self.default_model_type])[0]
+        if model_type not in self.predictors:
+            self._send_json(
+                HTTPStatus.BAD_REQUEST,
+                {"error": f"Model type {model_type} is not loaded."},
+            )
+            return
+
+        try:
+            content_length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            content_length = 0
+        if content_length <= 0:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Empty request body."})
+            return
+        if content_length > MAX_UPLOAD_SIZE_BYTES:
+            self._send_json(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "GPX file is too large."}
+            )
+            return
+
+        content = self.rfile.read(content_length)
+
+        start_time = time.perf_counter()
+        try:
+            prediction = self.predictors[model_type].predict_track(io.BytesIO(content))
+        except (ValueError, ElementTree.ParseError) as e:
+            self._send_json(
+                HTTPStatus.BAD_REQUEST, {"error": f"Could not process GPX file: {e}"}
+            )
+            return
+        except Exception:
+            # Anything else is a bug or a problem of the server, not of the uploaded file
+            self.log_error(
+                "Prediction with model type %s failed:\n%s",
+                model_type,
+                traceback.format_exc(),
+            )
+            self._send_json(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                {"error": "Internal error while predicting walking time."},
+            )
+            return
+
+        result = prediction.to_dict()
+        result["model_type"] = model_type
+        result["processing_time_ms"] = (time.perf_counter() - start_time) * 1000
+        self._send_json(HTTPStatus.OK, result)
+
+    def log_request(self, code="-", size="-") -> None:
+        # Requests are frequent, only internal errors are logged, see do_POST
+        pass
+
+
+def create_server(
+    predictors: Dict[str, Any],
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    default_model_type: str = "mixed",
+    prediction_cache: Optional[Any] = None,
+) -> ThreadingHTTPServer:
+    """
+    Create HTTP server answering prediction requests.
+
+    :param: predictors:         Dictionary mapping model types to loaded predictors
+    :param: host:               Host name or address to listen on
+    :param: port:               Port to listen on, 0 for a free port
+    :param: default_model_type: Model type used if a request does not specify one
+    :param: prediction_cache:   Cache of segment predictions used by the predictors, reported by /health
+
+    :return: Server, which handles requests in threads after calling serve_forever
+    """
+    handler = type(
+        "BoundPredictionRequestHandler",
+        (PredictionRequestHandler,),
+        {
+            "predictors": predictors,
+            "default_model_type": default_model_type,
+            "prediction_cache": prediction_cache,
+        },
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve predictions of walking times for GPX tracks over HTTP."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+    parser.add_argument(
+        "--model-folder",
+        default=".",
+        help="Folder containing the models and train_dataset_stats.csv.",
+    )
+    parser.add_argument(
+        "--model-types",
+        nargs="+",
+        choices=PREDICTOR_TYPES,
+        default=MODEL_TYPES,
+        help="Model types to load.",
+    )
+    parser.add_argument(
+        "--bucket-sizes",
+        type=int,
+        nargs="*",
+        default=DEFAULT_BUCKET_SIZES,
+        help="Batch sizes to which segments are padded, no padding if none are given.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="tensorflow",
+        help="Run the SavedModels with TensorFlow or the models exported by export_numpy_model.py with NumPy.",
+    )
+    parser.add_argument(
+        "--prediction-cache-size",
+        type=int,
+        default=0,
+        help="Maximum number of cached segment predictions, no cache if 0.",
+    )
+    parser.add_argument(
+        "--prediction-cache-file",
+        default=None,
+        help="File from which cached predictions are loaded at startup and to which they are saved at shutdown.",
+    )
+    parser.add_argument(
+        "--dem-folder",
+        default=None,
+        help="Folder with SRTM tiles (.hgt files) for filling in missing elevations.",
+    )
+    parser.add_argument(
+        "--replace-elevations",
+        action="store_true",
+        help="Replace all GPS elevations by elevations of the tiles in --dem-folder.",
+    )
+    cmd_line_args = vars(parser.parse_args())
+
+    prediction_cache = None
+    if cmd_line_args["prediction_cache_size"] > 0:
+        from prediction_cache import PredictionCache
+
+        prediction_cache = PredictionCache(
+            cmd_line_args["prediction_cache_size"],
+            cmd_line_args["prediction_cache_file"],
+        )
+
+    elevation_model = None
+    if cmd_line_args["dem_folder"] is not None:
+        from elevation_model import ElevationModel
+
+        elevation_model = ElevationModel(
+            cmd_line_args["dem_folder"], replace=cmd_line_args["replace_elevations"]
+        )
+
+    model_types = cmd_line_args["model_types"]
+    print("Loading models: {}".format(", ".join(model_types)))
+    server = create_server(
+        load_predictors(
+            model_types,
+            cmd_line_args["model_folder"],
+            cmd_line_args["bucket_sizes"] or None,
+            cmd_line_args["backend"],
+            prediction_cache,
+            elevation_model,
+        ),
+        host=cmd_line_args["host"],
+        port=cmd_line_args["port"],
+        default_model_type=model_types[-1],
+        prediction_cache=prediction_cache,
+    )
+
+    print("Serving predictions on http://{}:{}/predict".format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if prediction_cache is not None:
+            print(prediction_cache.report())
+            if prediction_cache.cache_file is not None:
+                prediction_cache.save()
@@ -0,0 +1,258 @@
+"""tf.data input pipelines reading prepared HDF5 files for the simple, recurrent and mixed models."""
+
+import itertools
+from typing import Generator, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from config import MODEL_TYPES
+from dataset_loader import SegmentDataset
+from normalization import DATA_COLUMNS, NormalizationStats
+
+LABEL_COLUMNS: List[str] = ["MovingTime"]
+
+
+def compute_normalization_stats(
+    dataset: SegmentDataset,
+    indices: Optional[np.array] = None,
+    columns: List[str] = DATA_COLUMNS,
+) -> NormalizationStats:
+    """
+    Compute normalization statistics of training data block by block.
+
+    :param: dataset:    Prepared training dataset
+    :param: indices:    Boolean mask or integer indices of training rows, all rows if None
+    :param: columns:    Names of statistical features
+
+    :return: Normalization statistics
+    """
+    mean, std = dataset.get_feature_statistics(columns, indices)
+    return NormalizationStats(columns=list(columns), mean=mean, std=std)
+
+
+def get_usable_indices(dataset: SegmentDataset, model_type: str) -> np.array:
+    """
+    Return indices of rows that can be used for a model type.
+
+    Models with path inputs can not be trained on paths with missing values.
+
+    :param: dataset:    Prepared dataset
+    :param: model_type: Model type, "simple", "recurrent" or "mixed"
+    """
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Encountered bad model type {model_type}.")
+
+    if model_type == "simple":
+        return np.arange(len(dataset))
+
+    return np.flatnonzero(dataset.get_valid_path_mask())
+
+
+def split_train_validation(
+    indices: np.array, validation_fraction: float = 0.2
+) -> Tuple[np.array, np.array]:
+    """
+    Split indices into training and validation indices.
+
+    As with the validation_split argument of keras.Model.fit, the last rows are used for validation.
+
+    :param: indices:                Indices of usable rows
+    :param: validation_fraction:    Fraction of rows used for validation
+
+    :return: Training and validation indices
+    """
+    num_train = int(len(indices) * (1.0 - validation_fraction))
+    return indices[:num_train], indices[num_train:]
+
+
+def _get_signature(model_type: str, num_points_path: int):
+    label_spec = tf.TensorSpec(shape=(None, len(LABEL_COLUMNS)), dtype=tf.float32)
+    features_spec = tf.TensorSpec(shape=(None, len(DATA_COLUMNS)), dtype=tf.float32)
+    path_spec = tf.TensorSpec(shape=(None, num_points_path, 3), dtype=tf.float32)
+
+    if model_type == "simple":
+        return features_spec, label_spec
+    if model_type == "recurrent":
+        return path_spec, label_spec
+    return (features_spec, path_spec), label_spec
+
+
+def generate_blocks(
+    file_name: str,
+    model_type: str,
+    indices: np.array,
+    normalization_stats: Optional[NormalizationStats],
+    block_rows: int = 4096,
+    shuffle_blocks: bool = False,
+    seed: Optional[int] = None,
+) -> Generator[tuple, None, None]:
+    """
+    Read model inputs and labels of selected rows from a prepared HDF5 file in blocks.
+
+    The file is opened by the generator, so only one block of rows is in memory at a time.
+
+    :param: file_name:              Name of prepared HDF5 file
+    :param: model_type:             Model type, "simple", "recurrent" or "mixed"
+    :param: indices:                Sorted integer indices of rows
+    :param: normalization_stats:    Statistics for normalizing features, required for simple and mixed models
+    :param: block_rows:             Number of rows per block
+    :param: shuffle_blocks:         Whether to read blocks in random order
+    :param: seed:                   Seed for shuffling blocks
+    """
+    blocks = [
+        indices[start : start + block_rows]
+        for start in range(0, len(indices), block_rows)
+    ]
+    if shuffle_blocks:
+        np.random.default_rng(seed).shuffle(blocks)
+
+    with SegmentDataset(file_name) as dataset:
+        for block in blocks:
+            labels = dataset.get_features(LABEL_COLUMNS, block).astype(np.float32)
+
+            if model_type != "recurrent":
+                features = normalization_stats.normalize(
+                    dataset.get_features(normalization_stats.columns, block)
+                )
+            if model_type != "simple":
+                paths = dataset.get_paths(block).astype(np.float32)
+
+            if model_type == "simple":
+                yield features, labels
+            elif model_type == "recurrent":
+                yield paths, labels
+            else:
+                yield (features, paths), labels
+
+
+def make_dataset(
+    file_name: str,
+    model_type: str,
+    normalization_stats: Optional[NormalizationStats] = None,
+    indices: Optional[np.array] = None,
+    batch_size: int = 256,
+    shuffle_buffer_size: int = 0,
+    cache: Optional[str] = None,
+    block_rows: int = 4096,
+    seed: Optional[int] = None,
+) -> tf.data.Dataset:
+    """
+    Build a tf.data.Dataset with batches of model inputs and labels from a prepared HDF5 file.
+
+    Rows are read block by block, normalized with vectorized NumPy operations and unbatched, so corpora that do not
+    fit into memory can be used. With shuffling, the order of blocks is randomized in every epoch in addition to the
+    shuffle buffer. A cache stores the normalized rows after the first epoch, in memory if cache is an empty string
+    and in files with the given prefix otherwise. Batches are prefetched, so reading overlaps with training.
+
+    :param: file_name:              Name of prepared HDF5 file
+    :param: model_type:             Model type, "simple", "recurrent" or "mixed"
+    :param: normalization_stats:    Statistics of the training set, required for simple and mixed models
+    :param: indices:                Integer indices of rows, all usable rows of the model type if None
+    :param: batch_size:             Number of rows per batch
+    :param: shuffle_buffer_size:    Size of shuffle buffer, no shuffling if 0
+    :param: cache:                  None for no caching, "" for caching in memory or prefix of cache files
+    :param: block_rows:             Number of rows read from the file at once
+    :param: seed:                   Seed for shuffling
+
+    :return: Dataset of (inputs, labels) batches, where inputs are a tuple of features and paths for mixed models
+    """
+    if model_type != "recurrent" and normalization_stats is None:
+        raise ValueError(
+            f"Normalization statistics are required for model type {model_type}."
+        )
+
+    with SegmentDataset(file_name) as segment_dataset:
+        if indices is None:
+            indices = get_usable_indices(segment_dataset, model_type)
+        num_points_path = segment_dataset["Path"].shape[1]
+
+    shuffle = shuffle_buffer_size > 0
+    # Blocks are only shuffled without cache, since the cache would freeze the order of the first epoch
+    shuffle_blocks = shuffle and cache is None
+
+    epochs = itertools.count()
+
+    def _generator():
+        # The generator is created anew in every epoch, vary the seed to get a new order of blocks
+        epoch = next(epochs)
+        return generate_blocks(
+            file_name,
+            model_type,
+            np.sort(indices),
+            normalization_stats,
+            block_rows=block_rows,
+            shuffle_blocks=shuffle_blocks,
+            seed=None if seed is None else seed + epoch,
+        )
+
+    dataset = tf.data.Dataset.from_generator(
+        _generator, output_signature=_get_signature(model_type, num_points_path)
+    ).unbatch()
+
+    if cache is not None:
+        dataset = dataset.cache(cache)
+
+    if shuffle:
+        dataset = dataset.shuffle(
+            shuffle_buffer_size, seed=seed, reshuffle_each_iteration=True
+        )
+
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def make_train_validation_datasets(
+    file_name: str,
+    model_type: str,
+    validation_fraction: float = 0.2,
+    batch_size: int = 256,
+    shuffle_buffer_size: int = 16384,
+    cache: Optional[str] = None,
+    seed: Optional[int] = None,
+) -> Tuple[tf.data.Dataset, tf.data.Dataset, NormalizationStats]:
+    """
+    Build training and validation datasets from a prepared training file.
+
+    The normalization statistics are computed on the training rows only.
+
+    :param: file_name:              Name of prepared HDF5 training file
+    :param: model_type:             Model type, "simple", "recurrent" or "mixed"
+    :param: validation_fraction:    Fraction of rows used for validation
+    :param: batch_size:             Number of rows per batch
+    :param: shuffle_buffer_size:    Size of shuffle buffer for training data
+    :param: cache:                  Cache of training and validation data, see make_dataset, no caching by default,
+                                    so that datasets larger than the memory can be used, "" caches both in memory
+    :param: seed:                   Seed for shuffling
+
+    :return: Training dataset, validation dataset and normalization statistics
+    """
+    with SegmentDataset(file_name) as segment_dataset:
+        train_indices, validation_indices = split_train_validation(
+            get_usable_indices(segment_dataset, model_type), validation_fraction
+        )
+        normalization_stats = compute_normalization_stats(
+            segment_dataset, train_indices
+        )
+
+    validation_cache = None if cache is None or cache == "" else cache + "_validation"
+
+    train_dataset = make_dataset(
+        file_name,
+        model_type,
+        normalization_stats,
+        indices=train_indices,
+        batch_size=batch_size,
+        shuffle_buffer_size=shuffle_buffer_size,
+        cache=cache,
+        seed=seed,
+    )
+    validation_dataset = make_dataset(
+        file_name,
+        model_type,
+        normalization_stats,
+        indices=validation_indices,
+        batch_size=batch_size,
+        cache=cache if validation_cache is None else validation_cache,
+    )
+
+    return train_dataset, validation_dataset, normalization_stats
@@ -0,0 +1,413 @@
+"""Prediction of the remaining hiking time of tracks in progress, updated incrementally as new points arrive."""
+
+import dataclasses
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import gpx_array_stats
+from array_segment import ArraySegment
+from config import DataPreparationConfig
+from geodesy import cumulative_distances, distance, point_distances, thin_by_distance
+from gpx_stats import get_split_indices
+from moving_data import get_moving_data
+from predictor import INFERENCE_DATA_PREPARATION_CONFIG, HikingTimePredictor
+
+# Halving depends on the length of the complete segment, so live tracks are cut at multiples of the maximum length
+LIVE_DATA_PREPARATION_CONFIG: DataPreparationConfig = dataclasses.replace(
+    INFERENCE_DATA_PREPARATION_CONFIG, split_mode="fixed"
+)
+
+ARRAY_NAMES: List[str] = ["longitude", "latitude", "elevation", "time"]
+
+
+def _empty_segment() -> ArraySegment:
+    return ArraySegment(*(np.zeros(0) for _ in ARRAY_NAMES))
+
+
+def _concatenate_segments(segments_list: List[ArraySegment]) -> ArraySegment:
+    return ArraySegment(
+        *(
+            np.concatenate([getattr(segment, name) for segment in segments_list])
+            for name in ARRAY_NAMES
+        )
+    )
+
+
+def _is_predicted(segment: ArraySegment) -> bool:
+    "Check whether a segment is kept by extract_stats_batch, which drops segments with more stopped than moving time."
+    if len(segment) == 0:
+        return False
+
+    segment_moving_data = get_moving_data(segment)
+    return segment_moving_data.moving_time >= segment_moving_data.stopped_time
+
+
+@dataclass
+class LivePrediction:
+    """
+    Predicted hiking times of a track in progress in seconds.
+
+    Remaining times and the distance to the planned route are None for tracks without planned route.
+    """
+
+    moving_time_s: float
+    moving_time_std_s: float
+    remaining_moving_time_s: Optional[float]
+    remaining_moving_time_std_s: Optional[float]
+    true_moving_time_s: Optional[float] = None
+    distance_to_route_m: Optional[float] = None
+    num_segments: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        "Convert prediction to dictionary, for example for JSON output."
+        return dataclasses.asdict(self)
+
+
+class LiveTrack(object):
+    """
+    State of a track in progress, to which points are added as they are recorded.
+
+    New points are smoothed, filtered and split in the same way as by prepare_data.process_segments with split mode
+    "fixed", but only the points that have not been processed before are touched. For smoothing, the last raw points
+    of the previous update complete the windows of the new points. Filtering continues from the last kept point and
+    segments are closed once the track passes the next multiple of the maximum segment length.
+
+    Predictions of closed segments are computed once and summed. Only the open segment at the end of the track and
+    the part of the planned route up to the end of its current segment are predicted again after updates. The
+    segments of the planned route are predicted once.
+    """
+
+    def __init__(
+        self,
+        planned_route: Optional[ArraySegment] = None,
+        config: DataPreparationConfig = LIVE_DATA_PREPARATION_CONFIG,
+        search_distance_m: float = 1000.0,
+    ) -> None:
+        """
+        Construct LiveTrack object.
+
+        :param: planned_route:      Points of the planned route, the remaining time is only predicted if it is given
+        :param: config:             Configuration of data preparation, its split mode is ignored
+        :param: search_distance_m:  Distance along the planned route ahead of the last matched point in which the
+                                    current position is searched, so that routes crossing themselves are followed
+        """
+        self.config = config
+        self.search_distance_m = search_distance_m
+
+        # Raw points completing the smoothing windows of the next points
+        self._raw_tail = _empty_segment()
+        # Last point kept by the distance filter, the next kept point has to be far enough away from it
+        self._last_kept = _empty_segment()
+        self._distance_m = 0.0
+
+        self._open_segment = _empty_segment()
+        self._open_part = 0
+        self._closed_segments: List[ArraySegment] = []
+
+        self._true_moving_time_s = 0.0
+        self._num_segments = 0
+        self._moving_time_s = 0.0
+        self._variance = 0.0
+        self._open_prediction: Optional[np.array] = None
+        self._open_pending = self._open_predicted = False
+
+        self.planned_route: Optional[ArraySegment] = None
+        if planned_route is not None:
+            self._set_planned_route(planned_route)
+
+    def _set_planned_route(self, planned_route: ArraySegment) -> None:
+        # Timestamps of planned routes are meaningless and would let extract_stats_batch drop segments
+        segments_list = [
+            ArraySegment(
+                planned_route.longitude.copy(),
+                planned_route.latitude.copy(),
+                planned_route.elevation.copy(),
+                np.full(len(planned_route), np.nan),
+            )
+        ]
+        gpx_array_stats.smoothen_coordinates(
+            segments_list,
+            window_size=self.config.smoothing_window_size,
+            kernel=self.config.smoothing_kernel,
+        )
+        (self.planned_route,) = gpx_array_stats.filter_segments(
+            segments_list, min_distance_m=self.config.min_distance_m
+        )
+        if len(self.planned_route) == 0:
+            raise ValueError("Planned route does not contain any points.")
+
+        self._route_distances = cumulative_distances(
+            self.planned_route.latitude, self.planned_route.longitude
+        )
+        self._route_split_indices = get_split_indices(
+            self._route_distances, self.config.max_length_m, "fixed"
+        )
+        self._route_index = 0
+        self._distance_to_route_m: Optional[float] = None
+
+        # Sums of predictions of the route segments from every segment to the end, computed with the first prediction
+        self._route_moving_times: Optional[np.array] = None
+        self._route_variances: Optional[np.array] = None
+        self._partial_prediction: Optional[np.array] = None
+        self._partial_pending = False
+
+    def add_points(self, points: ArraySegment) -> None:
+        """
+        Add newly recorded points to the end of the track.
+
+        :param: points:     Array segment with the new points in recording order
+        """
+        if len(points) == 0:
+            return
+
+        raw_points = _concatenate_segments([self._raw_tail, points])
+        self._true_moving_time_s += get_moving_data(
+            raw_points[max(0, len(self._raw_tail) - 1) :]
+        ).moving_time
+
+        smoothed_points = self._smoothen(raw_points)
+        kept_points = self._filter(smoothed_points)
+        self._split(kept_points)
+
+        if self.planned_route is not None:
+            self._match_route_position(points[-1:])
+
+    def _smoothen(self, raw_points: ArraySegment) -> ArraySegment:
+        window_size = self.config.smoothing_window_size
+        num_points = len(raw_points)
+
+        # Copies, since smoothing overwrites the arrays of raw_points
+        self._raw_tail = raw_points[
+            np.arange(max(0, num_points - window_size + 1), num_points)
+        ]
+
+        if num_points < window_size:
+            return _empty_segment()
+
+        segments_list = [raw_points]
+        gpx_array_stats.smoothen_coordinates(
+            segments_list, window_size=window_size, kernel=self.config.smoothing_kernel
+        )
+        return segments_list[0]
+
+    def _filter(self, smoothed_points: ArraySegment) -> ArraySegment:
+        if len(smoothed_points) == 0:
+            return smoothed_points
+
+        candidates = _concatenate_segments([self._last_kept, smoothed_points])
+        kept_indices = thin_by_distance(
+            candidates.latitude, candidates.longitude, self.config.min_distance_m
+        )
+        self._last_kept = candidates[kept_indices[-1:]]
+
+        # The previously kept point is always the first kept index
+        return candidates[kept_indices[len(candidates) - len(smoothed_points) :]]
+
+    def _split(self, kept_points: ArraySegment) -> None:
+        if len(kept_points) == 0:
+            return
+
+        points = _concatenate_segments([self._open_segment, kept_points])
+        num_new_points = len(kept_points)
+
+        # Distances along the track of the new points, the first point of the track is at zero
+        point_distances_m = point_distances(points.latitude, points.longitude)[
+            -num_new_points:
+        ]
+        if len(point_distances_m) < num_new_points:
+            point_distances_m = np.concatenate([[0.0], point_distances_m])
+        new_distances = self._distance_m + np.cumsum(point_distances_m)
+        self._distance_m = float(new_distances[-1])
+
+        parts = np.concatenate(
+            [
+                np.full(len(self._open_segment), self._open_part),
+                (new_distances // self.config.max_length_m).astype(int),
+            ]
+        )
+        boundaries = np.flatnonzero(np.diff(parts)) + 1
+        starts = np.concatenate([[0], boundaries])
+        stops = np.concatenate([boundaries, [len(points)]])
+
+        self._closed_segments.extend(
+            points[start:stop] for start, stop in zip(starts[:-1], stops[:-1])
+        )
+        self._open_segment = points[starts[-1] :]
+        self._open_part = int(parts[-1])
+        self._open_prediction = None
+
+    def _match_route_position(self, position: ArraySegment) -> None:
+        route = self.planned_route
+        stop = np.searchsorted(
+            self._route_distances,
+            self._route_distances[self._route_index] + self.search_distance_m,
+            side="right",
+        )
+        distances = distance(
+            route.latitude[self._route_index : stop],
+            route.longitude[self._route_index : stop],
+            None,
+            position.latitude[0],
+            position.longitude[0],
+            None,
+        )
+        route_index = self._route_index + int(np.argmin(distances))
+        self._distance_to_route_m = float(np.min(distances))
+
+        if route_index != self._route_index:
+            self._route_index = route_index
+            self._partial_prediction = None
+
+    def _get_route_part(self) -> int:
+        return int(
+            np.searchsorted(self._route_split_indices, self._route_index, side="right")
+            - 1
+        )
+
+    def _get_pending_segments(self) -> List[ArraySegment]:
+        "Return segments without prediction, in the order expected by _set_predictions."
+        # Segments dropped by extract_stats_batch are removed, so that every segment gets one prediction
+        self._closed_segments = [
+            segment for segment in self._closed_segments if _is_predicted(segment)
+        ]
+        segments_list = list(self._closed_segments)
+
+        self._open_pending = self._open_prediction is None and _is_predicted(
+            self._open_segment
+        )
+        if self._open_pending:
+            segments_list.append(self._open_segment)
+
+        if self.planned_route is not None:
+            if self._route_moving_times is None:
+                split_indices = self._route_split_indices
+                segments_list.extend(
+                    self.planned_route[start:stop]
+                    for start, stop in zip(split_indices[:-1], split_indices[1:])
+                )
+
+            # Remaining part of the current segment of the route, no prediction for a single point
+            stop = self._route_split_indices[self._get_route_part() + 1]
+            self._partial_pending = (
+                self._partial_prediction is None and stop - self._route_index >= 2
+            )
+            if self._partial_pending:
+                segments_list.append(self.planned_route[self._route_index : stop])
+
+        return segments_list
+
+    def _set_predictions(self, predictions: np.array) -> None:
+        "Store predictions of the segments returned by _get_pending_segments."
+        moving_times = predictions[:, 0].astype(float)
+        variances = np.exp(predictions[:, 1].astype(float))
+
+        num_closed = len(self._closed_segments)
+        self._moving_time_s += float(np.sum(moving_times[:num_closed]))
+        self._variance += float(np.sum(variances[:num_closed]))
+        self._num_segments += num_closed
+        self._closed_segments = []
+        offset = num_closed
+
+        if self._open_pending:
+            self._open_prediction = np.array([moving_times[offset], variances[offset]])
+            self._open_predicted = True
+            offset += 1
+        elif self._open_prediction is None:
+            self._open_prediction = np.zeros(2)
+            self._open_predicted = False
+
+        if self.planned_route is None:
+            return
+
+        if self._route_moving_times is None:
+            num_parts = len(self._route_split_indices) - 1
+            # Sums from every segment to the end, with a trailing zero for the end of the route
+            self._route_moving_times = np.append(
+                np.cumsum(moving_times[offset : offset + num_parts][::-1])[::-1], 0.0
+            )
+            self._route_variances = np.append(
+                np.cumsum(variances[offset : offset + num_parts][::-1])[::-1], 0.0
+            )
+            offset += num_parts
+
+        if self._partial_pending:
+            self._partial_prediction = np.array(
+                [moving_times[offset], variances[offset]]
+            )
+        elif self._partial_prediction is None:
+            self._partial_prediction = np.zeros(2)
+
+    def _get_prediction(self) -> LivePrediction:
+        moving_time_s = self._moving_time_s + float(self._open_prediction[0])
+        variance = self._variance + float(self._open_prediction[1])
+
+        remaining_moving_time_s = remaining_moving_time_std_s = None
+        if self.planned_route is not None:
+            next_part = self._get_route_part() + 1
+            remaining_moving_time_s = float(
+                self._partial_prediction[0] + self._route_moving_times[next_part]
+            )
+            remaining_moving_time_std_s = float(
+                np.sqrt(self._partial_prediction[1] + self._route_variances[next_part])
+            )
+
+        return LivePrediction(
+            moving_time_s=moving_time_s,
+            moving_time_std_s=float(np.sqrt(variance)),
+            remaining_moving_time_s=remaining_moving_time_s,
+            remaining_moving_time_std_s=remaining_moving_time_std_s,
+            true_moving_time_s=self._true_moving_time_s or None,
+            distance_to_route_m=(
+                self._distance_to_route_m if self.planned_route is not None else None
+            ),
+            num_segments=self._num_segments + int(self._open_predicted),
+        )
+
+    def predict(self, predictor: HikingTimePredictor) -> LivePrediction:
+        """
+        Predict the hiking times of the track, only calling the model for segments that changed.
+
+        :param: predictor:  Predictor with loaded model
+
+        :return: Predicted moving time of the recorded part and remaining moving time of the planned route
+        """
+        return predict_live_tracks(predictor, [self])[0]
+
+
+def predict_live_tracks(
+    predictor: HikingTimePredictor, live_tracks: List[LiveTrack]
+) -> List[LivePrediction]:
+    """
+    Predict the hiking times of many tracks in progress with a single model call.
+
+    The segments without prediction of all tracks are collected, predicted at once and assigned back to the tracks,
+    so that a server with many concurrent tracks can answer all updates received in a short time together.
+
+    :param: predictor:      Predictor with loaded model
+    :param: live_tracks:    Tracks in progress
+
+    :return: Prediction for every track in the order of live_tracks
+    """
+    pending_segments = [
+        live_track._get_pending_segments() for live_track in live_tracks
+    ]
+
+    num_points_path = {live_track.config.num_points_path for live_track in live_tracks}
+    if len(num_points_path) > 1:
+        raise ValueError("Tracks with different numbers of points in paths.")
+
+    # Segments dropped by extract_stats_batch were removed, so the rows of the batch follow the pending segments
+    gpx_data = gpx_array_stats.extract_stats_batch(
+        [segment for segments_list in pending_segments for segment in segments_list],
+        num_points_path=num_points_path.pop() if num_points_path else 0,
+    )
+    predictions = predictor.predict_segments(gpx_data)
+
+    offset = 0
+    for live_track, segments_list in zip(live_tracks, pending_segments):
+        live_track._set_predictions(predictions[offset : offset + len(segments_list)])
+        offset += len(segments_list)
+
+    return [live_track._get_prediction() for live_track in live_tracks]
@@ -0,0 +1,112 @@
+"""Vectorized computation of moving and stopped times of track segments."""
+
+from typing import NamedTuple, Optional
+
+import numpy as np
+from gpxpy.gpx import DEFAULT_STOPPED_SPEED_THRESHOLD
+
+from array_segment import ArraySegment
+from geodesy import point_distances
+
+
+class MovingData(NamedTuple):
+    "Times in seconds and distances in meters during which a track was moving or stopped."
+
+    moving_time: np.array
+    stopped_time: np.array
+    moving_distance: np.array
+    stopped_distance: np.array
+
+
+def get_moving_distances(
+    latitude: np.array, longitude: np.array, elevation: np.array
+) -> np.array:
+    """
+    Compute distances between consecutive points as used by GPXTrackSegment.get_moving_data
+
+    Elevations are only taken into account if they are available and non-zero in both points.
+
+    :param: latitude:       Latitudes of track points in degrees
+    :param: longitude:      Longitudes of track points in degrees
+    :param: elevation:      Elevations of track points in meters, NaN if missing
+
+    :return: Array of length len(latitude) - 1 with distances in meters
+    """
+    return point_distances(
+        latitude, longitude, np.where(elevation == 0, np.nan, elevation)
+    )
+
+
+def compute_moving_data(
+    time: np.array,
+    distances: np.array,
+    pair_segment_indices: Optional[np.array] = None,
+    num_segments: int = 1,
+    stopped_speed_threshold: float = DEFAULT_STOPPED_SPEED_THRESHOLD,
+) -> MovingData:
+    """
+    Compute moving and stopped times with the speed threshold semantics of GPXTrackSegment.get_moving_data
+
+    Pairs of consecutive points with timestamps, a positive time difference and a non-zero distance are counted as
+    stopped if their speed does not exceed the threshold and as moving otherwise.
+
+    :param: time:                       Timestamps of track points in seconds, NaN if missing
+    :param: distances:                  Distances between consecutive points, see get_moving_distances
+    :param: pair_segment_indices:       Segment index of every pair of consecutive points if time contains the points
+                                        of several segments, pairs with negative index are ignored
+    :param: num_segments:               Number of segments
+    :param: stopped_speed_threshold:    Speed in km/h up to which points are treated as stopped
+
+    :return: MovingData with an array entry for every segment
+    """
+    if pair_segment_indices is None:
+        pair_segment_indices = np.zeros(len(distances), dtype=int)
+
+    seconds = time[1:] - time[:-1]
+
+    counted = (
+        (pair_segment_indices >= 0)
+        & ~np.isnan(seconds)
+        & (seconds > 0)
+        & (distances != 0)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed_kmh = (distances / 1000) / (seconds / 60**2)
+    stopped = counted & (speed_kmh <= stopped_speed_threshold)
+    moving = counted & ~stopped
+
+    def _sum_per_segment(values: np.array, mask: np.array) -> np.array:
+        return np.bincount(
+            pair_segment_indices[mask], weights=values[mask], minlength=num_segments
+        )
+
+    return MovingData(
+        moving_time=_sum_per_segment(seconds, moving),
+        stopped_time=_sum_per_segment(seconds, stopped),
+        moving_distance=_sum_per_segment(distances, moving),
+        stopped_distance=_sum_per_segment(distances, stopped),
+    )
+
+
+def get_moving_data(
+    segment: ArraySegment,
+    stopped_speed_threshold: float = DEFAULT_STOPPED_SPEED_THRESHOLD,
+) -> MovingData:
+    """
+    Compute moving and stopped times of an array segment
+
+    :param: segment:                    Array segment
+    :param: stopped_speed_threshold:    Speed in km/h up to which points are treated as stopped
+
+    :return: MovingData with float entries
+    """
+    if len(segment) < 2:
+        return MovingData(0.0, 0.0, 0.0, 0.0)
+
+    moving_data = compute_moving_data(
+        segment.time,
+        get_moving_distances(segment.latitude, segment.longitude, segment.elevation),
+        stopped_speed_threshold=stopped_speed_threshold,
+    )
+
+    return MovingData(*(float(value[0]) for value in moving_data))
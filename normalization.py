@@ -0,0 +1,46 @@
+"""Normalization of statistical segment features with statistics of the training set."""
+
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+DATA_COLUMNS: List[str] = ["Length2d", "Length3d", "TotalUphill", "TotalDownhill"]
+
+
+@dataclass
+class NormalizationStats:
+    "Means and standard deviations of the statistical features of the training set."
+
+    columns: List[str]
+    mean: np.array
+    std: np.array
+
+    def normalize(self, features: np.array) -> np.array:
+        """
+        Normalize features.
+
+        :param: features:   Array of shape (num_rows, len(columns))
+        :return:            Normalized features as float32
+        """
+        return ((features - self.mean) / self.std).astype(np.float32)
+
+    def to_csv(self, file_name: str) -> None:
+        "Write statistics in the format of train_dataset_stats.csv, as read by inference.py."
+        import pandas as pd
+
+        pd.DataFrame({"mean": self.mean, "std": self.std}, index=self.columns).to_csv(
+            file_name, sep=" "
+        )
+
+    @classmethod
+    def from_csv(cls, file_name: str) -> "NormalizationStats":
+        "Read statistics from file in the format of train_dataset_stats.csv."
+        import pandas as pd
+
+        stats = pd.read_csv(file_name, header=0, sep=" ", index_col=0)
+        return cls(
+            columns=list(stats.index),
+            mean=stats["mean"].values,
+            std=stats["std"].values,
+        )
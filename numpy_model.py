@@ -0,0 +1,315 @@
+"""Forward pass of the trained Keras models with NumPy, for predictions in processes without TensorFlow."""
+
+import json
+import os
+from typing import Any, Callable, Dict, List, Union
+
+import numpy as np
+
+from config import MODEL_TYPES
+
+NUMPY_MODEL_FILES: Dict[str, str] = {
+    model_type: f"model_hikingTimePrediction_{model_type}.npz"
+    for model_type in MODEL_TYPES
+}
+
+# Names of the weights of layers in the order of Layer.get_weights
+LAYER_WEIGHT_NAMES: Dict[str, List[str]] = {
+    "InputLayer": [],
+    "Dropout": [],
+    "Concatenate": [],
+    "Dense": ["kernel", "bias"],
+    "Conv1D": ["kernel", "bias"],
+    "BatchNormalization": ["gamma", "beta", "moving_mean", "moving_variance"],
+    "LSTM": ["kernel", "recurrent_kernel", "bias"],
+}
+
+
+def sigmoid(x: np.array) -> np.array:
+    "Logistic function."
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+ACTIVATIONS: Dict[str, Callable[[np.array], np.array]] = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "tanh": np.tanh,
+    "sigmoid": sigmoid,
+}
+
+
+def dense(
+    x: np.array, kernel: np.array, bias: np.array, activation: str = "linear"
+) -> np.array:
+    """
+    Fully connected layer, as tf.keras.layers.Dense.
+
+    :param: x:          Array of shape (num_rows, num_inputs)
+    :param: kernel:     Array of shape (num_inputs, units)
+    :param: bias:       Array of shape (units,)
+    :param: activation: Name of activation function
+
+    :return: Array of shape (num_rows, units)
+    """
+    return ACTIVATIONS[activation](x @ kernel + bias)
+
+
+def conv1d(
+    x: np.array,
+    kernel: np.array,
+    bias: np.array,
+    activation: str = "linear",
+    padding: str = "valid",
+) -> np.array:
+    """
+    One-dimensional convolution with stride 1, as tf.keras.layers.Conv1D.
+
+    :param: x:          Array of shape (num_rows, num_steps, num_channels)
+    :param: kernel:     Array of shape (kernel_size, num_channels, filters)
+    :param: bias:       Array of shape (filters,)
+    :param: activation: Name of activation function
+    :param: padding:    "valid" or "same"
+
+    :return: Array of shape (num_rows, num_output_steps, filters)
+    """
+    kernel_size = kernel.shape[0]
+    if padding == "same":
+        left = (kernel_size - 1) // 2
+        x = np.pad(x, [(0, 0), (left, kernel_size - 1 - left), (0, 0)])
+
+    num_output_steps = x.shape[1] - kernel_size + 1
+    output = bias + sum(
+        x[:, offset : offset + num_output_steps, :] @ kernel[offset]
+        for offset in range(kernel_size)
+    )
+    return ACTIVATIONS[activation](output)
+
+
+def batch_normalization(
+    x: np.array,
+    gamma: np.array,
+    beta: np.array,
+    moving_mean: np.array,
+    moving_variance: np.array,
+    epsilon: float = 1e-3,
+) -> np.array:
+    "Batch normalization of the last axis in inference mode, as tf.keras.layers.BatchNormalization."
+    scale = gamma / np.sqrt(moving_variance + epsilon)
+    return x * scale + (beta - moving_mean * scale)
+
+
+def lstm(
+    x: np.array,
+    kernel: np.array,
+    recurrent_kernel: np.array,
+    bias: np.array,
+    return_sequences: bool = False,
+    activation: str = "tanh",
+    recurrent_activation: str = "sigmoid",
+) -> np.array:
+    """
+    Long short-term memory layer, as tf.keras.layers.LSTM with gates in the order input, forget, cell and output.
+
+    :param: x:                      Array of shape (num_rows, num_steps, num_inputs)
+    :param: kernel:                 Array of shape (num_inputs, 4 * units)
+    :param: recurrent_kernel:       Array of shape (units, 4 * units)
+    :param: bias:                   Array of shape (4 * units,)
+    :param: return_sequences:       Whether to return the output of all steps instead of the last one
+    :param: activation:             Name of activation function of cell state and output
+    :param: recurrent_activation:   Name of activation function of gates
+
+    :return: Array of shape (num_rows, num_steps, units) if return_sequences, else (num_rows, units)
+    """
+    units = recurrent_kernel.shape[0]
+    num_rows, num_steps = x.shape[:2]
+    activation_function = ACTIVATIONS[activation]
+    recurrent_activation_function = ACTIVATIONS[recurrent_activation]
+
+    # Input contributions of all steps are computed at once, only the recurrent part is sequential
+    input_contributions = x @ kernel + bias
+
+    hidden_state = np.zeros((num_rows, units), dtype=x.dtype)
+    cell_state = np.zeros((num_rows, units), dtype=x.dtype)
+    outputs = []
+    for step in range(num_steps):
+        z = input_contributions[:, step, :] + hidden_state @ recurrent_kernel
+        input_gate = recurrent_activation_function(z[:, :units])
+        forget_gate = recurrent_activation_function(z[:, units : 2 * units])
+        cell_candidate = activation_function(z[:, 2 * units : 3 * units])
+        output_gate = recurrent_activation_function(z[:, 3 * units :])
+
+        cell_state = forget_gate * cell_state + input_gate * cell_candidate
+        hidden_state = output_gate * activation_function(cell_state)
+        if return_sequences:
+            outputs.append(hidden_state)
+
+    if return_sequences:
+        return np.stack(outputs, axis=1)
+    return hidden_state
+
+
+class NumpyModel(object):
+    """
+    Keras functional model evaluated with NumPy in inference mode.
+
+    The model is described by a list of layers with their configuration and the names of their input layers, as
+    written by export_numpy_model.py. Dropout layers are skipped.
+    """
+
+    def __init__(
+        self,
+        layers: List[Dict[str, Any]],
+        input_layers: List[str],
+        output_layer: str,
+        weights: Dict[str, np.array],
+        block_rows: int = 4096,
+    ) -> None:
+        """
+        Construct NumpyModel object.
+
+        :param: layers:         Layers in topological order, dictionaries with class_name, name, inputs and config
+        :param: input_layers:   Names of input layers in the order of the model inputs
+        :param: output_layer:   Name of output layer
+        :param: weights:        Weights, with keys "<layer name>/<weight name>", converted to float32
+        :param: block_rows:     Number of rows evaluated at once, which limits the memory of intermediate results
+        """
+        for layer in layers:
+            if layer["class_name"] not in LAYER_WEIGHT_NAMES:
+                raise ValueError(
+                    f"Encountered unsupported layer {layer['class_name']}."
+                )
+
+        self.layers = layers
+        self.input_layers = input_layers
+        self.output_layer = output_layer
+        self.weights = {
+            name: np.asarray(value, dtype=np.float32) for name, value in weights.items()
+        }
+        self.block_rows = block_rows
+
+    def _get_weights(self, layer: Dict[str, Any]) -> List[np.array]:
+        return [
+            self.weights[f"{layer['name']}/{weight_name}"]
+            for weight_name in LAYER_WEIGHT_NAMES[layer["class_name"]]
+        ]
+
+    def _apply_layer(self, layer: Dict[str, Any], inputs: List[np.array]) -> np.array:
+        class_name = layer["class_name"]
+        config = layer["config"]
+        weights = self._get_weights(layer)
+
+        if class_name == "Dropout":
+            return inputs[0]
+        if class_name == "Concatenate":
+            return np.concatenate(inputs, axis=config["axis"])
+        if class_name == "Dense":
+            return dense(inputs[0], *weights, activation=config["activation"])
+        if class_name == "Conv1D":
+            return conv1d(
+                inputs[0],
+                *weights,
+                activation=config["activation"],
+                padding=config["padding"],
+            )
+        if class_name == "BatchNormalization":
+            return batch_normalization(inputs[0], *weights, epsilon=config["epsilon"])
+        return lstm(
+            inputs[0],
+            *weights,
+            return_sequences=config["return_sequences"],
+            activation=config["activation"],
+            recurrent_activation=config["recurrent_activation"],
+        )
+
+    def _predict_block(self, inputs: List[np.array]) -> np.array:
+        outputs = dict(zip(self.input_layers, inputs))
+        for layer in self.layers:
+            if layer["class_name"] != "InputLayer":
+                outputs[layer["name"]] = self._apply_layer(
+                    layer, [outputs[name] for name in layer["inputs"]]
+                )
+        return outputs[self.output_layer]
+
+    def __call__(self, inputs: Union[np.array, List[np.array]]) -> np.array:
+        """
+        Predict model inputs.
+
+        :param: inputs:     Array for models with one input, list of arrays in the order of input_layers otherwise
+
+        :return: Output of the model as float32
+        """
+        arrays = [
+            np.asarray(array, dtype=np.float32)
+            for array in (inputs if isinstance(inputs, list) else [inputs])
+        ]
+        if len(arrays) != len(self.input_layers):
+            raise ValueError(
+                f"Model expects {len(self.input_layers)} inputs, got {len(arrays)}."
+            )
+
+        num_rows = len(arrays[0])
+        if num_rows <= self.block_rows:
+            return self._predict_block(arrays)
+
+        return np.concatenate(
+            [
+                self._predict_block(
+                    [array[start : start + self.block_rows] for array in arrays]
+                )
+                for start in range(0, num_rows, self.block_rows)
+            ]
+        )
+
+    def save(self, file_name: str) -> None:
+        """
+        Write model description and weights to npz file.
+
+        :param: file_name:  Name of npz file
+        """
+        description = {
+            "layers": self.layers,
+            "input_layers": self.input_layers,
+            "output_layer": self.output_layer,
+        }
+        np.savez_compressed(
+            file_name,
+            model_description=np.array(json.dumps(description)),
+            **self.weights,
+        )
+
+    @classmethod
+    def load(cls, file_name: str, block_rows: int = 4096) -> "NumpyModel":
+        """
+        Read model from npz file written by save.
+
+        :param: file_name:  Name of npz file
+        :param: block_rows: Number of rows evaluated at once
+        """
+        with np.load(file_name) as content:
+            description = json.loads(str(content["model_description"]))
+            weights = {
+                name: content[name]
+                for name in content.files
+                if name != "model_description"
+            }
+
+        return cls(
+            description["layers"],
+            description["input_layers"],
+            description["output_layer"],
+            weights,
+            block_rows=block_rows,
+        )
+
+
+def load_numpy_model(model_type: str, model_folder: str = ".") -> NumpyModel:
+    """
+    Load exported model of a model type.
+
+    :param: model_type:     Model type, "simple", "recurrent" or "mixed"
+    :param: model_folder:   Folder containing the exported models
+    """
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Encountered bad model type {model_type}.")
+
+    return NumpyModel.load(os.path.join(model_folder, NUMPY_MODEL_FILES[model_type]))
@@ -0,0 +1,268 @@
+"""In-memory cache of segment predictions keyed by a fingerprint of the model inputs, optionally saved to disk."""
+
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import MODEL_TYPES
+from feature_cache import FeatureCacheStats
+from gpx_stats import GpxSegmentStatsBatch
+from normalization import DATA_COLUMNS
+
+# Increase when the computation of fingerprints changes, so that saved caches are not used with other keys
+FINGERPRINT_VERSION: int = 2
+
+FINGERPRINT_SIZE_BYTES: int = 16
+
+
+def get_segment_fingerprints(
+    gpx_data: GpxSegmentStatsBatch,
+    model_type: str,
+    model_fingerprint: Optional[str] = None,
+    distance_resolution_m: float = 0.01,
+    coordinate_resolution_deg: float = 1e-7,
+) -> List[bytes]:
+    """
+    Compute fingerprints of the inputs of a model for track segments.
+
+    Only the columns seen by the model of the given type are used. They are rounded to multiples of the resolutions,
+    such that segments whose inputs differ by less than the resolutions usually share a fingerprint. Path features
+    are shifted to start at the origin and rotated, so the same section of a trail has the same fingerprint in every
+    track. Missing elevations in paths are treated as zero, as in predictor.get_model_inputs.
+
+    :param: gpx_data:                   Statistics of track segments
+    :param: model_type:                 Model type, "simple", "recurrent" or "mixed"
+    :param: model_fingerprint:          Hash identifying weights, normalization statistics and backend of the model,
+                                        see predictor.get_model_fingerprint
+    :param: distance_resolution_m:      Resolution of lengths, elevation changes and elevations in paths in meters
+    :param: coordinate_resolution_deg:  Resolution of longitudes and latitudes in paths in degrees
+
+    :return: Fingerprint of every segment
+    """
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Encountered bad model type {model_type}.")
+
+    num_segments = len(gpx_data)
+    columns = [np.zeros((num_segments, 0))]
+
+    if model_type != "recurrent":
+        features = np.stack([gpx_data[name] for name in DATA_COLUMNS], axis=1)
+        columns.append(features / distance_resolution_m)
+
+    if model_type != "simple":
+        paths = np.nan_to_num(gpx_data["Path"], nan=0.0)
+        resolution = np.array(
+            [
+                coordinate_resolution_deg,
+                coordinate_resolution_deg,
+                distance_resolution_m,
+            ]
+        )
+        columns.append((paths / resolution).reshape(num_segments, -1))
+
+    quantized = np.ascontiguousarray(np.rint(np.hstack(columns)).astype(np.int64))
+    prefix = f"{FINGERPRINT_VERSION}:{model_type}:{model_fingerprint or ''}:".encode()
+
+    return [
+        hashlib.blake2b(
+            prefix + row.tobytes(), digest_size=FINGERPRINT_SIZE_BYTES
+        ).digest()
+        for row in quantized
+    ]
+
+
+class PredictionCache(object):
+    """
+    Least recently used cache of segment predictions.
+
+    Entries map fingerprints of model inputs, see get_segment_fingerprints, to the predicted moving time and log
+    variance. The model type and the fingerprint of the model are part of the key, so one cache can be shared by
+    several predictors, and predictions of a model are not used after it was retrained or its normalization
+    statistics changed, even if they were loaded from a file. The cache
+    is kept in memory and can be saved to an npz file, from which it is loaded again when it is constructed. All
+    methods can be called from several threads.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000000,
+        cache_file: Optional[str] = None,
+        distance_resolution_m: float = 0.01,
+        coordinate_resolution_deg: float = 1e-7,
+    ) -> None:
+        """
+        Construct PredictionCache object.
+
+        :param: max_entries:                Maximum number of entries, least recently used entries are evicted
+        :param: cache_file:                 npz file from which entries are loaded if it exists and to which save
+                                            writes them, the cache is only kept in memory if None
+        :param: distance_resolution_m:      Resolution of lengths and elevations in fingerprints
+        :param: coordinate_resolution_deg:  Resolution of coordinates in fingerprints
+        """
+        if max_entries <= 0:
+            raise ValueError("Maximum number of entries has to be positive.")
+
+        self.max_entries = max_entries
+        self.cache_file = cache_file
+        self.distance_resolution_m = distance_resolution_m
+        self.coordinate_resolution_deg = coordinate_resolution_deg
+        self.stats = FeatureCacheStats()
+
+        self._entries: "collections.OrderedDict[bytes, Tuple[float, float]]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+        if cache_file is not None and os.path.isfile(cache_file):
+            self.load(cache_file)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_keys(
+        self,
+        gpx_data: GpxSegmentStatsBatch,
+        model_type: str,
+        model_fingerprint: Optional[str] = None,
+    ) -> List[bytes]:
+        """
+        Return cache keys of track segments.
+
+        :param: gpx_data:           Statistics of track segments
+        :param: model_type:         Model type of the predictions
+        :param: model_fingerprint:  Hash identifying the model, see get_segment_fingerprints
+        """
+        return get_segment_fingerprints(
+            gpx_data,
+            model_type,
+            model_fingerprint,
+            self.distance_resolution_m,
+            self.coordinate_resolution_deg,
+        )
+
+    def lookup(self, keys: List[bytes]) -> Tuple[np.array, np.array]:
+        """
+        Look up predictions of segments.
+
+        :param: keys:   Cache keys, see get_keys
+
+        :return: Array of shape (len(keys), 2) with cached predictions and boolean array marking the keys found
+        """
+        predictions = np.zeros((len(keys), 2), dtype=np.float32)
+        found = np.zeros(len(keys), dtype=bool)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    predictions[i] = entry
+                    found[i] = True
+
+            num_found = int(np.sum(found))
+            self.stats.hits += num_found
+            self.stats.misses += len(keys) - num_found
+
+        return predictions, found
+
+    def store(self, keys: List[bytes], predictions: np.array) -> None:
+        """
+        Store predictions of segments and evict old entries if the cache is too large.
+
+        :param: keys:           Cache keys, see get_keys
+        :param: predictions:    Array of shape (len(keys), 2) with predicted moving times and log variances
+        """
+        with self._lock:
+            self.stats.stores += len(keys)
+            self.stats.evictions += self._add_entries(keys, predictions)
+
+    def _add_entries(self, keys: List[bytes], predictions: np.array) -> int:
+        for key, prediction in zip(keys, np.asarray(predictions).tolist()):
+            self._entries[key] = tuple(prediction)
+            self._entries.move_to_end(key)
+
+        num_evicted = max(0, len(self._entries) - self.max_entries)
+        for _ in range(num_evicted):
+            self._entries.popitem(last=False)
+
+        return num_evicted
+
+    def clear(self) -> None:
+        "Remove all cache entries."
+        with self._lock:
+            self._entries.clear()
+
+    def save(self, cache_file: Optional[str] = None) -> None:
+        """
+        Write cache entries in the order of their last use to an npz file.
+
+        The file is written to a temporary file first, so concurrent readers never see partial files.
+
+        :param: cache_file:     Name of npz file, the file given to the constructor if None
+        """
+        cache_file = self.cache_file if cache_file is None else cache_file
+        if cache_file is None:
+            raise ValueError("No cache file given.")
+
+        with self._lock:
+            keys = np.frombuffer(b"".join(self._entries), dtype=np.uint8).reshape(
+                -1, FINGERPRINT_SIZE_BYTES
+            )
+            predictions = np.array(list(self._entries.values()), dtype=np.float32)
+
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            suffix=".tmp", dir=os.path.dirname(os.path.abspath(cache_file))
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as output_file:
+                np.savez(
+                    output_file,
+                    version=FINGERPRINT_VERSION,
+                    resolutions=[
+                        self.distance_resolution_m,
+                        self.coordinate_resolution_deg,
+                    ],
+                    keys=keys,
+                    predictions=predictions.reshape(len(keys), 2),
+                )
+            os.replace(temporary_path, cache_file)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def load(self, cache_file: str) -> None:
+        """
+        Add entries of an npz file written by save.
+
+        Files written with another fingerprint version or other resolutions are ignored, since their keys differ.
+
+        :param: cache_file:     Name of npz file
+        """
+        with np.load(cache_file) as content:
+            if int(content["version"]) != FINGERPRINT_VERSION or not np.array_equal(
+                content["resolutions"],
+                [self.distance_resolution_m, self.coordinate_resolution_deg],
+            ):
+                return
+            keys = [key.tobytes() for key in content["keys"]]
+            predictions = content["predictions"]
+
+        # Entries are ordered by their last use, so only the most recently used ones are kept if there are too many
+        with self._lock:
+            self._add_entries(keys, predictions)
+
+    def report(self) -> str:
+        "Return summary of cache usage."
+        return "Prediction cache: {} hits, {} misses ({:.1%} hit rate), {} stored, {} evicted, {} entries".format(
+            self.stats.hits,
+            self.stats.misses,
+            self.stats.get_hit_rate(),
+            self.stats.stores,
+            self.stats.evictions,
+            len(self),
+        )
@@ -0,0 +1,609 @@
+"""Prediction of hiking times of GPX tracks with the trained models."""
+
+import contextlib
+import dataclasses
+import functools
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+import gpx_stream_parser
+import utils
+from array_segment import ArraySegment
+from bucketed_model import BucketedModel
+from config import (
+    BACKENDS,
+    DEFAULT_DATA_PREPARATION_CONFIG,
+    MODEL_TYPES,
+    PREDICTOR_TYPES,
+    STANDARD_MODEL_TYPE,
+    DataPreparationConfig,
+)
+from elevation_model import ElevationModel
+from feature_cache import get_file_hash
+from gpx_array_stats import get_track_summary
+from gpx_stats import GpxSegmentStatsBatch
+from normalization import NormalizationStats
+from numpy_model import NUMPY_MODEL_FILES, load_numpy_model
+from prediction_cache import PredictionCache
+from prepare_data import process_segments
+
+MODEL_DIRECTORIES: Dict[str, str] = {
+    model_type: f"model_hikingTimePrediction_{model_type}" for model_type in MODEL_TYPES
+}
+
+DEFAULT_STATS_FILE: str = "train_dataset_stats.csv"
+
+# Segments are not filtered during inference, since every part of a track contributes to its hiking time
+INFERENCE_DATA_PREPARATION_CONFIG: DataPreparationConfig = dataclasses.replace(
+    DEFAULT_DATA_PREPARATION_CONFIG, filter_bad_segments=False
+)
+
+GpxInput = Union[str, BinaryIO]
+
+TrackResult = Tuple[str, Optional["TrackPrediction"], Optional[str]]
+
+
+@dataclass
+class PreparedTrack:
+    "Segment statistics and standard estimate of a track, or the error that occurred while reading it."
+
+    file_name: str
+    gpx_data: Optional[GpxSegmentStatsBatch]
+    standard_estimate: Dict[str, Optional[float]]
+    error: Optional[str] = None
+
+
+@dataclass
+class TrackPrediction:
+    "Predicted and estimated hiking times of a track in seconds, without standard deviation for standard estimates."
+
+    moving_time_s: float
+    moving_time_std_s: Optional[float]
+    standard_estimate_s: float
+    true_moving_time_s: Optional[float] = None
+    num_segments: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        "Convert prediction to dictionary, for example for JSON output."
+        return dataclasses.asdict(self)
+
+
+def get_model_fingerprint(
+    model_type: str,
+    model_folder: str = ".",
+    stats_file: Optional[str] = None,
+    backend: str = "tensorflow",
+) -> str:
+    """
+    Compute hash of everything besides the inputs that determines the predictions of a trained model.
+
+    These are the model type, the backend, the content of the SavedModel directory or the exported model, and the
+    normalization statistics if the model uses them. Cached predictions are keyed by it, see prediction_cache, so
+    they are not reused after a model was retrained.
+
+    :param: model_type:     Model type, "simple", "recurrent" or "mixed"
+    :param: model_folder:   Folder containing the models and the normalization statistics
+    :param: stats_file:     File with normalization statistics, train_dataset_stats.csv in model_folder if None
+    :param: backend:        "tensorflow" or "numpy", see HikingTimePredictor
+
+    :return: Hexadecimal digest
+    """
+    if backend == "numpy":
+        file_names = [os.path.join(model_folder, NUMPY_MODEL_FILES[model_type])]
+    else:
+        model_dir = os.path.join(model_folder, MODEL_DIRECTORIES[model_type])
+        file_names = sorted(
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(model_dir)
+            for name in names
+        )
+    if model_type != "recurrent":
+        file_names.append(
+            os.path.join(model_folder, DEFAULT_STATS_FILE)
+            if stats_file is None
+            else stats_file
+        )
+
+    content = [f"{model_type}:{backend}"] + [
+        get_file_hash(file_name) for file_name in file_names
+    ]
+    return hashlib.sha256("\n".join(content).encode()).hexdigest()
+
+
+def get_model_inputs(
+    gpx_data: GpxSegmentStatsBatch,
+    model_type: str,
+    normalization_stats: Optional[NormalizationStats],
+) -> Union[np.array, List[np.array]]:
+    """
+    Convert segment statistics to inputs of a model.
+
+    :param: gpx_data:               Statistics of track segments
+    :param: model_type:             Model type, "simple", "recurrent" or "mixed"
+    :param: normalization_stats:    Statistics of the training set, not needed for recurrent models
+
+    :return: Array for simple and recurrent models, list of features and paths for mixed models
+    """
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Encountered bad model type {model_type}.")
+
+    if model_type != "recurrent":
+        features = normalization_stats.normalize(
+            np.stack([gpx_data[name] for name in normalization_stats.columns], axis=1)
+        )
+
+    if model_type != "simple":
+        # Elevations that are still missing, without elevation model or outside of its tiles, are set to zero
+        paths = np.nan_to_num(gpx_data["Path"], nan=0.0).astype(np.float32)
+
+    if model_type == "simple":
+        return features
+    if model_type == "recurrent":
+        return paths
+    return [features, paths]
+
+
+def combine_segment_predictions(predictions: np.array) -> Dict[str, float]:
+    """
+    Sum predictions of segments of a track.
+
+    :param: predictions:    Array of shape (num_segments, 2) with predicted moving times and log variances
+
+    :return: Dictionary with moving time and its standard deviation in seconds
+    """
+    return {
+        "moving_time_s": float(np.sum(predictions[:, 0])),
+        "moving_time_std_s": float(np.sqrt(np.sum(np.exp(predictions[:, 1])))),
+    }
+
+
+def get_standard_estimate(
+    track_segments: List[ArraySegment],
+) -> Dict[str, Optional[float]]:
+    """
+    Compute the standard estimate of the walking time and the true moving time of a track from its parsed segments.
+
+    :param: track_segments: Array segments of the track, before smoothing
+
+    :return: Dictionary with standard estimate and true moving time in seconds, None if there are no timestamps
+    """
+    track_summary = get_track_summary(track_segments)
+    standard_estimate = utils.compute_standard_walking_time(
+        track_summary.length_2d, track_summary.uphill, track_summary.downhill
+    )
+
+    return {
+        "standard_estimate_s": float(standard_estimate),
+        "true_moving_time_s": track_summary.moving_time or None,
+    }
+
+
+def parse_and_prepare_track(
+    gpx_input: GpxInput,
+    config: DataPreparationConfig = INFERENCE_DATA_PREPARATION_CONFIG,
+    elevation_model: Optional[ElevationModel] = None,
+) -> Tuple[GpxSegmentStatsBatch, Dict[str, Optional[float]]]:
+    """
+    Parse a GPX file once and derive both the segment statistics and the standard estimate from the parsed data.
+
+    The standard estimate uses the first track, as the complete track of a hike, and is computed before the segments
+    are smoothed and split in place. The segment statistics use all tracks.
+
+    :param: gpx_input:          Name of GPX file or binary file object
+    :param: config:             Configuration of data preparation
+    :param: elevation_model:    Optional elevation model, whose elevations are used for both results
+
+    :return: Statistics of track segments and dictionary with standard estimate and true moving time
+    """
+    tracks = gpx_stream_parser.parse_gpx_file_tracks(gpx_input)
+    if len(tracks) == 0:
+        raise ValueError("GPX file does not contain any tracks.")
+
+    if elevation_model is not None:
+        elevation_model.correct_elevations(
+            [segment for track_segments in tracks for segment in track_segments]
+        )
+
+    standard_estimate = get_standard_estimate(tracks[0])
+    gpx_data = process_segments(
+        [segment for track_segments in tracks for segment in track_segments], config
+    )
+
+    return gpx_data, standard_estimate
+
+
+def compute_standard_estimate(
+    gpx_input: GpxInput, elevation_model: Optional[ElevationModel] = None
+) -> Dict[str, Optional[float]]:
+    """
+    Compute the standard estimate of the walking time and the true moving time of the first track in a GPX file.
+
+    :param: gpx_input:          Name of GPX file or binary file object
+    :param: elevation_model:    Optional elevation model for correcting elevations of the track
+
+    :return: Dictionary with standard estimate and true moving time in seconds, None if there are no timestamps
+    """
+    tracks = gpx_stream_parser.parse_gpx_file_tracks(gpx_input)
+    if len(tracks) == 0:
+        raise ValueError("GPX file does not contain any tracks.")
+
+    if elevation_model is not None:
+        elevation_model.correct_elevations(tracks[0])
+
+    return get_standard_estimate(tracks[0])
+
+
+def prepare_track(
+    file_name: str, elevation_model: Optional[ElevationModel] = None
+) -> PreparedTrack:
+    """
+    Extract segment statistics and the standard estimate of a GPX file, catching errors.
+
+    :param: file_name:          Name of GPX file
+    :param: elevation_model:    Optional elevation model for correcting elevations
+
+    :return: Prepared track, with error message instead of data if the file could not be processed
+    """
+    try:
+        return PreparedTrack(
+            file_name,
+            *parse_and_prepare_track(
+                file_name, INFERENCE_DATA_PREPARATION_CONFIG, elevation_model
+            ),
+        )
+    except Exception as e:
+        return PreparedTrack(file_name, None, {}, error=f"{type(e).__name__}: {e}")
+
+
+def estimate_track(
+    file_name: str, elevation_model: Optional[ElevationModel] = None
+) -> TrackResult:
+    """
+    Compute the standard estimate of a GPX file as prediction, catching errors.
+
+    :param: file_name:          Name of GPX file
+    :param: elevation_model:    Optional elevation model for correcting elevations
+
+    :return: File name, prediction and error message, as for HikingTimePredictor.predict_tracks
+    """
+    try:
+        return (
+            file_name,
+            StandardTimePredictor(elevation_model).predict_track(file_name),
+            None,
+        )
+    except Exception as e:
+        return file_name, None, f"{type(e).__name__}: {e}"
+
+
+@contextlib.contextmanager
+def map_files(
+    function: Callable[[str], Any], file_list: List[str], jobs: int = 1
+) -> Iterator[Iterable[Any]]:
+    """
+    Apply function to files, in a pool of worker processes if jobs is larger than 1.
+
+    :param: function:   Picklable function of a file name
+    :param: file_list:  List of file names
+    :param: jobs:       Number of worker processes
+
+    :return: Context manager yielding an iterable of results in the order of file_list
+    """
+    if jobs > 1 and len(file_list) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunk_size = max(1, min(64, len(file_list) // (jobs * 4)))
+            yield executor.map(function, file_list, chunksize=chunk_size)
+    else:
+        yield map(function, file_list)
+
+
+class StandardTimePredictor(object):
+    """
+    Predictor returning the standard estimate of the walking time, see utils.compute_standard_walking_time.
+
+    It needs neither a trained model nor TensorFlow, so it starts quickly.
+    """
+
+    model_type: str = STANDARD_MODEL_TYPE
+
+    def __init__(self, elevation_model: Optional[ElevationModel] = None) -> None:
+        """
+        Construct StandardTimePredictor object.
+
+        :param: elevation_model:    Elevation model filling in or replacing elevations of tracks, GPS elevations are
+                                    used if None
+        """
+        self.elevation_model = elevation_model
+
+    def get_tracing_count(self) -> Optional[int]:
+        "Return None, since no model is traced."
+        return None
+
+    def predict_track(self, gpx_input: GpxInput) -> TrackPrediction:
+        """
+        Estimate hiking time of a GPX track.
+
+        :param: gpx_input:  Name of GPX file or binary file object
+
+        :return: Standard estimate as moving time, without standard deviation
+        """
+        standard_estimate = compute_standard_estimate(gpx_input, self.elevation_model)
+        return TrackPrediction(
+            standard_estimate["standard_estimate_s"], None, **standard_estimate
+        )
+
+    def predict_tracks(
+        self,
+        file_list: List[str],
+        batch_size: int = 65536,
+        jobs: int = 1,
+    ) -> Generator[TrackResult, None, None]:
+        """
+        Estimate hiking times of many GPX tracks.
+
+        :param: file_list:      List of GPX file names
+        :param: batch_size:     Ignored, since no model is called
+        :param: jobs:           Number of worker processes for reading tracks
+
+        :return: Generator of file name, prediction and error message for every file in the order of file_list
+        """
+        with map_files(
+            functools.partial(estimate_track, elevation_model=self.elevation_model),
+            file_list,
+            jobs,
+        ) as results:
+            yield from results
+
+
+class HikingTimePredictor(object):
+    "Model for predicting hiking times of tracks, loaded once and reused for many predictions."
+
+    def __init__(
+        self,
+        model_type: str,
+        model_folder: str = ".",
+        stats_file: Optional[str] = None,
+        bucket_sizes: Optional[List[int]] = None,
+        backend: str = "tensorflow",
+        prediction_cache: Optional[PredictionCache] = None,
+        elevation_model: Optional[ElevationModel] = None,
+    ) -> None:
+        """
+        Construct HikingTimePredictor object and load the model.
+
+        :param: model_type:     Model type, "simple", "recurrent" or "mixed"
+        :param: model_folder:   Folder containing the models and the normalization statistics
+        :param: stats_file:     File with normalization statistics, train_dataset_stats.csv in model_folder if None
+        :param: bucket_sizes:   Batch sizes to which segments are padded, see bucketed_model.BucketedModel, the model
+                                is called with any batch size if None
+        :param: backend:        "tensorflow" for the SavedModel or "numpy" for the exported model, see numpy_model
+        :param: prediction_cache:   Cache of segment predictions, which may be shared by several predictors, every
+                                    segment is predicted by the model if None
+        :param: elevation_model:    Elevation model filling in or replacing elevations of tracks, GPS elevations are
+                                    used if None
+        """
+        if model_type not in MODEL_TYPES:
+            raise ValueError(f"Encountered bad model type {model_type}.")
+        if backend not in BACKENDS:
+            raise ValueError(f"Encountered bad backend {backend}.")
+
+        self.model_type = model_type
+        self.prediction_cache = prediction_cache
+        self.elevation_model = elevation_model
+
+        # Cached predictions of other weights, statistics or backends must not be used, see get_model_fingerprint
+        self.model_fingerprint: Optional[str] = None
+        if prediction_cache is not None:
+            self.model_fingerprint = get_model_fingerprint(
+                model_type, model_folder, stats_file, backend
+            )
+
+        if backend == "numpy":
+            if bucket_sizes is not None:
+                raise ValueError(
+                    "Bucket sizes are only supported by the TensorFlow backend."
+                )
+            self.model = load_numpy_model(model_type, model_folder)
+        else:
+            # TensorFlow is only imported when a model is loaded, so worker processes preparing data never initialize it
+            import tensorflow as tf
+
+            self.model = tf.saved_model.load(
+                os.path.join(model_folder, MODEL_DIRECTORIES[model_type])
+            )
+            if bucket_sizes is not None:
+                self.model = BucketedModel(self.model, model_type, bucket_sizes)
+
+        self.normalization_stats: Optional[NormalizationStats] = None
+        if model_type != "recurrent":
+            self.normalization_stats = NormalizationStats.from_csv(
+                os.path.join(model_folder, DEFAULT_STATS_FILE)
+                if stats_file is None
+                else stats_file
+            )
+
+    def get_tracing_count(self) -> Optional[int]:
+        "Return number of times the model was traced, None if batch sizes are not bucketed."
+        if isinstance(self.model, BucketedModel):
+            return self.model.get_tracing_count()
+        return None
+
+    def predict_segments(self, gpx_data: GpxSegmentStatsBatch) -> np.array:
+        """
+        Predict moving times of track segments.
+
+        With a prediction cache, only segments without cached prediction are passed to the model, and segments with
+        the same fingerprint are predicted once.
+
+        :param: gpx_data:   Statistics of track segments
+
+        :return: Array of shape (num_segments, 2) with predicted moving times and log variances
+        """
+        if len(gpx_data) == 0:
+            return np.zeros((0, 2), dtype=np.float32)
+        if self.prediction_cache is None:
+            return self._predict_model(gpx_data)
+
+        keys = self.prediction_cache.get_keys(
+            gpx_data, self.model_type, self.model_fingerprint
+        )
+        predictions, found = self.prediction_cache.lookup(keys)
+        if np.all(found):
+            return predictions
+
+        missing_keys: Dict[bytes, int] = {}
+        for i in np.flatnonzero(~found):
+            missing_keys.setdefault(keys[i], i)
+        missing_predictions = self._predict_model(
+            gpx_data.select(np.fromiter(missing_keys.values(), dtype=int))
+        )
+        self.prediction_cache.store(list(missing_keys), missing_predictions)
+
+        key_predictions = dict(zip(missing_keys, missing_predictions))
+        for i in np.flatnonzero(~found):
+            predictions[i] = key_predictions[keys[i]]
+
+        return predictions
+
+    def _predict_model(self, gpx_data: GpxSegmentStatsBatch) -> np.array:
+        inputs = get_model_inputs(gpx_data, self.model_type, self.normalization_stats)
+        return np.asarray(self.model(inputs))
+
+    def predict_track(self, gpx_input: GpxInput) -> TrackPrediction:
+        """
+        Predict hiking time of a GPX track.
+
+        :param: gpx_input:  Name of GPX file or binary file object
+
+        :return: Predicted moving time with standard deviation and standard estimate
+        """
+        gpx_data, standard_estimate = parse_and_prepare_track(
+            gpx_input, INFERENCE_DATA_PREPARATION_CONFIG, self.elevation_model
+        )
+
+        return TrackPrediction(
+            **combine_segment_predictions(self.predict_segments(gpx_data)),
+            **standard_estimate,
+            num_segments=len(gpx_data),
+        )
+
+    def predict_tracks(
+        self,
+        file_list: List[str],
+        batch_size: int = 65536,
+        jobs: int = 1,
+    ) -> Generator[TrackResult, None, None]:
+        """
+        Predict hiking times of many GPX tracks, with the segments of several tracks in one model call.
+
+        Tracks are prepared in a pool of worker processes if jobs is larger than 1. Their segments are collected until
+        a batch has at least batch_size segments, then predicted at once and split back into tracks.
+
+        :param: file_list:      List of GPX file names
+        :param: batch_size:     Minimum number of segments per model call, except for the last one
+        :param: jobs:           Number of worker processes for reading and preparing tracks
+
+        :return: Generator of file name, prediction and error message for every file in the order of file_list
+        """
+        pending: List[PreparedTrack] = []
+        num_pending_segments = 0
+
+        with map_files(
+            functools.partial(prepare_track, elevation_model=self.elevation_model),
+            file_list,
+            jobs,
+        ) as prepared_tracks:
+            for prepared_track in prepared_tracks:
+                pending.append(prepared_track)
+                if prepared_track.gpx_data is not None:
+                    num_pending_segments += len(prepared_track.gpx_data)
+
+                if num_pending_segments >= batch_size:
+                    yield from self._predict_prepared_tracks(pending)
+                    pending, num_pending_segments = [], 0
+
+        yield from self._predict_prepared_tracks(pending)
+
+    def _predict_prepared_tracks(
+        self, prepared_tracks: List[PreparedTrack]
+    ) -> Generator[TrackResult, None, None]:
+        batches = [
+            track.gpx_data for track in prepared_tracks if track.gpx_data is not None
+        ]
+        if len(batches) == 0:
+            predictions = np.zeros((0, 2))
+        else:
+            predictions = self.predict_segments(
+                GpxSegmentStatsBatch.concatenate(batches)
+            )
+
+        offset = 0
+        for track in prepared_tracks:
+            if track.gpx_data is None:
+                yield track.file_name, None, track.error
+                continue
+
+            num_segments = len(track.gpx_data)
+            yield track.file_name, TrackPrediction(
+                **combine_segment_predictions(
+                    predictions[offset : offset + num_segments]
+                ),
+                **track.standard_estimate,
+                num_segments=num_segments,
+            ), None
+            offset += num_segments
+
+
+def load_predictor(
+    model_type: str,
+    model_folder: str = ".",
+    stats_file: Optional[str] = None,
+    bucket_sizes: Optional[List[int]] = None,
+    backend: str = "tensorflow",
+    prediction_cache: Optional[PredictionCache] = None,
+    elevation_model: Optional[ElevationModel] = None,
+) -> Union[StandardTimePredictor, HikingTimePredictor]:
+    """
+    Load predictor of a model type, importing TensorFlow only for trained models with the TensorFlow backend.
+
+    :param: model_type:     "standard" or model type of a trained model, "simple", "recurrent" or "mixed"
+    :param: model_folder:   Folder containing the model directories and the normalization statistics
+    :param: stats_file:     File with normalization statistics, train_dataset_stats.csv in model_folder if None
+    :param: bucket_sizes:   Batch sizes to which segments are padded for trained models, no padding if None
+    :param: backend:        "tensorflow" or "numpy", see HikingTimePredictor
+    :param: prediction_cache:   Cache of segment predictions of trained models, see HikingTimePredictor
+    :param: elevation_model:    Elevation model for correcting elevations of tracks, see elevation_model
+
+    :return: Predictor with methods predict_track and predict_tracks
+    """
+    if model_type not in PREDICTOR_TYPES:
+        raise ValueError(f"Encountered bad model type {model_type}.")
+
+    if model_type == STANDARD_MODEL_TYPE:
+        return StandardTimePredictor(elevation_model)
+    return HikingTimePredictor(
+        model_type,
+        model_folder,
+        stats_file,
+        bucket_sizes,
+        backend,
+        prediction_cache,
+        elevation_model,
+    )
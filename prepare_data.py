@@ -1,22 +1,43 @@
 """Script for formatting GPX data in a format suitable for machine learning."""
 
-import os
 import argparse
-import glob
-from typing import Tuple, List
-
-import h5py
-
+import collections
+import contextlib
+import functools
+import itertools
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Union,
+)
+
+import numpy as np
+
+import gpx_array_stats
 import gpx_stats
+import gpx_stream_parser
+from array_segment import ArraySegment
 from config import DataPreparationConfig, DEFAULT_DATA_PREPARATION_CONFIG
-from utils import get_pseudo_probability_for_path
+from elevation_model import ElevationModel
+from feature_cache import FeatureCache
+from gpx_discovery import discover_gpx_files
 
 
-def parse_command_line_arguments() -> Tuple[str, str]:
+def parse_command_line_arguments() -> Dict[str, Any]:
     """
     Parse command line arguments.
 
-    :return:    Name of base folder and filter key as stings
+    :return:    Dictionary with name of base folder and filter key as stings, number of jobs, cache folder or None,
+                maximum cache size in MB, manifest file or None, compression type or None, whether to store
+                contiguous datasets, whether to store data as float32, folder with elevation tiles or None and
+                whether to replace all elevations
     """
     description_string = "Prepare data for estimation of walking times from GPX tracks."
     parser = argparse.ArgumentParser(description=description_string)
@@ -27,9 +48,65 @@ def parse_command_line_arguments() -> Tuple[str, str]:
         "filter_key",
         help="Key for filtering GPX tracks," 'should be in path (for example "Hiking")',
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes for processing GPX files in parallel.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Folder for caching statistics of processed GPX files between runs.",
+    )
+    parser.add_argument(
+        "--cache-max-size-mb",
+        type=float,
+        default=1024.0,
+        help="Maximum size of the cache in MB, least recently used entries are evicted.",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="File for storing the list of GPX files, so rescans only list changed directories.",
+    )
+    # h5py is only imported for writing datasets, so inference can use this module without it
+    from hdf5_writer import COMPRESSION_TYPES
+
+    parser.add_argument(
+        "--compression",
+        choices=[str(compression) for compression in COMPRESSION_TYPES],
+        default="None",
+        help="Compression of HDF5 datasets.",
+    )
+    parser.add_argument(
+        "--contiguous",
+        action="store_true",
+        help="Store uncompressed contiguous datasets, which are memory-mapped when loaded.",
+    )
+    parser.add_argument(
+        "--float32",
+        action="store_true",
+        help="Store data in single instead of double precision.",
+    )
+    parser.add_argument(
+        "--dem-folder",
+        default=None,
+        help="Folder with SRTM tiles (.hgt files) for filling in missing elevations.",
+    )
+    parser.add_argument(
+        "--replace-elevations",
+        action="store_true",
+        help="Replace all GPS elevations by elevations of the tiles in --dem-folder.",
+    )
     cmd_line_args = vars(parser.parse_args())
 
-    return cmd_line_args["base_folder"], cmd_line_args["filter_key"]
+    if cmd_line_args["compression"] == "None":
+        cmd_line_args["compression"] = None
+    if cmd_line_args["contiguous"] and cmd_line_args["compression"] is not None:
+        parser.error("Contiguous datasets cannot be compressed.")
+
+    return cmd_line_args
 
 
 def get_gpx_file_list(folder: str, key_for_filtering: str) -> List[str]:
@@ -41,91 +118,273 @@ def get_gpx_file_list(folder: str, key_for_filtering: str) -> List[str]:
 
     :return: List of paths
     """
-    return [
-        file_path
-        for file_path in glob.iglob(os.path.join(folder, "**"), recursive=True)
-        if file_path.endswith(".gpx") and key_for_filtering in file_path
-    ]
+    return [entry.path for entry in discover_gpx_files(folder, key_for_filtering)]
 
 
 def write_data_to_hdf5(
-    gpx_data_list: List[gpx_stats.GpxSegmentStats],
+    gpx_data: Union[gpx_stats.GpxSegmentStatsBatch, List[gpx_stats.GpxSegmentStats]],
     file_name: str,
     num_points_in_path: int,
+    **kwargs,
 ) -> None:
     """
     Write GPX dataset to hdf5 file.
 
-    :param: gpx_data_list:           List of objects containing statistical data on GPX track segments
+    :param: gpx_data:                Statistical data on GPX track segments, as batch or list of objects
     :param: file_name:               Name of file for storing data
     :param: num_points_path:         Maximum number of points in path feature
+    :param: kwargs:                  Options of hdf5_writer.GpxStatsHdf5Writer, for example compression or dtype
     """
-    len_gpx_data_list: int = len(gpx_data_list)
+    from hdf5_writer import write_batches_to_hdf5
 
-    with h5py.File(file_name, "w") as hdf5file:
-        dataset_items = {}
-        for name in gpx_stats.GpxSegmentStats.get_header():
-            shape = (
-                (len_gpx_data_list, num_points_in_path, 3)
-                if "Path" in name
-                else (len_gpx_data_list,)
-            )
-            dataset_items[name] = hdf5file.create_dataset(name, shape, dtype=float)
+    if not isinstance(gpx_data, gpx_stats.GpxSegmentStatsBatch):
+        gpx_data = gpx_stats.GpxSegmentStatsBatch.from_stats_list(
+            gpx_data, num_points_in_path
+        )
 
-        for i in range(len_gpx_data_list):
-            stats = gpx_data_list[i].to_dict()
-            for name in stats.keys():
-                dataset_items[name][i] = stats[name]
+    write_batches_to_hdf5([gpx_data], file_name, num_points_in_path, **kwargs)
 
 
-def extract_segment_data(
-    file_list: List[str], data_preparation_config: DataPreparationConfig
-) -> List[gpx_stats.GpxSegmentStats]:
-    # Parse gpx files and return track segments for training set
-    gpx_segments_list = gpx_stats.parse_gpx_files_return_segments(file_list)
-    gpx_stats.smoothen_coordinates(gpx_segments_list)
+def process_segments(
+    segments_list: List[ArraySegment],
+    data_preparation_config: DataPreparationConfig,
+    elevation_model: Optional[ElevationModel] = None,
+) -> gpx_stats.GpxSegmentStatsBatch:
+    """
+    Smoothen, filter and split track segments and extract their statistics.
+
+    :param: segments_list:              List of array segments
+    :param: data_preparation_config:    Configuration of data preparation
+    :param: elevation_model:            Optional elevation model filling in or replacing elevations before smoothing
 
-    gpx_segments_filtered_list = gpx_stats.filter_segments(
-        gpx_segments_list, min_distance_m=data_preparation_config.min_distance_m
+    :return: Batch of statistics of the processed segments
+    """
+    if elevation_model is not None:
+        elevation_model.correct_elevations(segments_list)
+
+    gpx_array_stats.smoothen_coordinates(
+        segments_list,
+        window_size=data_preparation_config.smoothing_window_size,
+        kernel=data_preparation_config.smoothing_kernel,
     )
-    gpx_split_segments_list = gpx_stats.split_segments_by_length(
-        gpx_segments_filtered_list, max_length_m=data_preparation_config.max_length_m
+
+    segments_filtered_list = gpx_array_stats.filter_segments(
+        segments_list, min_distance_m=data_preparation_config.min_distance_m
+    )
+    split_segments_list = gpx_array_stats.split_segments_by_length(
+        segments_filtered_list,
+        max_length_m=data_preparation_config.max_length_m,
+        split_mode=data_preparation_config.split_mode,
     )
 
     if data_preparation_config.filter_bad_segments:
-        gpx_split_segments_list = gpx_stats.filter_bad_segments(
-            gpx_split_segments_list, data_preparation_config
+        split_segments_list = gpx_array_stats.filter_bad_segments(
+            split_segments_list, data_preparation_config
         )
 
     # Get track statistics
-    return gpx_stats.extract_stats(
-        gpx_split_segments_list,
+    return gpx_array_stats.extract_stats_batch(
+        split_segments_list,
         num_points_path=data_preparation_config.num_points_path,
     )
 
 
+def extract_file_segment_data(
+    file_name: Union[str, BinaryIO],
+    data_preparation_config: DataPreparationConfig,
+    elevation_model: Optional[ElevationModel] = None,
+) -> gpx_stats.GpxSegmentStatsBatch:
+    """
+    Parse a single GPX file and extract statistics of its processed track segments.
+
+    :param: file_name:                  Name of GPX file or binary file object
+    :param: data_preparation_config:    Configuration of data preparation
+    :param: elevation_model:            Optional elevation model for correcting elevations, see process_segments
+
+    :return: Batch of statistics of the segments in the file
+    """
+    return process_segments(
+        list(gpx_stream_parser.parse_gpx_file(file_name)),
+        data_preparation_config,
+        elevation_model,
+    )
+
+
+def map_in_window(
+    executor: Executor, function: Callable, items: Iterable, window_size: int
+) -> Generator[Any, None, None]:
+    """
+    Apply function to items in an executor and yield the results in the order of the items, like executor.map.
+
+    executor.map submits all items at once, so results pile up in memory if they are consumed more slowly than they
+    are computed. Here at most window_size items are submitted but not yet yielded, and a new item is submitted
+    whenever a result is yielded.
+
+    :param: executor:       Executor, for example a process pool
+    :param: function:       Function of one item
+    :param: items:          Items, only read as far as needed
+    :param: window_size:    Maximum number of pending results
+    """
+    items = iter(items)
+    futures = collections.deque(
+        executor.submit(function, item) for item in itertools.islice(items, window_size)
+    )
+    try:
+        while futures:
+            future = futures.popleft()
+            for item in itertools.islice(items, 1):
+                futures.append(executor.submit(function, item))
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def generate_segment_data(
+    file_list: List[str],
+    data_preparation_config: DataPreparationConfig,
+    jobs: int = 1,
+    feature_cache: Optional[FeatureCache] = None,
+    elevation_model: Optional[ElevationModel] = None,
+) -> Generator[gpx_stats.GpxSegmentStatsBatch, None, None]:
+    """
+    Extract statistics of processed track segments of GPX files and yield them file by file.
+
+    Files are processed independently, optionally in a pool of worker processes. The batches are yielded in the order
+    of file_list, so the output does not depend on the number of jobs, and at most four files per job are processed
+    ahead of the consumer, see map_in_window. If a feature cache is given, only files that
+    are not in the cache are processed.
+
+    :param: file_list:                  List of GPX file names
+    :param: data_preparation_config:    Configuration of data preparation
+    :param: jobs:                       Number of worker processes, files are processed serially if 1
+    :param: feature_cache:              Optional cache of statistics of previously processed files
+    :param: elevation_model:            Optional elevation model for correcting elevations, see process_segments
+    """
+    cache_keys: List[Optional[str]] = [None] * len(file_list)
+    is_cached = [False] * len(file_list)
+
+    if feature_cache is not None:
+        for idx, file_name in enumerate(file_list):
+            cache_keys[idx] = feature_cache.get_key(
+                file_name, data_preparation_config, elevation_model
+            )
+            is_cached[idx] = feature_cache.contains(cache_keys[idx])
+
+    missing_files = [
+        file_name for file_name, cached in zip(file_list, is_cached) if not cached
+    ]
+
+    extract = functools.partial(
+        extract_file_segment_data,
+        data_preparation_config=data_preparation_config,
+        elevation_model=elevation_model,
+    )
+
+    with contextlib.ExitStack() as stack:
+        if jobs > 1 and len(missing_files) > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+            missing_batches = map_in_window(
+                executor, extract, missing_files, window_size=jobs * 4
+            )
+        else:
+            missing_batches = map(extract, missing_files)
+
+        for idx, file_name in enumerate(file_list):
+            batch = feature_cache.load(cache_keys[idx]) if is_cached[idx] else None
+
+            if batch is None:
+                # Entries can disappear between lookup and loading if the cache is shared
+                batch = (
+                    next(missing_batches) if not is_cached[idx] else extract(file_name)
+                )
+
+                if feature_cache is not None:
+                    feature_cache.store(cache_keys[idx], batch)
+
+            yield batch
+
+    print(
+        "Finished processing {} files, {} taken from cache.".format(
+            len(file_list), len(file_list) - len(missing_files)
+        )
+    )
+
+
+def extract_segment_data(
+    file_list: List[str],
+    data_preparation_config: DataPreparationConfig,
+    jobs: int = 1,
+    feature_cache: Optional[FeatureCache] = None,
+    elevation_model: Optional[ElevationModel] = None,
+) -> gpx_stats.GpxSegmentStatsBatch:
+    """
+    Extract statistics of processed track segments of GPX files.
+
+    :param: file_list:                  List of GPX file names
+    :param: data_preparation_config:    Configuration of data preparation
+    :param: jobs:                       Number of worker processes, files are processed serially if 1
+    :param: feature_cache:              Optional cache of statistics of previously processed files
+    :param: elevation_model:            Optional elevation model for correcting elevations, see process_segments
+
+    :return: Batch of statistics of the segments in all files
+    """
+    batches = list(
+        generate_segment_data(
+            file_list,
+            data_preparation_config,
+            jobs=jobs,
+            feature_cache=feature_cache,
+            elevation_model=elevation_model,
+        )
+    )
+
+    if len(batches) == 0:
+        return gpx_stats.GpxSegmentStatsBatch.from_stats_list(
+            [], data_preparation_config.num_points_path
+        )
+
+    return gpx_stats.GpxSegmentStatsBatch.concatenate(batches)
+
+
 if __name__ == "__main__":
-    base_folder, filter_key = parse_command_line_arguments()
+    cmd_line_args = parse_command_line_arguments()
+    base_folder, filter_key = cmd_line_args["base_folder"], cmd_line_args["filter_key"]
+    jobs, cache_dir = cmd_line_args["jobs"], cmd_line_args["cache_dir"]
     print("Recursively searching for GPX files in '{}'".format(base_folder))
     print("and filtering files that contain '{}' in their path.".format(filter_key))
 
     data_prep_config = DEFAULT_DATA_PREPARATION_CONFIG
 
-    # Create list with all gpx files from base_folder that contain filter_key in their path
-    file_list_filtered = get_gpx_file_list(base_folder, filter_key)
+    feature_cache = (
+        FeatureCache(
+            cache_dir,
+            max_size_bytes=int(cmd_line_args["cache_max_size_mb"] * 1e6),
+        )
+        if cache_dir is not None
+        else None
+    )
 
-    # Create train / test split of files
+    elevation_model = (
+        ElevationModel(
+            cmd_line_args["dem_folder"], replace=cmd_line_args["replace_elevations"]
+        )
+        if cmd_line_args["dem_folder"] is not None
+        else None
+    )
+
+    # Find all gpx files from base_folder that contain filter_key in their path and assign them to dataset splits
     train_fraction: float = 0.8
+    gpx_file_entries = discover_gpx_files(
+        base_folder,
+        filter_key,
+        manifest_file=cmd_line_args["manifest"],
+        train_fraction=train_fraction,
+    )
     train_file_list = [
-        file_name
-        for file_name in file_list_filtered
-        if get_pseudo_probability_for_path(file_name) < train_fraction
-    ]
-    test_file_list = [
-        file_name
-        for file_name in file_list_filtered
-        if get_pseudo_probability_for_path(file_name) >= train_fraction
+        entry.path for entry in gpx_file_entries if entry.split == "train"
     ]
+    test_file_list = [entry.path for entry in gpx_file_entries if entry.split == "test"]
 
     # Make sure there is no overlap between the dataset splits
     assert not set(train_file_list).intersection(test_file_list)
@@ -136,22 +395,37 @@ if __name__ == "__main__":
     with open("test_file_list.txt", "w") as test_files_output:
         test_files_output.writelines([name + "\n" for name in test_file_list])
 
-    # Parse gpx files and return track segments for training set
-    gpx_data_train = extract_segment_data(train_file_list, data_prep_config)
+    from hdf5_writer import write_batches_to_hdf5
 
-    write_data_to_hdf5(
-        gpx_data_train,
-        "hiking_data_training.hdf5",
-        data_prep_config.num_points_path,
+    hdf5_options = dict(
+        compression=cmd_line_args["compression"],
+        shuffle=cmd_line_args["compression"] is not None,
+        contiguous=cmd_line_args["contiguous"],
+        dtype=np.float32 if cmd_line_args["float32"] else np.float64,
     )
 
-    # Parse gpx files and return track segments for test set
-    gpx_data_test = extract_segment_data(test_file_list, data_prep_config)
-
-    write_data_to_hdf5(
-        gpx_data_test,
-        "hiking_data_test.hdf5",
-        data_prep_config.num_points_path,
-    )
+    # Parse gpx files and stream statistics of track segments for each dataset split to its file
+    for file_list, output_file_name in [
+        (train_file_list, "hiking_data_training.hdf5"),
+        (test_file_list, "hiking_data_test.hdf5"),
+    ]:
+        num_segments = write_batches_to_hdf5(
+            generate_segment_data(
+                file_list,
+                data_prep_config,
+                jobs=jobs,
+                feature_cache=feature_cache,
+                elevation_model=elevation_model,
+            ),
+            output_file_name,
+            data_prep_config.num_points_path,
+            **hdf5_options,
+        )
+        print("Wrote {} segments to '{}'.".format(num_segments, output_file_name))
 
     print("Finished writing statistics about tracks to hdf5 file.")
+
+    if feature_cache is not None:
+        print(feature_cache.report())
+    if elevation_model is not None:
+        print(elevation_model.report())
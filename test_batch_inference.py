@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from batch_inference import (
+    OUTPUT_COLUMNS,
+    ResultWriter,
+    collect_input_files,
+    get_output_format,
+    get_result_row,
+)
+from predictor import TrackPrediction
+from test_gpx_discovery import create_files
+
+
+class TestCollectInputFiles(unittest.TestCase):
+    def test_directories_globs_and_lists(self):
+        with tempfile.TemporaryDirectory() as folder:
+            create_files(folder, ["a/1.gpx", "a/b/2.gpx", "c/3.gpx", "c/4.gpx"])
+            file_list_name = os.path.join(folder, "files.txt")
+            with open(file_list_name, "w") as file_list:
+                file_list.write(os.path.join(folder, "c/4.gpx") + "\n\n")
+
+            file_names = collect_input_files(
+                [
+                    os.path.join(folder, "a"),
+                    os.path.join(folder, "c", "*.gpx"),
+                    os.path.join(folder, "a/1.gpx"),
+                ],
+                file_list_name,
+            )
+
+        self.assertEqual(
+            [os.path.relpath(name, folder) for name in file_names],
+            ["a/1.gpx", "a/b/2.gpx", "c/3.gpx", "c/4.gpx"],
+        )
+
+
+class TestResultWriter(unittest.TestCase):
+    def setUp(self):
+        prediction = TrackPrediction(3600.0, 60.0, 4000.0, None, 12)
+        self.rows = [
+            get_result_row("a.gpx", prediction, None),
+            get_result_row("b.gpx", None, "ParseError: no element found"),
+        ]
+
+    def test_csv(self):
+        output_file = io.StringIO()
+        writer = ResultWriter(output_file, "csv")
+        for row in self.rows:
+            writer.write(row)
+
+        rows = list(csv.DictReader(io.StringIO(output_file.getvalue())))
+        self.assertEqual(list(rows[0].keys()), OUTPUT_COLUMNS)
+        self.assertEqual(float(rows[0]["moving_time_s"]), 3600.0)
+        self.assertEqual(rows[1]["moving_time_s"], "")
+
+    def test_jsonl(self):
+        output_file = io.StringIO()
+        writer = ResultWriter(output_file, "jsonl")
+        for row in self.rows:
+            writer.write(row)
+
+        rows = [json.loads(line) for line in output_file.getvalue().splitlines()]
+        self.assertEqual(rows[0]["num_segments"], 12)
+        self.assertIsNone(rows[1]["moving_time_s"])
+
+    def test_output_format(self):
+        self.assertEqual(get_output_format("results.jsonl"), "jsonl")
+        self.assertEqual(get_output_format("results.csv"), "csv")
+
+
+if __name__ == "__main__":
+    unittest.main()
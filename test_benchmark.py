@@ -0,0 +1,156 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmark import (
+    BenchmarkResult,
+    benchmark_startup,
+    benchmark_stops,
+    compare_results,
+    generate_track,
+    generate_track_with_stops,
+    load_results,
+    run_benchmarks,
+    save_results,
+    write_synthetic_gpx_file,
+)
+from gpx_stream_parser import parse_gpx_file
+from test_predictor import FakeModelPredictor
+
+
+class TestSyntheticTracks(unittest.TestCase):
+    def test_deterministic(self):
+        track = generate_track(500, seed=1)
+        same_track = generate_track(500, seed=1)
+
+        for name in ["longitude", "latitude", "elevation", "time"]:
+            np.testing.assert_array_equal(
+                getattr(track, name), getattr(same_track, name)
+            )
+        self.assertFalse(
+            np.array_equal(track.longitude, generate_track(500, seed=2).longitude)
+        )
+
+        # Variants only differ in the data they lack
+        positions_only = generate_track(
+            500, seed=1, with_time=False, with_elevation=False
+        )
+        np.testing.assert_array_equal(positions_only.latitude, track.latitude)
+        self.assertTrue(np.all(np.isnan(positions_only.elevation)))
+        self.assertTrue(np.all(np.isnan(positions_only.time)))
+
+    def test_write_gpx_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "track.gpx")
+            for with_time, with_elevation in [
+                (True, True),
+                (False, True),
+                (True, False),
+            ]:
+                write_synthetic_gpx_file(
+                    file_name,
+                    300,
+                    0,
+                    with_time=with_time,
+                    with_elevation=with_elevation,
+                )
+                segments = list(parse_gpx_file(file_name))
+                track = generate_track(300, 0, with_time, with_elevation)
+
+                self.assertEqual(len(segments), 1)
+                np.testing.assert_allclose(
+                    segments[0].latitude, track.latitude, atol=1e-7
+                )
+                np.testing.assert_allclose(
+                    segments[0].elevation, track.elevation, atol=0.01
+                )
+                np.testing.assert_array_equal(segments[0].time, track.time)
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_run_benchmarks(self):
+        results = run_benchmarks(
+            sizes=[1000],
+            variants=["full", "positions_only"],
+            predictors={"simple": FakeModelPredictor()},
+            repeats=2,
+        )
+
+        stages = [result.stage for result in results if result.variant == "full"]
+        self.assertEqual(
+            stages,
+            [
+                "parse_gpx_files",
+                "smoothen_coordinates",
+                "filter_segments",
+                "split_segments_by_length",
+                "extract_stats",
+                "extract_stats_batch",
+                "write_data_to_hdf5",
+                "inference_simple",
+            ],
+        )
+        self.assertEqual(len(results), 2 * len(stages))
+        for result in results:
+            self.assertEqual(result.repeats, 2)
+            self.assertLessEqual(result.min_time_s, result.median_time_s)
+
+        with self.assertRaises(ValueError):
+            run_benchmarks(sizes=[1000], variants=["unknown"])
+
+    def test_track_with_stops(self):
+        track = generate_track_with_stops(1000, seed=0, stop_length=40)
+
+        # Points 60 to 99 of every 100 points repeat point 59
+        np.testing.assert_array_equal(track.latitude[60:100], track.latitude[59])
+        np.testing.assert_array_equal(track.longitude[960:], track.longitude[959])
+        np.testing.assert_array_equal(
+            track.latitude[100:160], generate_track(1000, seed=0).latitude[100:160]
+        )
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = benchmark_stops(sizes=[1000, 2000], repeats=2)
+        self.assertEqual(
+            [(result.stage, result.num_points) for result in results],
+            [("thin_by_distance_stops", 1000), ("thin_by_distance_stops", 2000)],
+        )
+
+    def test_startup(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = benchmark_startup(num_points=100, repeats=1)
+
+        self.assertEqual(result.stage, "startup_standard")
+        self.assertEqual(result.num_points, 100)
+        self.assertGreater(result.min_time_s, 0.0)
+
+    def test_save_and_compare(self):
+        baseline = [
+            BenchmarkResult("parse_gpx_files", 1000, "full", 0.1, 0.11, 3),
+            BenchmarkResult("filter_segments", 1000, "full", 0.1, 0.11, 3),
+            BenchmarkResult("extract_stats", 1000, "full", 1e-4, 1e-4, 3),
+        ]
+        results = [
+            BenchmarkResult("parse_gpx_files", 1000, "full", 0.15, 0.16, 3),
+            BenchmarkResult("filter_segments", 1000, "full", 0.11, 0.12, 3),
+            BenchmarkResult("extract_stats", 1000, "full", 5e-4, 5e-4, 3),
+            BenchmarkResult("extract_stats", 1000, "no_time", 1.0, 1.0, 3),
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "results.json")
+            save_results(baseline, file_name, arguments={"repeats": 3})
+            loaded_baseline = load_results(file_name)
+
+        self.assertEqual(loaded_baseline, baseline)
+
+        # Only slowdowns above the threshold of stages that are not too fast count
+        regressions = compare_results(loaded_baseline, results, threshold=0.2)
+        self.assertEqual(regressions, [(baseline[0], results[0])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import importlib.util
+import unittest
+
+import numpy as np
+
+from bucketed_model import (
+    BucketedModel,
+    get_bucket_size,
+    get_input_shapes,
+    pad_inputs,
+    predict_in_buckets,
+)
+
+TENSORFLOW_AVAILABLE = importlib.util.find_spec("tensorflow") is not None
+
+
+def sum_model(inputs):
+    "Model predicting the sum of the features of each row as moving time."
+    arrays = inputs if isinstance(inputs, list) else [inputs]
+    moving_time = sum(array.sum(axis=tuple(range(1, array.ndim))) for array in arrays)
+    return np.column_stack([moving_time, np.zeros(len(moving_time))])
+
+
+class TestBuckets(unittest.TestCase):
+    def test_get_bucket_size(self):
+        bucket_sizes = [16, 64, 256]
+
+        self.assertEqual(get_bucket_size(1, bucket_sizes), 16)
+        self.assertEqual(get_bucket_size(16, bucket_sizes), 16)
+        self.assertEqual(get_bucket_size(17, bucket_sizes), 64)
+        self.assertEqual(get_bucket_size(1000, bucket_sizes), 256)
+
+    def test_get_input_shapes(self):
+        self.assertEqual(get_input_shapes("simple"), [(4,)])
+        self.assertEqual(get_input_shapes("recurrent", 10), [(10, 3)])
+        self.assertEqual(get_input_shapes("mixed"), [(4,), (25, 3)])
+
+        with self.assertRaises(ValueError):
+            get_input_shapes("linear")
+
+    def test_pad_inputs(self):
+        inputs = [np.ones((3, 4)), np.ones((3, 25, 3))]
+        padded = pad_inputs(inputs, 16)
+
+        self.assertEqual(padded[0].shape, (16, 4))
+        self.assertEqual(padded[1].shape, (16, 25, 3))
+        self.assertEqual(np.sum(padded[1]), 3 * 25 * 3)
+
+    def test_predict_in_buckets(self):
+        bucket_sizes = [16, 64]
+        rng = np.random.default_rng(0)
+        called_sizes = []
+
+        def predict_bucket(inputs):
+            called_sizes.append(len(inputs[0]))
+            return sum_model(inputs)
+
+        for num_rows in [0, 1, 16, 17, 64, 150]:
+            called_sizes.clear()
+            inputs = [rng.random((num_rows, 4)), rng.random((num_rows, 25, 3))]
+
+            predictions = predict_in_buckets(predict_bucket, inputs, bucket_sizes)
+
+            np.testing.assert_allclose(predictions, sum_model(inputs))
+            self.assertTrue(set(called_sizes).issubset(bucket_sizes))
+            self.assertEqual(len(called_sizes), -(-num_rows // 64))
+
+
+@unittest.skipUnless(TENSORFLOW_AVAILABLE, "TensorFlow is not installed")
+class TestBucketedModel(unittest.TestCase):
+    def test_no_retracing(self):
+        import tensorflow as tf
+
+        inputs = tf.keras.Input(shape=(4,))
+        model = tf.keras.Model(inputs, tf.keras.layers.Dense(2)(inputs))
+
+        bucketed_model = BucketedModel(model, "simple", bucket_sizes=[8, 32])
+        self.assertEqual(bucketed_model.get_tracing_count(), 2)
+
+        rng = np.random.default_rng(1)
+        for num_rows in [1, 5, 8, 9, 31, 100]:
+            features = rng.random((num_rows, 4)).astype(np.float32)
+            np.testing.assert_allclose(
+                bucketed_model(features), model(features).numpy(), rtol=1e-5
+            )
+
+        self.assertEqual(bucketed_model.get_tracing_count(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from dataset_loader import SegmentDataset, take_rows
+from gpx_stats import GpxSegmentStatsBatch
+from hdf5_writer import write_batches_to_hdf5
+from test_feature_cache import create_batch
+
+
+def write_contiguous_hdf5(batch: GpxSegmentStatsBatch, file_name: str) -> None:
+    "Write batch to HDF5 file with contiguous datasets."
+    with h5py.File(file_name, "w") as hdf5file:
+        for name in GpxSegmentStatsBatch.get_header():
+            hdf5file.create_dataset(name, data=batch[name])
+
+
+class TestTakeRows(unittest.TestCase):
+    def test_hdf5_dataset(self):
+        data = np.arange(100.0).reshape(50, 2)
+        indices = np.array([40, 3, 3, 17, 49, 0, -1])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with h5py.File(os.path.join(tmp_dir, "data.hdf5"), "w") as hdf5file:
+                dataset = hdf5file.create_dataset("data", data=data)
+
+                np.testing.assert_array_equal(
+                    take_rows(dataset, indices, chunk_rows=8), data[indices]
+                )
+                np.testing.assert_array_equal(
+                    take_rows(dataset, data[:, 0] > 50), data[data[:, 0] > 50]
+                )
+                np.testing.assert_array_equal(take_rows(dataset), data)
+
+
+class TestSegmentDataset(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.batch = create_batch(100, seed=0)
+        self.batch["Path"][[5, 17]] = np.nan
+
+        self.file_names = {
+            "contiguous": os.path.join(self.tmp_dir.name, "contiguous.hdf5"),
+            "chunked": os.path.join(self.tmp_dir.name, "chunked.hdf5"),
+        }
+        write_contiguous_hdf5(self.batch, self.file_names["contiguous"])
+        write_batches_to_hdf5(
+            [self.batch], self.file_names["chunked"], 25, compression="gzip"
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_memory_mapped(self):
+        with SegmentDataset(self.file_names["contiguous"]) as dataset:
+            self.assertTrue(dataset.is_memory_mapped("Path"))
+            np.testing.assert_array_equal(dataset["Path"], self.batch["Path"])
+
+        with SegmentDataset(self.file_names["chunked"]) as dataset:
+            self.assertFalse(dataset.is_memory_mapped("Path"))
+
+    def test_features_and_paths(self):
+        columns = ["Length2d", "TotalUphill"]
+        indices = np.array([99, 0, 42])
+
+        for file_name in self.file_names.values():
+            with SegmentDataset(file_name) as dataset:
+                self.assertEqual(len(dataset), 100)
+                np.testing.assert_array_equal(
+                    dataset.get_features(columns, indices),
+                    np.stack([self.batch[name][indices] for name in columns], axis=1),
+                )
+                np.testing.assert_array_equal(
+                    dataset.get_paths(indices), self.batch["Path"][indices]
+                )
+
+    def test_valid_path_mask(self):
+        with SegmentDataset(self.file_names["chunked"]) as dataset:
+            mask = dataset.get_valid_path_mask(block_rows=16)
+
+        self.assertEqual(np.sum(~mask), 2)
+        self.assertFalse(mask[5] or mask[17])
+
+    def test_feature_statistics(self):
+        columns = ["Length2d", "Length3d", "TotalDownhill"]
+        mask = np.arange(100) % 3 != 0
+
+        with SegmentDataset(self.file_names["chunked"]) as dataset:
+            mean, std = dataset.get_feature_statistics(columns, mask, block_rows=7)
+            stats = dataset.to_data_frame(columns)[mask].describe()
+
+        np.testing.assert_allclose(mean, stats.loc["mean"].values)
+        np.testing.assert_allclose(std, stats.loc["std"].values)
+
+    def test_to_batch(self):
+        with SegmentDataset(self.file_names["contiguous"]) as dataset:
+            batch = dataset.to_batch()
+            data_frame = dataset.to_data_frame()
+
+        self.assertNotIn("Path", data_frame.columns)
+        for name in GpxSegmentStatsBatch.get_header():
+            np.testing.assert_array_equal(batch[name], self.batch[name])
+
+
+if __name__ == "__main__":
+    unittest.main()
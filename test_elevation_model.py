@@ -0,0 +1,282 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import gpxpy.gpx
+import numpy as np
+
+from array_segment import ArraySegment
+from config import DEFAULT_DATA_PREPARATION_CONFIG
+from elevation_model import (
+    HGT_VOID_VALUE,
+    DemTile,
+    ElevationModel,
+    get_tile_key,
+)
+from feature_cache import FeatureCache
+from predictor import INFERENCE_DATA_PREPARATION_CONFIG, parse_and_prepare_track
+from prepare_data import process_segments
+from test_gpx_stream_parser import GPX_CONTENT
+from test_predictor import FakeModelPredictor
+
+NUM_SAMPLES = 121
+
+
+def plane_elevation(longitude: np.array, latitude: np.array) -> np.array:
+    "Elevation of an inclined plane, which bilinear interpolation reproduces exactly."
+    return (
+        500.0
+        + 300.0 * (np.asarray(longitude) - 8)
+        + 200.0 * (np.asarray(latitude) - 46)
+    )
+
+
+def write_tile(folder: str, name: str, num_samples: int = NUM_SAMPLES) -> np.array:
+    "Write HGT tile sampling plane_elevation, rounded to whole meters, and return its samples."
+    tile_key = get_tile_key(name)
+    assert tile_key is not None, f"{name} is not the name of an SRTM tile"
+    south, west = tile_key
+    steps = np.arange(num_samples) / (num_samples - 1)
+    longitude, latitude = np.meshgrid(west + steps, south + 1 - steps)
+    samples = np.round(plane_elevation(longitude, latitude)).astype(">i2")
+    samples.tofile(os.path.join(folder, name))
+    return samples
+
+
+class TestDemTile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.tmp_dir.name, "N47E008.hgt")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_tile_key(self):
+        self.assertEqual(get_tile_key("tiles/N47E008.hgt"), (47, 8))
+        self.assertEqual(get_tile_key("s12w077.HGT"), (-12, -77))
+        self.assertIsNone(get_tile_key("N47E008.tif"))
+
+    def test_bilinear_interpolation(self):
+        samples = write_tile(self.tmp_dir.name, "N47E008.hgt", num_samples=3)
+        tile = DemTile(self.file_name)
+
+        # Sample points are reproduced and points between them are averaged
+        np.testing.assert_array_equal(
+            tile.sample(np.array([8.0, 9.0, 8.5]), np.array([48.0, 47.0, 47.5])),
+            [samples[0, 0], samples[2, 2], samples[1, 1]],
+        )
+        self.assertEqual(
+            tile.sample(np.array([8.25]), np.array([47.75]))[0],
+            np.mean(samples[:2, :2]),
+        )
+
+    def test_plane(self):
+        write_tile(self.tmp_dir.name, "N47E008.hgt")
+        tile = DemTile(self.file_name)
+
+        rng = np.random.default_rng(0)
+        longitude = 8.0 + rng.random(1000)
+        latitude = 47.0 + rng.random(1000)
+
+        np.testing.assert_allclose(
+            tile.sample(longitude, latitude),
+            plane_elevation(longitude, latitude),
+            atol=0.5,
+        )
+
+    def test_voids(self):
+        samples = np.array([[100, HGT_VOID_VALUE], [300, 400]], dtype=">i2")
+        samples.tofile(self.file_name)
+        tile = DemTile(self.file_name)
+
+        elevations = tile.sample(np.array([8.5, 9.0]), np.array([47.5, 48.0]))
+        self.assertAlmostEqual(elevations[0], (100 + 300 + 400) / 3)
+        self.assertTrue(np.isnan(elevations[1]))
+
+    def test_bad_size(self):
+        np.zeros(10, dtype=">i2").tofile(self.file_name)
+        with self.assertRaises(ValueError):
+            DemTile(self.file_name)
+
+
+class TestElevationModel(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp_dir.name, "europe"))
+        for name in ["N47E008.hgt", "europe/N47E009.hgt", "N46E008.hgt"]:
+            write_tile(self.tmp_dir.name, name)
+        self.elevation_model = ElevationModel(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_elevations(self):
+        self.assertEqual(len(self.elevation_model.tile_files), 3)
+
+        longitude = np.array([8.2, 9.7, 8.4, 10.5, np.nan, 8.9])
+        latitude = np.array([47.1, 47.3, 46.6, 47.5, 47.0, 47.9])
+        elevations = self.elevation_model.get_elevations(longitude, latitude)
+
+        available = np.array([True, True, True, False, False, True])
+        np.testing.assert_allclose(
+            elevations[available],
+            plane_elevation(longitude, latitude)[available],
+            atol=0.5,
+        )
+        self.assertTrue(np.all(np.isnan(elevations[~available])))
+
+        # Every tile is opened once and looked up once per call
+        self.assertEqual(self.elevation_model.stats.misses, 3)
+        self.elevation_model.get_elevations(longitude, latitude)
+        self.assertEqual(self.elevation_model.stats.hits, 3)
+
+    def test_tile_cache(self):
+        elevation_model = ElevationModel(self.tmp_dir.name, max_open_tiles=1)
+        for longitude in [8.5, 9.5, 8.5]:
+            elevation_model.get_elevations(np.array([longitude]), np.array([47.5]))
+
+        self.assertEqual(elevation_model.stats.misses, 3)
+        self.assertEqual(elevation_model.stats.evictions, 2)
+        self.assertEqual(len(elevation_model._tiles), 1)
+
+    def test_correct_elevations(self):
+        segments = [
+            ArraySegment(
+                [8.1, 8.2, 8.3, 12.0],
+                [47.1, 47.2, 47.3, 47.0],
+                [600.0, np.nan, 700.0, np.nan],
+                np.full(4, np.nan),
+            ),
+            ArraySegment([8.5], [47.5], [np.nan], [np.nan]),
+        ]
+
+        self.assertEqual(self.elevation_model.correct_elevations(segments), 2)
+        self.assertEqual(segments[0].elevation[0], 600.0)
+        self.assertAlmostEqual(segments[0].elevation[1], 800.0, delta=0.5)
+        self.assertTrue(np.isnan(segments[0].elevation[3]))
+        self.assertAlmostEqual(segments[1].elevation[0], 950.0, delta=0.5)
+
+        replacing_model = ElevationModel(self.tmp_dir.name, replace=True)
+        self.assertEqual(replacing_model.correct_elevations(segments), 4)
+        self.assertAlmostEqual(segments[0].elevation[2], 850.0, delta=0.5)
+
+    def test_pickle(self):
+        self.elevation_model.get_elevations(np.array([8.5]), np.array([47.5]))
+        unpickled_model = pickle.loads(pickle.dumps(self.elevation_model))
+
+        self.assertEqual(len(unpickled_model._tiles), 0)
+        self.assertEqual(
+            unpickled_model.get_elevations(np.array([8.5]), np.array([47.5])),
+            self.elevation_model.get_elevations(np.array([8.5]), np.array([47.5])),
+        )
+
+    def test_fingerprint(self):
+        fingerprint = self.elevation_model.get_fingerprint()
+        self.assertEqual(
+            ElevationModel(self.tmp_dir.name).get_fingerprint(), fingerprint
+        )
+        self.assertNotEqual(
+            ElevationModel(self.tmp_dir.name, replace=True).get_fingerprint(),
+            fingerprint,
+        )
+
+        feature_cache = FeatureCache(os.path.join(self.tmp_dir.name, "cache"))
+        gpx_file = os.path.join(self.tmp_dir.name, "track.gpx")
+        with open(gpx_file, "w") as output_file:
+            output_file.write(GPX_CONTENT)
+        self.assertNotEqual(
+            feature_cache.get_key(gpx_file, DEFAULT_DATA_PREPARATION_CONFIG),
+            feature_cache.get_key(
+                gpx_file, DEFAULT_DATA_PREPARATION_CONFIG, self.elevation_model
+            ),
+        )
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        write_tile(self.tmp_dir.name, "N47E008.hgt")
+        self.elevation_model = ElevationModel(self.tmp_dir.name)
+
+        # Tracks without elevations, as recorded by phones without barometer, the second one outside of the tiles
+        gpx = gpxpy.gpx.GPX()
+        for longitude_offset in [0.0, 4.0]:
+            segment = self.create_segment()
+            track = gpxpy.gpx.GPXTrack()
+            track.segments.append(
+                gpxpy.gpx.GPXTrackSegment(
+                    [
+                        gpxpy.gpx.GPXTrackPoint(latitude, longitude + longitude_offset)
+                        for longitude, latitude in zip(
+                            segment.longitude, segment.latitude
+                        )
+                    ]
+                )
+            )
+            gpx.tracks.append(track)
+
+        self.gpx_file = os.path.join(self.tmp_dir.name, "track.gpx")
+        with open(self.gpx_file, "w") as output_file:
+            output_file.write(gpx.to_xml())
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_segment(self) -> ArraySegment:
+        "Create straight segment of about 9 km without elevations."
+        longitude = np.linspace(8.1, 8.2, 200)
+        latitude = np.linspace(47.1, 47.15, 200)
+        return ArraySegment(
+            longitude, latitude, np.full(200, np.nan), np.full(200, np.nan)
+        )
+
+    def test_process_segments(self):
+        gpx_data = process_segments(
+            [self.create_segment()],
+            INFERENCE_DATA_PREPARATION_CONFIG,
+            self.elevation_model,
+        )
+
+        segment = self.create_segment()
+        segment.elevation[:] = plane_elevation(segment.longitude, segment.latitude)
+        expected_gpx_data = process_segments(
+            [segment], INFERENCE_DATA_PREPARATION_CONFIG
+        )
+
+        self.assertFalse(np.any(np.isnan(gpx_data["Path"])))
+        np.testing.assert_allclose(
+            gpx_data["TotalUphill"], expected_gpx_data["TotalUphill"], atol=0.1
+        )
+        np.testing.assert_allclose(
+            gpx_data["Path"], expected_gpx_data["Path"], atol=0.5
+        )
+
+    def test_parse_and_prepare_track(self):
+        gpx_data, standard_estimate = parse_and_prepare_track(self.gpx_file)
+        corrected_gpx_data, corrected_standard_estimate = parse_and_prepare_track(
+            self.gpx_file, elevation_model=self.elevation_model
+        )
+
+        # Only the segments of the first track get elevations
+        has_elevation = ~np.any(np.isnan(corrected_gpx_data["Path"][:, :, 2]), axis=1)
+        self.assertEqual(np.sum(has_elevation), len(corrected_gpx_data) // 2)
+        self.assertGreater(np.sum(corrected_gpx_data["TotalUphill"]), 0.0)
+        self.assertGreater(
+            corrected_standard_estimate["standard_estimate_s"],
+            standard_estimate["standard_estimate_s"],
+        )
+
+    def test_predictor(self):
+        predictor = FakeModelPredictor(elevation_model=self.elevation_model)
+        prediction = predictor.predict_track(self.gpx_file)
+        results = list(predictor.predict_tracks([self.gpx_file], jobs=2))
+
+        self.assertEqual(results[0][1], prediction)
+        self.assertNotEqual(
+            FakeModelPredictor().predict_track(self.gpx_file), prediction
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import dataclasses
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from config import DEFAULT_DATA_PREPARATION_CONFIG
+from feature_cache import FeatureCache, get_config_hash, get_file_hash
+from gpx_stats import GpxSegmentStatsBatch
+
+
+def create_batch(num_segments: int, seed: int) -> GpxSegmentStatsBatch:
+    "Create batch of statistics with random values."
+    rng = np.random.default_rng(seed)
+    columns = {
+        name: rng.random(num_segments) for name in GpxSegmentStatsBatch.get_header()
+    }
+    columns["Path"] = rng.random((num_segments, 25, 3))
+    return GpxSegmentStatsBatch(columns)
+
+
+class TestHashes(unittest.TestCase):
+    def test_file_hash_depends_on_content(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_names = [os.path.join(tmp_dir, name) for name in ["a", "b", "c"]]
+            for file_name, content in zip(file_names, [b"track", b"track", b"other"]):
+                with open(file_name, "wb") as output_file:
+                    output_file.write(content)
+
+            hashes = [get_file_hash(file_name) for file_name in file_names]
+
+        self.assertEqual(hashes[0], hashes[1])
+        self.assertNotEqual(hashes[0], hashes[2])
+
+    def test_config_hash(self):
+        config = DEFAULT_DATA_PREPARATION_CONFIG
+        self.assertEqual(
+            get_config_hash(config), get_config_hash(dataclasses.replace(config))
+        )
+        self.assertNotEqual(
+            get_config_hash(config),
+            get_config_hash(dataclasses.replace(config, min_distance_m=5.0)),
+        )
+
+
+class TestFeatureCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_store_and_load(self):
+        cache = FeatureCache(self.cache_dir)
+        batch = create_batch(4, seed=0)
+
+        self.assertIsNone(cache.load("key"))
+        cache.store("key", batch)
+        loaded_batch = cache.load("key")
+
+        for name in GpxSegmentStatsBatch.get_header():
+            np.testing.assert_array_equal(loaded_batch[name], batch[name])
+        self.assertEqual(cache.stats.hits, 1)
+        self.assertEqual(cache.stats.misses, 1)
+        self.assertEqual(cache.stats.stores, 1)
+        self.assertAlmostEqual(cache.stats.get_hit_rate(), 0.5)
+
+    def test_empty_batch(self):
+        cache = FeatureCache(self.cache_dir)
+        cache.store("key", create_batch(0, seed=1))
+
+        self.assertEqual(len(cache.load("key")), 0)
+
+    def test_corrupt_entry(self):
+        cache = FeatureCache(self.cache_dir)
+        with open(os.path.join(self.cache_dir, "key.npz"), "wb") as entry_file:
+            entry_file.write(b"not a cache entry")
+
+        self.assertIsNone(cache.load("key"))
+
+    def test_eviction(self):
+        cache = FeatureCache(self.cache_dir)
+        for idx in range(3):
+            cache.store("key{}".format(idx), create_batch(10, seed=idx))
+            os.utime(os.path.join(self.cache_dir, "key{}.npz".format(idx)), (idx, idx))
+        entry_size = cache.get_size_bytes() // 3
+
+        # Using the oldest entry makes the second one the least recently used
+        cache.load("key0")
+        cache.max_size_bytes = 3 * entry_size
+        cache.store("key3", create_batch(10, seed=3))
+
+        self.assertEqual(cache.stats.evictions, 1)
+        self.assertEqual(cache.get_num_entries(), 3)
+        self.assertIsNone(cache.load("key1"))
+        self.assertIsNotNone(cache.load("key0"))
+        self.assertIn("evicted", cache.report())
+
+    def test_eviction_lists_cache_once(self):
+        cache = FeatureCache(self.cache_dir)
+        cache.store("key", create_batch(10, seed=0))
+        entry_size = cache.get_size_bytes()
+        cache.max_size_bytes = 5 * entry_size
+
+        with mock.patch.object(
+            cache, "_list_entries", wraps=cache._list_entries
+        ) as list_entries:
+            for idx in range(50):
+                cache.store("key{}".format(idx), create_batch(10, seed=idx))
+                if idx == 20:
+                    cache.load("key16")
+
+        self.assertEqual(list_entries.call_count, 1)
+        self.assertEqual(cache.stats.evictions, 46)
+        self.assertLessEqual(cache.get_size_bytes(), 5 * entry_size)
+        self.assertEqual(cache.get_num_entries(), 5)
+        self.assertIsNotNone(cache.load("key49"))
+        self.assertIsNone(cache.load("key17"))
+
+    def test_clear(self):
+        cache = FeatureCache(self.cache_dir)
+        cache.store("key", create_batch(2, seed=0))
+        cache.clear()
+
+        self.assertEqual(cache.get_num_entries(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,231 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from gpxpy import geo
+from gpxpy.gpx import GPXTrackPoint, GPXTrackSegment
+
+import geodesy
+from geodesy import (
+    bearing,
+    cumulative_distances,
+    distance,
+    haversine_distance,
+    point_distances,
+    project_to_local_enu,
+    thin_by_distance,
+)
+
+
+class TestDistances(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        num_points = 200
+
+        self.latitude = 46.5 + np.cumsum(rng.normal(scale=1e-4, size=num_points))
+        self.longitude = 9.5 + np.cumsum(rng.normal(scale=1e-4, size=num_points))
+        self.elevation = 1500.0 + np.cumsum(rng.normal(scale=2.0, size=num_points))
+
+        # Include some jumps that are large enough for gpxpy to use the haversine distance
+        self.latitude[50:] += 0.5
+        self.longitude[120:] -= 1.0
+
+        self.points = [
+            GPXTrackPoint(latitude=lat, longitude=lon, elevation=ele)
+            for lat, lon, ele in zip(self.latitude, self.longitude, self.elevation)
+        ]
+
+    def test_haversine_distance(self):
+        expected = [
+            geo.haversine_distance(lat_1, lon_1, lat_2, lon_2)
+            for lat_1, lon_1, lat_2, lon_2 in zip(
+                self.latitude[1:],
+                self.longitude[1:],
+                self.latitude[:-1],
+                self.longitude[:-1],
+            )
+        ]
+
+        np.testing.assert_allclose(
+            haversine_distance(
+                self.latitude[1:],
+                self.longitude[1:],
+                self.latitude[:-1],
+                self.longitude[:-1],
+            ),
+            expected,
+        )
+
+    def test_distance_scalar(self):
+        self.assertAlmostEqual(
+            float(distance(47.0, 8.0, None, 47.001, 8.001, None)),
+            geo.distance(47.0, 8.0, None, 47.001, 8.001, None),
+        )
+
+    def test_point_distances_2d(self):
+        distances = point_distances(self.latitude, self.longitude)
+
+        self.assertEqual(len(distances), len(self.latitude) - 1)
+        np.testing.assert_allclose(
+            np.sum(distances), GPXTrackSegment(self.points).length_2d()
+        )
+
+    def test_point_distances_3d(self):
+        np.testing.assert_allclose(
+            np.sum(point_distances(self.latitude, self.longitude, self.elevation)),
+            GPXTrackSegment(self.points).length_3d(),
+        )
+
+    def test_point_distances_missing_elevation(self):
+        self.elevation[10] = np.nan
+        self.points[10].elevation = None
+
+        np.testing.assert_allclose(
+            np.sum(point_distances(self.latitude, self.longitude, self.elevation)),
+            GPXTrackSegment(self.points).length_3d(),
+        )
+
+    def test_cumulative_distances(self):
+        cumulative = cumulative_distances(self.latitude, self.longitude)
+
+        self.assertEqual(cumulative[0], 0.0)
+        np.testing.assert_allclose(
+            cumulative[30] - cumulative[10],
+            GPXTrackSegment(self.points[10:31]).length_2d(),
+        )
+
+    def test_cumulative_distances_short(self):
+        self.assertEqual(len(cumulative_distances(np.zeros(0), np.zeros(0))), 0)
+        np.testing.assert_array_equal(
+            cumulative_distances(np.ones(1), np.ones(1)), [0.0]
+        )
+
+
+class TestBearing(unittest.TestCase):
+    def test_against_gpxpy(self):
+        rng = np.random.default_rng(1)
+        latitude = rng.uniform(-60, 60, size=(2, 50))
+        longitude = rng.uniform(-180, 180, size=(2, 50))
+
+        expected = [
+            geo.get_course(lat_1, lon_1, lat_2, lon_2, loxodromic=False)
+            for lat_1, lon_1, lat_2, lon_2 in zip(
+                latitude[0], longitude[0], latitude[1], longitude[1]
+            )
+        ]
+
+        np.testing.assert_allclose(
+            bearing(latitude[0], longitude[0], latitude[1], longitude[1]), expected
+        )
+
+    def test_cardinal_directions(self):
+        np.testing.assert_allclose(
+            bearing(
+                np.zeros(4),
+                np.zeros(4),
+                np.array([1.0, 0.0, -1.0, 0.0]),
+                np.array([0.0, 1.0, 0.0, -1.0]),
+            ),
+            [0.0, 90.0, 180.0, 270.0],
+        )
+
+
+class TestProjectToLocalEnu(unittest.TestCase):
+    def test_distances_preserved(self):
+        rng = np.random.default_rng(2)
+        latitude = 47.0 + np.cumsum(rng.normal(scale=1e-4, size=25))
+        longitude = 8.0 + np.cumsum(rng.normal(scale=1e-4, size=25))
+        elevation = 800.0 + np.cumsum(rng.normal(scale=1.0, size=25))
+
+        enu = project_to_local_enu(longitude, latitude, elevation)
+
+        np.testing.assert_array_equal(enu[0], [0.0, 0.0, 0.0])
+        np.testing.assert_allclose(
+            np.linalg.norm(np.diff(enu[:, :2], axis=0), axis=1),
+            point_distances(latitude, longitude),
+            rtol=1e-3,
+        )
+        np.testing.assert_allclose(enu[:, 2], elevation - elevation[0])
+
+    def test_axes(self):
+        enu = project_to_local_enu(
+            np.array([8.0, 8.001, 8.0]), np.array([47.0, 47.0, 47.001]), np.zeros(3)
+        )
+
+        self.assertGreater(enu[1, 0], 0.0)
+        self.assertAlmostEqual(enu[1, 1], 0.0)
+        self.assertAlmostEqual(enu[2, 0], 0.0)
+        self.assertGreater(enu[2, 1], 0.0)
+
+
+class TestThinByDistance(unittest.TestCase):
+    def get_expected_indices(self, latitude, longitude, min_distance_m):
+        points = [
+            GPXTrackPoint(latitude=lat, longitude=lon)
+            for lat, lon in zip(latitude, longitude)
+        ]
+        indices = [0]
+        for idx in range(1, len(points)):
+            if (
+                GPXTrackSegment([points[indices[-1]], points[idx]]).length_2d()
+                > min_distance_m
+            ):
+                indices.append(idx)
+        return indices
+
+    def test_against_gpxpy(self):
+        rng = np.random.default_rng(3)
+        latitude = 47.0 + np.cumsum(rng.normal(scale=2e-5, size=1000))
+        longitude = 8.0 + np.cumsum(rng.normal(scale=2e-5, size=1000))
+
+        for min_distance_m in [0.1, 3.0, 10.0, 50.0]:
+            np.testing.assert_array_equal(
+                thin_by_distance(latitude, longitude, min_distance_m),
+                self.get_expected_indices(latitude, longitude, min_distance_m),
+            )
+
+    def test_short(self):
+        self.assertEqual(len(thin_by_distance(np.zeros(0), np.zeros(0), 1.0)), 0)
+        np.testing.assert_array_equal(
+            thin_by_distance(np.ones(1), np.ones(1), 1.0), [0]
+        )
+
+    def test_stationary_points(self):
+        latitude = np.concatenate([np.full(100, 47.0), [47.01]])
+        longitude = np.full(101, 8.0)
+
+        np.testing.assert_array_equal(
+            thin_by_distance(latitude, longitude, 5.0), [0, 100]
+        )
+
+    def test_long_stops(self):
+        # Stops of different lengths, longer than the window and the following search windows
+        rng = np.random.default_rng(5)
+        steps = rng.normal(scale=3e-5, size=(3000, 2))
+        for start, length in [(100, 40), (300, 17), (500, 200), (1000, 1500)]:
+            steps[start : start + length] = 0.0
+        coordinates = np.array([47.0, 8.0]) + np.cumsum(steps, axis=0)
+
+        np.testing.assert_array_equal(
+            thin_by_distance(coordinates[:, 0], coordinates[:, 1], 5.0),
+            self.get_expected_indices(coordinates[:, 0], coordinates[:, 1], 5.0),
+        )
+
+        # The search after a stop only covers the stop, so the number of computed distances grows linearly with the
+        # number of points. Searching the rest of the track after every stop would compute about 10^8 distances.
+        num_points = 20000
+        steps = rng.normal(scale=3e-5, size=(num_points, 2))
+        steps[np.arange(num_points) % 100 >= 60] = 0.0
+        coordinates = np.array([47.0, 8.0]) + np.cumsum(steps, axis=0)
+
+        with mock.patch("geodesy.distance", wraps=geodesy.distance) as distance_mock:
+            thin_by_distance(coordinates[:, 0], coordinates[:, 1], 5.0)
+        num_distances = sum(
+            np.size(call.args[0]) for call in distance_mock.call_args_list
+        )
+        self.assertLess(num_distances, 20 * num_points)
+
+
+if __name__ == "__main__":
+    unittest.main()
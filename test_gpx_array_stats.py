@@ -0,0 +1,318 @@
+import dataclasses
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from gpxpy.gpx import GPXTrack, GPXTrackPoint, GPXTrackSegment
+
+import gpx_array_stats
+import gpx_stats
+from array_segment import ArraySegment
+from config import DEFAULT_DATA_PREPARATION_CONFIG
+from gpx_data_utils import gpx_segment_to_array, gpx_segment_to_array_segment
+
+
+def create_random_walk_segment(
+    num_points: int, seed: int, with_time: bool = True
+) -> GPXTrackSegment:
+    "Create a GPX track segment resembling a recorded hike."
+    rng = np.random.default_rng(seed)
+
+    longitude = 8.0 + np.cumsum(rng.normal(scale=3e-5, size=num_points))
+    latitude = 47.0 + np.cumsum(rng.normal(scale=3e-5, size=num_points))
+    elevation = 1000.0 + np.cumsum(rng.normal(scale=1.0, size=num_points))
+    seconds = np.cumsum(rng.integers(1, 10, size=num_points))
+
+    start_time = datetime(2021, 6, 1, 8, tzinfo=timezone.utc)
+
+    return GPXTrackSegment(
+        [
+            GPXTrackPoint(
+                longitude=longitude[i],
+                latitude=latitude[i],
+                elevation=elevation[i],
+                time=(
+                    start_time + timedelta(seconds=int(seconds[i]))
+                    if with_time
+                    else None
+                ),
+            )
+            for i in range(num_points)
+        ]
+    )
+
+
+class TestArraySegment(unittest.TestCase):
+    def test_bad_shapes(self):
+        with self.assertRaises(AssertionError):
+            ArraySegment(np.zeros(3), np.zeros(3), np.zeros(2), np.zeros(3))
+
+    def test_slice_is_view(self):
+        segment = ArraySegment.from_array(np.random.normal(size=(10, 3)))
+        part = segment[2:5]
+
+        self.assertEqual(len(part), 3)
+        self.assertTrue(np.shares_memory(part.longitude, segment.longitude))
+
+    def test_padded_paths(self):
+        segments = [
+            ArraySegment.from_array(np.random.normal(size=(length, 3)))
+            for length in [3, 1, 5]
+        ]
+
+        paths, lengths = gpx_array_stats.get_padded_paths(segments, 5)
+
+        np.testing.assert_array_equal(lengths, [3, 1, 5])
+        for i, segment in enumerate(segments):
+            np.testing.assert_array_equal(paths[i, : len(segment)], segment.to_array())
+            np.testing.assert_array_equal(paths[i, len(segment) :], 0.0)
+
+    def test_to_array(self):
+        data = np.random.normal(size=(10, 3))
+        np.testing.assert_array_equal(ArraySegment.from_array(data).to_array(), data)
+
+
+class TestSmoothenCoordinatesKernels(unittest.TestCase):
+    def setUp(self):
+        x = np.arange(30, dtype=float)
+        self.segment = ArraySegment.from_array(
+            np.column_stack([0.1 * x, 0.01 * x**2, 500 + x - 0.05 * x**2])
+        )
+
+    def test_kernels_normalized(self):
+        for kernel in ["moving_average", "savitzky_golay", "gaussian"]:
+            for window_size in [1, 3, 7]:
+                weights = gpx_array_stats.get_smoothing_kernel(kernel, window_size)
+                self.assertEqual(len(weights), window_size)
+                self.assertAlmostEqual(np.sum(weights), 1.0)
+                np.testing.assert_array_almost_equal(weights, weights[::-1])
+
+    def test_bad_kernel(self):
+        with self.assertRaises(ValueError):
+            gpx_array_stats.get_smoothing_kernel("median", 3)
+
+    def test_savitzky_golay_preserves_quadratics(self):
+        expected = self.segment.to_array()[3:-3]
+
+        segments = [self.segment]
+        gpx_array_stats.smoothen_coordinates(
+            segments, window_size=7, kernel="savitzky_golay"
+        )
+
+        np.testing.assert_array_almost_equal(segments[0].to_array(), expected)
+
+    def test_gaussian(self):
+        longitude = self.segment.longitude.copy()
+
+        segments = [self.segment]
+        gpx_array_stats.smoothen_coordinates(segments, window_size=5, kernel="gaussian")
+
+        # Linear coordinates are not changed by symmetric kernels
+        np.testing.assert_array_almost_equal(segments[0].longitude, longitude[2:-2])
+
+    def test_inplace(self):
+        segments = [self.segment]
+        gpx_array_stats.smoothen_coordinates(segments, window_size=5)
+
+        self.assertEqual(len(segments[0]), len(self.segment) - 4)
+        for name in ["longitude", "latitude", "elevation", "time"]:
+            self.assertTrue(
+                np.shares_memory(
+                    getattr(segments[0], name), getattr(self.segment, name)
+                )
+            )
+
+    def test_missing_elevation_savitzky_golay(self):
+        elevation = self.segment.elevation.copy()
+        self.segment.elevation[10] = np.nan
+
+        segments = [self.segment]
+        gpx_array_stats.smoothen_coordinates(
+            segments, window_size=5, kernel="savitzky_golay"
+        )
+
+        # Windows with missing elevations keep the elevation at their center
+        self.assertTrue(np.isnan(segments[0].elevation[8]))
+        self.assertEqual(segments[0].elevation[7], elevation[9])
+        self.assertEqual(segments[0].elevation[10], elevation[12])
+
+    def test_missing_all_elevations(self):
+        self.segment.elevation[:] = np.nan
+
+        segments = [self.segment]
+        gpx_array_stats.smoothen_coordinates(segments, window_size=5, kernel="gaussian")
+
+        self.assertTrue(np.all(np.isnan(segments[0].elevation)))
+
+
+class TestPipelineParity(unittest.TestCase):
+    def setUp(self):
+        self.gpx_segments = [
+            create_random_walk_segment(500, seed=1),
+            create_random_walk_segment(37, seed=2),
+            create_random_walk_segment(2, seed=3),
+            create_random_walk_segment(120, seed=4, with_time=False),
+        ]
+
+    def get_array_segments(self):
+        return [gpx_segment_to_array_segment(segment) for segment in self.gpx_segments]
+
+    def assert_segments_equal(self, array_segments, gpx_segments):
+        self.assertEqual(len(array_segments), len(gpx_segments))
+        for array_segment, gpx_segment in zip(array_segments, gpx_segments):
+            self.assertEqual(len(array_segment), len(gpx_segment.points))
+            np.testing.assert_array_almost_equal(
+                array_segment.to_array(), gpx_segment_to_array(gpx_segment)
+            )
+
+    def test_smoothen_coordinates(self):
+        array_segments = self.get_array_segments()
+
+        gpx_stats.smoothen_coordinates(self.gpx_segments, window_size=5)
+        gpx_array_stats.smoothen_coordinates(array_segments, window_size=5)
+
+        self.assert_segments_equal(array_segments, self.gpx_segments)
+
+    def test_smoothen_coordinates_missing_elevation(self):
+        self.gpx_segments[0].points[10].elevation = None
+        array_segments = self.get_array_segments()
+        elevation = array_segments[0].elevation.copy()
+
+        gpx_stats.smoothen_coordinates(self.gpx_segments)
+        gpx_array_stats.smoothen_coordinates(array_segments)
+
+        # Complete windows are smoothened as before
+        self.assertAlmostEqual(
+            array_segments[0].elevation[7], self.gpx_segments[0].points[7].elevation
+        )
+        # Missing elevations stay missing
+        self.assertTrue(np.isnan(array_segments[0].elevation[9]))
+        # Windows with missing elevations average over the available ones
+        self.assertAlmostEqual(array_segments[0].elevation[8], np.mean(elevation[8:10]))
+        self.assertAlmostEqual(
+            array_segments[0].elevation[10], np.mean(elevation[11:13])
+        )
+
+    def test_filter_segments(self):
+        for min_distance_m in [0.5, 4.0, 25.0, 150.0]:
+            array_segments = gpx_array_stats.filter_segments(
+                self.get_array_segments(), min_distance_m=min_distance_m
+            )
+            gpx_segments = gpx_stats.filter_segments(
+                self.gpx_segments, min_distance_m=min_distance_m
+            )
+
+            self.assert_segments_equal(array_segments, gpx_segments)
+
+    def test_filter_segments_empty(self):
+        self.assertEqual(
+            len(
+                gpx_array_stats.filter_segments(
+                    [ArraySegment.from_array(np.zeros((0, 3)))]
+                )[0]
+            ),
+            0,
+        )
+
+    def test_split_segments_by_length(self):
+        array_segments = gpx_array_stats.split_segments_by_length(
+            self.get_array_segments(), max_length_m=100.0
+        )
+        gpx_segments = gpx_stats.split_segments_by_length(
+            self.gpx_segments, max_length_m=100.0
+        )
+
+        self.assert_segments_equal(array_segments, gpx_segments)
+
+    def test_split_segments_by_length_modes(self):
+        for split_mode in ["fixed", "equal"]:
+            array_segments = gpx_array_stats.split_segments_by_length(
+                self.get_array_segments(), max_length_m=100.0, split_mode=split_mode
+            )
+            gpx_segments = gpx_stats.split_segments_by_length(
+                self.gpx_segments, max_length_m=100.0, split_mode=split_mode
+            )
+
+            self.assert_segments_equal(array_segments, gpx_segments)
+
+    def test_extract_stats(self):
+        array_segments = gpx_array_stats.split_segments_by_length(
+            self.get_array_segments(), max_length_m=100.0
+        )
+        gpx_segments = gpx_stats.split_segments_by_length(
+            self.gpx_segments, max_length_m=100.0
+        )
+
+        array_stats = gpx_array_stats.extract_stats(array_segments, num_points_path=50)
+        gpx_segment_stats = gpx_stats.extract_stats(gpx_segments, num_points_path=50)
+
+        self.assertEqual(len(array_stats), len(gpx_segment_stats))
+        for array_stat, gpx_stat in zip(array_stats, gpx_segment_stats):
+            array_stat_dict, gpx_stat_dict = array_stat.to_dict(), gpx_stat.to_dict()
+            for name in gpx_stats.GpxSegmentStats.get_header():
+                np.testing.assert_array_almost_equal(
+                    array_stat_dict[name], gpx_stat_dict[name]
+                )
+
+    def test_extract_stats_batch(self):
+        self.gpx_segments[1].points[5].elevation = None
+        self.gpx_segments[1].points[0].time = None
+        array_segments = gpx_array_stats.split_segments_by_length(
+            self.get_array_segments(), max_length_m=100.0
+        )
+
+        batch = gpx_array_stats.extract_stats_batch(array_segments, num_points_path=50)
+        segments_stats = gpx_array_stats.extract_stats(
+            array_segments, num_points_path=50
+        )
+
+        self.assertEqual(len(batch), len(segments_stats))
+        for name in gpx_stats.GpxSegmentStats.get_header():
+            np.testing.assert_array_almost_equal(
+                batch[name],
+                np.stack([stats.to_dict()[name] for stats in segments_stats]),
+            )
+
+    def test_extract_stats_batch_empty(self):
+        batch = gpx_array_stats.extract_stats_batch([], num_points_path=50)
+
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(batch["Path"].shape, (0, 50, 3))
+
+    def test_filter_bad_segments(self):
+        config = dataclasses.replace(
+            DEFAULT_DATA_PREPARATION_CONFIG, max_elevation_diff_m=30.0
+        )
+        array_segments = gpx_array_stats.filter_bad_segments(
+            self.get_array_segments(), config
+        )
+        gpx_segments = gpx_stats.filter_bad_segments(self.gpx_segments, config)
+
+        self.assert_segments_equal(array_segments, gpx_segments)
+
+    def test_get_track_summary(self):
+        gpx_track = GPXTrack()
+        gpx_track.segments = self.gpx_segments
+        array_segments = self.get_array_segments()
+
+        summary = gpx_array_stats.get_track_summary(array_segments)
+        uphill, downhill = gpx_track.get_uphill_downhill()
+
+        self.assertAlmostEqual(summary.length_2d, gpx_track.length_2d(), places=6)
+        self.assertAlmostEqual(summary.uphill, uphill, places=6)
+        self.assertAlmostEqual(summary.downhill, downhill, places=6)
+        self.assertAlmostEqual(
+            summary.moving_time, gpx_track.get_moving_data().moving_time, places=6
+        )
+        # The segments are not modified
+        for array_segment, expected_segment in zip(
+            array_segments, self.get_array_segments()
+        ):
+            np.testing.assert_array_equal(
+                array_segment.to_array(), expected_segment.to_array()
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
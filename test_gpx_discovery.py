@@ -0,0 +1,130 @@
+import glob
+import os
+import tempfile
+import unittest
+
+from gpx_discovery import GpxFileManifest, discover_gpx_files
+from utils import get_pseudo_probability_for_path
+
+
+def create_files(folder: str, relative_paths: list) -> None:
+    "Create empty files and their parent folders."
+    for relative_path in relative_paths:
+        path = os.path.join(folder, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w"):
+            pass
+
+
+class TestDiscoverGpxFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tmp_dir.name, "tracks")
+        self.manifest_file = os.path.join(self.tmp_dir.name, "manifest.json")
+        create_files(
+            self.folder,
+            [
+                "Hiking/2020/a.gpx",
+                "Hiking/2020/b.gpx",
+                "Hiking/2021/c.gpx",
+                "Hiking/2021/notes.txt",
+                "Cycling/d.gpx",
+                ".hidden/Hiking/e.gpx",
+                "Hiking/.f.gpx",
+            ],
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_same_as_glob(self):
+        expected = sorted(
+            path
+            for path in glob.iglob(os.path.join(self.folder, "**"), recursive=True)
+            if path.endswith(".gpx") and "Hiking" in path
+        )
+        entries = discover_gpx_files(self.folder, "Hiking")
+
+        self.assertEqual([entry.path for entry in entries], expected)
+        for entry in entries:
+            self.assertEqual(
+                entry.split,
+                (
+                    "train"
+                    if get_pseudo_probability_for_path(entry.path) < 0.8
+                    else "test"
+                ),
+            )
+
+    def test_symbolic_links(self):
+        os.symlink(
+            os.path.join(self.folder, "Hiking/2020"),
+            os.path.join(self.folder, "Cycling/Hiking"),
+        )
+        expected = sorted(
+            path
+            for path in glob.iglob(os.path.join(self.folder, "**"), recursive=True)
+            if path.endswith(".gpx") and "Hiking" in path
+        )
+        self.assertIn(os.path.join(self.folder, "Cycling/Hiking/a.gpx"), expected)
+
+        # Links to a directory that is being searched are not followed, unlike by glob
+        os.symlink(self.folder, os.path.join(self.folder, "Hiking/2021/tracks"))
+        manifest = GpxFileManifest()
+        manifest.update(self.folder)
+        self.assertEqual([entry.path for entry in manifest.select("Hiking")], expected)
+
+        stats = manifest.update(self.folder)
+        self.assertEqual(stats.scanned_directories, 0)
+        self.assertEqual(len(manifest.select("Hiking")), len(expected))
+
+    def test_rescan_with_manifest(self):
+        discover_gpx_files(self.folder, manifest_file=self.manifest_file)
+
+        manifest = GpxFileManifest.load(self.manifest_file)
+        stats = manifest.update(self.folder)
+        self.assertEqual(stats.scanned_directories, 0)
+        self.assertEqual(stats.stated_files, 0)
+        self.assertEqual(len(manifest.select()), 4)
+
+        # Adding a file only changes the modification time of its directory
+        create_files(self.folder, ["Hiking/2021/g.gpx"])
+        manifest = GpxFileManifest.load(self.manifest_file)
+        stats = manifest.update(self.folder)
+        self.assertEqual(stats.scanned_directories, 1)
+        self.assertEqual(stats.stated_files, 2)
+        self.assertIn(
+            os.path.join(self.folder, "Hiking/2021/g.gpx"),
+            [entry.path for entry in manifest.select("Hiking")],
+        )
+
+    def test_removed_directory(self):
+        manifest = GpxFileManifest()
+        manifest.update(self.folder)
+
+        for name in ["a.gpx", "b.gpx"]:
+            os.remove(os.path.join(self.folder, "Hiking/2020", name))
+        os.rmdir(os.path.join(self.folder, "Hiking/2020"))
+        manifest.update(self.folder)
+
+        self.assertEqual(len(manifest.select("Hiking")), 1)
+
+    def test_exclude_patterns_and_splits(self):
+        manifest = GpxFileManifest(train_fraction=0.0, exclude_patterns=["2020"])
+        manifest.update(self.folder)
+        manifest.save(self.manifest_file)
+
+        self.assertEqual(len(manifest.select("Hiking")), 2)
+        self.assertEqual(len(manifest.select(split="train")), 0)
+
+        manifest = GpxFileManifest.load(
+            self.manifest_file, train_fraction=1.0, exclude_patterns=["2020"]
+        )
+        self.assertEqual(len(manifest.select(split="test")), 0)
+
+        # Manifests with other exclude patterns are not reused
+        self.assertEqual(len(GpxFileManifest.load(self.manifest_file).files), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,7 +10,16 @@ from gpx_data_utils import (
     gpx_segment_to_array,
     gpx_segment_from_array,
 )
-from gpx_stats import convert_path_to_feature, smoothen_coordinates
+from gpx_stats import (
+    GpxSegmentStats,
+    GpxSegmentStatsBatch,
+    convert_path_array_to_feature,
+    convert_path_to_feature,
+    convert_paths_to_features,
+    get_split_indices,
+    smoothen_coordinates,
+    split_segments_by_length,
+)
 
 
 class TestConvertPathToArray(unittest.TestCase):
@@ -44,6 +53,72 @@ class TestConvertPathToArray(unittest.TestCase):
         np.testing.assert_array_almost_equal(path, self.expected_path_1)
 
 
+class TestConvertPathsToFeatures(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.num_points_path = 25
+        self.lengths = rng.integers(1, self.num_points_path + 1, size=100)
+        self.segments_data = [
+            np.column_stack(
+                [
+                    8.0 + np.cumsum(rng.normal(scale=3e-5, size=length)),
+                    47.0 + np.cumsum(rng.normal(scale=3e-5, size=length)),
+                    1000.0 + np.cumsum(rng.normal(size=length)),
+                ]
+            )
+            for length in self.lengths
+        ]
+
+        # Fill padding with values that should be ignored
+        self.paths = rng.normal(size=(100, self.num_points_path, 3))
+        for i, segment_data in enumerate(self.segments_data):
+            self.paths[i, : len(segment_data)] = segment_data
+
+    def test_same_as_single(self):
+        np.testing.assert_array_equal(
+            convert_paths_to_features(self.paths, self.lengths),
+            np.stack(
+                [
+                    convert_path_array_to_feature(segment_data, self.num_points_path)
+                    for segment_data in self.segments_data
+                ]
+            ),
+        )
+
+    def test_example(self):
+        paths = np.zeros((2, 4, 3))
+        paths[0, :3] = gpx_segment_to_array(
+            GPXTrackSegment(
+                [
+                    GPXTrackPoint(longitude=0.1, latitude=1, elevation=10),
+                    GPXTrackPoint(longitude=0.2, latitude=2, elevation=20),
+                    GPXTrackPoint(longitude=0.3, latitude=3, elevation=30),
+                ]
+            )
+        )
+        paths[1, :1] = [5.0, 6.0, 7.0]
+
+        features = convert_paths_to_features(paths, np.array([3, 1]))
+
+        np.testing.assert_array_almost_equal(
+            features[0],
+            [
+                [0.0, 0.0, 0.0],
+                [1.0049875621, 0.0, 10],
+                [2.00997512422, 0.0, 20],
+                [0.0, 0.0, 0.0],
+            ],
+        )
+        np.testing.assert_array_equal(features[1], np.zeros((4, 3)))
+
+    def test_bad_lengths(self):
+        with self.assertRaises(AssertionError):
+            convert_paths_to_features(self.paths[:2], np.array([0, 3]))
+
+        with self.assertRaises(AssertionError):
+            convert_paths_to_features(self.paths[:2], np.array([3, 26]))
+
+
 class TestSmoothenCoordinatesShort(unittest.TestCase):
     def setUp(self):
         self.segment_1 = GPXTrackSegment(
@@ -133,5 +208,107 @@ class TestSmoothenCoordinatesLonger(unittest.TestCase):
             )
 
 
+class TestSplitSegmentsByLength(unittest.TestCase):
+    def setUp(self):
+        # Points along a meridian, about 11.1 m apart
+        self.segment = GPXTrackSegment(
+            [
+                GPXTrackPoint(longitude=8.0, latitude=47.0 + 1e-4 * i, elevation=500)
+                for i in range(100)
+            ]
+        )
+
+    def test_split_indices_fixed(self):
+        split_indices = get_split_indices(
+            np.arange(10, dtype=float), max_length_m=3.0, split_mode="fixed"
+        )
+        np.testing.assert_array_equal(split_indices, [0, 3, 6, 9, 10])
+
+    def test_split_indices_equal(self):
+        split_indices = get_split_indices(
+            np.arange(10, dtype=float), max_length_m=4.0, split_mode="equal"
+        )
+        np.testing.assert_array_equal(split_indices, [0, 3, 6, 10])
+
+    def test_split_indices_skip_empty_parts(self):
+        split_indices = get_split_indices(
+            np.array([0.0, 1.0, 10.0, 11.0]), max_length_m=3.0, split_mode="fixed"
+        )
+        np.testing.assert_array_equal(split_indices, [0, 2, 4])
+
+    def test_split_indices_bad_mode(self):
+        with self.assertRaises(ValueError):
+            get_split_indices(np.arange(10.0), max_length_m=3.0, split_mode="thirds")
+
+    def test_split_modes(self):
+        for split_mode in ["halving", "fixed", "equal"]:
+            split_segments = split_segments_by_length(
+                [self.segment], max_length_m=100.0, split_mode=split_mode
+            )
+
+            self.assertTrue(
+                all(segment.length_2d() < 100.0 for segment in split_segments)
+            )
+            self.assertEqual(
+                sum(len(segment.points) for segment in split_segments),
+                len(self.segment.points),
+            )
+
+    def test_split_mode_equal(self):
+        split_segments = split_segments_by_length(
+            [self.segment], max_length_m=100.0, split_mode="equal"
+        )
+        lengths = [len(segment.points) for segment in split_segments]
+
+        self.assertEqual(len(split_segments), 12)
+        self.assertLessEqual(max(lengths) - min(lengths), 1)
+
+
+class TestGpxSegmentStatsBatch(unittest.TestCase):
+    def setUp(self):
+        self.segments_stats = [
+            GpxSegmentStats(
+                gpx_segment_from_array(np.random.normal(size=(num_points, 3))),
+                num_points_path=10,
+            )
+            for num_points in [3, 7, 10]
+        ]
+
+    def test_from_stats_list(self):
+        batch = GpxSegmentStatsBatch.from_stats_list(self.segments_stats, 10)
+
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch["Path"].shape, (3, 10, 3))
+        for i, stats in enumerate(self.segments_stats):
+            for name, value in stats.to_dict().items():
+                np.testing.assert_array_equal(batch[name][i], value)
+
+    def test_from_empty_list(self):
+        batch = GpxSegmentStatsBatch.from_stats_list([], 10)
+
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(batch["Path"].shape, (0, 10, 3))
+
+    def test_select_and_concatenate(self):
+        batch = GpxSegmentStatsBatch.from_stats_list(self.segments_stats, 10)
+
+        selected = batch.select(np.array([True, False, True]))
+        concatenated = GpxSegmentStatsBatch.concatenate([selected, batch])
+
+        self.assertEqual(len(selected), 2)
+        self.assertEqual(len(concatenated), 5)
+        np.testing.assert_array_equal(concatenated["Path"][1], batch["Path"][2])
+        np.testing.assert_array_equal(concatenated["Length2d"][2:], batch["Length2d"])
+
+    def test_columns_are_views(self):
+        batch = GpxSegmentStatsBatch.from_stats_list(self.segments_stats, 10)
+
+        self.assertIs(batch["Length2d"], batch.columns["Length2d"])
+
+    def test_bad_columns(self):
+        with self.assertRaises(AssertionError):
+            GpxSegmentStatsBatch({"Length2d": np.zeros(3)})
+
+
 if __name__ == "__main__":
     unittest.main()
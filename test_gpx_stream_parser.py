@@ -0,0 +1,136 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import gpxpy
+
+from gpx_data_utils import gpx_segment_to_array_segment
+from gpx_stream_parser import (
+    parse_gpx_file,
+    parse_gpx_file_tracks,
+    parse_gpx_files,
+    parse_timestamps,
+)
+
+GPX_CONTENT = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <metadata><time>2021-06-01T07:00:00Z</time></metadata>
+  <wpt lat="47.5" lon="8.5"><ele>400</ele></wpt>
+  <trk>
+    <name>Test</name>
+    <trkseg>
+      <trkpt lat="47.0" lon="8.0"><ele>500.5</ele><time>2021-06-01T08:00:00Z</time></trkpt>
+      <trkpt lat="47.0001" lon="8.0001"><ele>501</ele><time>2021-06-01T08:00:05.250Z</time></trkpt>
+      <trkpt lat="47.0002" lon="8.0002"><time>2021-06-01T08:00:09Z</time></trkpt>
+      <trkpt lat="47.0003" lon="8.0003"><ele>503</ele></trkpt>
+    </trkseg>
+    <trkseg>
+    </trkseg>
+  </trk>
+  <trk>
+    <trkseg>
+      <trkpt lat="46.0" lon="7.0"><ele>1000</ele><time>2021-06-02T10:00:00+02:00</time></trkpt>
+      <trkpt lat="46.001" lon="7.001"><ele>1010</ele><time>2021-06-02T10:01:00+02:00</time></trkpt>
+    </trkseg>
+  </trk>
+</gpx>
+"""
+
+
+class TestParseTimestamps(unittest.TestCase):
+    def test_utc(self):
+        np.testing.assert_array_equal(
+            parse_timestamps(["1970-01-01T00:00:10Z", None, "1970-01-01T00:01:00.5Z"]),
+            [10.0, np.nan, 60.5],
+        )
+
+    def test_without_time_zone(self):
+        np.testing.assert_array_equal(parse_timestamps(["1970-01-01T00:00:10"]), [10.0])
+
+    def test_time_zone_offset(self):
+        np.testing.assert_array_equal(
+            parse_timestamps(["1970-01-01T01:00:10+01:00", "1970-01-01T00:00:20Z"]),
+            [10.0, 20.0],
+        )
+
+    def test_missing(self):
+        self.assertTrue(np.all(np.isnan(parse_timestamps([None, ""]))))
+        self.assertEqual(len(parse_timestamps([])), 0)
+
+
+class TestParseGpxFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.tmp_dir.name, "track.gpx")
+        with open(self.file_name, "w") as gpx_file:
+            gpx_file.write(GPX_CONTENT)
+
+        with open(self.file_name, "r") as gpx_file:
+            gpx = gpxpy.parse(gpx_file)
+        self.expected_segments = [
+            gpx_segment_to_array_segment(segment)
+            for track in gpx.tracks
+            for segment in track.segments
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_same_as_gpxpy(self):
+        segments = list(parse_gpx_file(self.file_name))
+
+        self.assertEqual(len(segments), len(self.expected_segments))
+        for segment, expected_segment in zip(segments, self.expected_segments):
+            for name in ["longitude", "latitude", "elevation", "time"]:
+                np.testing.assert_array_equal(
+                    getattr(segment, name), getattr(expected_segment, name)
+                )
+
+    def test_values(self):
+        segment = next(parse_gpx_file(self.file_name))
+
+        np.testing.assert_array_equal(segment.elevation, [500.5, 501, np.nan, 503])
+        np.testing.assert_array_equal(np.diff(segment.time[:3]), [5.25, 3.75])
+        self.assertTrue(np.isnan(segment.time[3]))
+
+    def test_parse_file_tracks(self):
+        tracks = parse_gpx_file_tracks(self.file_name)
+
+        self.assertEqual([len(track) for track in tracks], [2, 1])
+        self.assertEqual([len(segment) for segment in tracks[0]], [4, 0])
+        np.testing.assert_array_equal(
+            tracks[1][0].longitude, self.expected_segments[2].longitude
+        )
+
+    def test_parse_files(self):
+        segments = list(parse_gpx_files([self.file_name, self.file_name]))
+
+        self.assertEqual(len(segments), 2 * len(self.expected_segments))
+
+    def test_gpx_written_by_gpxpy(self):
+        gpx = gpxpy.gpx.GPX()
+        gpx.tracks.append(gpxpy.gpx.GPXTrack())
+        for expected_segment in self.expected_segments:
+            gpx.tracks[0].segments.append(
+                gpxpy.gpx.GPXTrackSegment(
+                    [
+                        gpxpy.gpx.GPXTrackPoint(latitude=i, longitude=-i, elevation=i)
+                        for i in range(len(expected_segment))
+                    ]
+                )
+            )
+        with open(self.file_name, "w") as gpx_file:
+            gpx_file.write(gpx.to_xml(version="1.0"))
+
+        segments = list(parse_gpx_file(self.file_name))
+
+        self.assertEqual(
+            [len(segment) for segment in segments],
+            [len(segment) for segment in self.expected_segments],
+        )
+        np.testing.assert_array_equal(segments[0].longitude, [0, -1, -2, -3])
+
+
+if __name__ == "__main__":
+    unittest.main()
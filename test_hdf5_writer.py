@@ -0,0 +1,144 @@
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from dataset_loader import SegmentDataset
+from gpx_stats import GpxSegmentStatsBatch
+from hdf5_writer import (
+    MAX_CHUNK_BYTES,
+    GpxStatsHdf5Writer,
+    get_chunk_rows,
+    write_batches_to_hdf5,
+)
+from test_feature_cache import create_batch
+
+
+class TestGpxStatsHdf5Writer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.tmp_dir.name, "data.hdf5")
+        self.batches = [create_batch(num, seed) for seed, num in enumerate([7, 0, 30])]
+        self.expected = GpxSegmentStatsBatch.concatenate(self.batches)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assert_file_content(self, rtol: float = 0.0):
+        with h5py.File(self.file_name, "r") as hdf5file:
+            self.assertEqual(
+                set(hdf5file.keys()), set(GpxSegmentStatsBatch.get_header())
+            )
+            for name in GpxSegmentStatsBatch.get_header():
+                np.testing.assert_allclose(
+                    hdf5file[name][()], self.expected[name], rtol=rtol
+                )
+
+    def test_batches_across_chunks(self):
+        num_segments = write_batches_to_hdf5(
+            iter(self.batches), self.file_name, 25, chunk_rows=8
+        )
+
+        self.assertEqual(num_segments, 37)
+        self.assert_file_content()
+
+    def test_aligned_writes(self):
+        with GpxStatsHdf5Writer(self.file_name, 25, chunk_rows=8) as writer:
+            writer.write(self.batches[0])
+            self.assertEqual(writer.num_rows, 0)
+
+            # Only whole chunks are written until the writer is closed
+            writer.write(self.batches[2])
+            self.assertEqual(writer.num_rows, 32)
+
+        self.assert_file_content()
+
+    def test_path_chunk_size(self):
+        self.assertEqual(get_chunk_rows(4096, 8), 4096)
+        self.assertEqual(get_chunk_rows(4096, 200 * 3 * 8), 128)
+        self.assertEqual(get_chunk_rows(4000, 200 * 3 * 8), 200)
+
+        write_batches_to_hdf5(self.batches, self.file_name, 25)
+        with h5py.File(self.file_name, "r") as hdf5file:
+            self.assertEqual(hdf5file["Length2d"].chunks, (4096,))
+            self.assertEqual(hdf5file["Path"].chunks, (1024, 25, 3))
+            self.assertLessEqual(1024 * 25 * 3 * 8, MAX_CHUNK_BYTES)
+
+    def test_contiguous(self):
+        for batches in [[], self.batches]:
+            self.expected = GpxSegmentStatsBatch.concatenate(
+                [create_batch(0, 0)] + batches
+            )
+            write_batches_to_hdf5(
+                batches, self.file_name, 25, chunk_rows=8, contiguous=True
+            )
+
+            # The temporary file is removed
+            self.assert_file_content()
+            self.assertEqual(os.listdir(self.tmp_dir.name), ["data.hdf5"])
+
+        write_batches_to_hdf5(self.batches, self.file_name, 25, contiguous=True)
+        with SegmentDataset(self.file_name) as dataset:
+            for name in GpxSegmentStatsBatch.get_header():
+                self.assertTrue(dataset.is_memory_mapped(name))
+
+    def test_exception(self):
+        for contiguous in [False, True]:
+            with self.assertRaises(RuntimeError):
+                with GpxStatsHdf5Writer(
+                    self.file_name, 25, chunk_rows=8, contiguous=contiguous
+                ) as writer:
+                    for batch in self.batches:
+                        writer.write(batch)
+                    raise RuntimeError("Processing failed")
+
+            # Neither a truncated output file nor temporary files are left
+            self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+        # An existing output file is kept
+        write_batches_to_hdf5(self.batches, self.file_name, 25)
+        with self.assertRaises(RuntimeError):
+            with GpxStatsHdf5Writer(self.file_name, 25) as writer:
+                writer.write(self.batches[0])
+                raise RuntimeError("Processing failed")
+
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["data.hdf5"])
+        self.assert_file_content()
+
+    def test_compression(self):
+        for compression in ["gzip", "lzf"]:
+            write_batches_to_hdf5(
+                self.batches, self.file_name, 25, compression=compression, shuffle=True
+            )
+            self.assert_file_content()
+
+            with h5py.File(self.file_name, "r") as hdf5file:
+                self.assertEqual(hdf5file["Path"].compression, compression)
+                self.assertTrue(hdf5file["Path"].shuffle)
+
+    def test_float32(self):
+        write_batches_to_hdf5(self.batches, self.file_name, 25, dtype=np.float32)
+
+        self.assert_file_content(rtol=1e-6)
+        with h5py.File(self.file_name, "r") as hdf5file:
+            self.assertEqual(hdf5file["Length2d"].dtype, np.float32)
+
+    def test_empty(self):
+        self.assertEqual(write_batches_to_hdf5([], self.file_name, 25), 0)
+
+        with h5py.File(self.file_name, "r") as hdf5file:
+            self.assertEqual(hdf5file["Path"].shape, (0, 25, 3))
+
+    def test_bad_options(self):
+        with self.assertRaises(ValueError):
+            GpxStatsHdf5Writer(self.file_name, 25, compression="zip")
+        with self.assertRaises(ValueError):
+            GpxStatsHdf5Writer(self.file_name, 25, compression_level=4)
+        with self.assertRaises(ValueError):
+            GpxStatsHdf5Writer(self.file_name, 25, compression="lzf", contiguous=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
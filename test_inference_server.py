@@ -0,0 +1,146 @@
+import contextlib
+import http.client
+import io
+import json
+import threading
+import unittest
+from typing import Optional
+
+import numpy as np
+
+import gpx_stream_parser
+from inference_server import create_server
+from prediction_cache import PredictionCache
+from test_gpx_stream_parser import GPX_CONTENT
+
+
+class FakePrediction(object):
+    def __init__(self, num_segments: int):
+        self.num_segments = num_segments
+
+    def to_dict(self):
+        return {"moving_time_s": 60.0 * self.num_segments}
+
+
+class FakePredictor(object):
+    "Predictor that counts the segments of a track instead of running a model."
+
+    def __init__(self):
+        self.num_calls = 0
+
+    def get_tracing_count(self):
+        return 5
+
+    def predict_track(self, gpx_input):
+        self.num_calls += 1
+        return FakePrediction(len(list(gpx_stream_parser.parse_gpx_file(gpx_input))))
+
+
+class FailingPredictor(FakePredictor):
+    "Predictor with a bug."
+
+    def predict_track(self, gpx_input):
+        raise KeyError("bug")
+
+
+class TestInferenceServer(unittest.TestCase):
+    def setUp(self):
+        self.predictor = FakePredictor()
+        self.server = create_server({"simple": self.predictor}, port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None):
+        connection = http.client.HTTPConnection(*self.server.server_address)
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        result = response.status, json.loads(response.read())
+        connection.close()
+        return result
+
+    def test_health(self):
+        status, content = self.request("GET", "/health")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(content["model_types"], ["simple"])
+        self.assertEqual(content["tracing_counts"], {"simple": 5})
+        self.assertNotIn("prediction_cache", content)
+
+    def test_health_with_prediction_cache(self):
+        prediction_cache = PredictionCache()
+        prediction_cache.store([b"\x01" * 16], np.ones((1, 2)))
+        prediction_cache.lookup([b"\x01" * 16, b"\x02" * 16])
+
+        self.tearDown()
+        self.server = create_server(
+            {"simple": self.predictor}, port=0, prediction_cache=prediction_cache
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        content = self.request("GET", "/health")[1]["prediction_cache"]
+        self.assertEqual(content["hits"], 1)
+        self.assertEqual(content["misses"], 1)
+        self.assertEqual(content["hit_rate"], 0.5)
+        self.assertEqual(content["num_entries"], 1)
+
+    def test_predict(self):
+        for _ in range(3):
+            status, content = self.request(
+                "POST", "/predict?model_type=simple", GPX_CONTENT.encode("utf-8")
+            )
+
+            self.assertEqual(status, 200)
+            self.assertEqual(content["moving_time_s"], 180.0)
+            self.assertEqual(content["model_type"], "simple")
+
+        self.assertEqual(self.predictor.num_calls, 3)
+
+    def test_errors(self):
+        self.assertEqual(self.request("POST", "/predict", b"<gpx>")[0], 400)
+        self.assertEqual(
+            self.request("POST", "/predict?model_type=simple", b"no gpx")[0], 400
+        )
+        self.assertEqual(self.request("POST", "/predict?model_type=simple")[0], 400)
+        self.assertEqual(
+            self.request(
+                "POST",
+                "/predict?model_type=simple",
+                GPX_CONTENT.replace('lat="', 'latitude="').encode("utf-8"),
+            )[0],
+            400,
+        )
+        self.assertEqual(self.request("GET", "/unknown")[0], 404)
+
+    def test_internal_error(self):
+        self.tearDown()
+        self.server = create_server(
+            {"simple": self.predictor, "failing": FailingPredictor()}, port=0
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        # Only internal errors are logged, with traceback
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            self.assertEqual(
+                self.request("POST", "/predict?model_type=simple", b"no gpx")[0], 400
+            )
+            self.assertEqual(stderr.getvalue(), "")
+
+            status, content = self.request(
+                "POST", "/predict?model_type=failing", GPX_CONTENT.encode("utf-8")
+            )
+
+        self.assertEqual(status, 500)
+        self.assertNotIn("bug", content["error"])
+        self.assertIn("KeyError: 'bug'", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from test_dataset_loader import write_contiguous_hdf5
+from test_feature_cache import create_batch
+
+TENSORFLOW_AVAILABLE = importlib.util.find_spec("tensorflow") is not None
+
+if TENSORFLOW_AVAILABLE:
+    from input_pipeline import (
+        DATA_COLUMNS,
+        NormalizationStats,
+        make_dataset,
+        make_train_validation_datasets,
+    )
+
+
+@unittest.skipUnless(TENSORFLOW_AVAILABLE, "TensorFlow is not installed")
+class TestInputPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.tmp_dir.name, "data.hdf5")
+
+        self.batch = create_batch(50, seed=0)
+        self.batch["Path"][[3, 30]] = np.nan
+        write_contiguous_hdf5(self.batch, self.file_name)
+
+        features = np.stack([self.batch[name] for name in DATA_COLUMNS], axis=1)
+        self.stats = NormalizationStats(
+            DATA_COLUMNS, np.mean(features, axis=0), np.std(features, axis=0)
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_simple(self):
+        dataset = make_dataset(
+            self.file_name, "simple", self.stats, batch_size=16, block_rows=7
+        )
+        inputs, labels = zip(*[(x.numpy(), y.numpy()) for x, y in dataset])
+
+        features = np.stack([self.batch[name] for name in DATA_COLUMNS], axis=1)
+        np.testing.assert_allclose(
+            np.concatenate(inputs), self.stats.normalize(features), rtol=1e-6
+        )
+        np.testing.assert_allclose(
+            np.concatenate(labels)[:, 0], self.batch["MovingTime"], rtol=1e-6
+        )
+
+    def test_recurrent_skips_missing_paths(self):
+        dataset = make_dataset(self.file_name, "recurrent", block_rows=8)
+        paths = np.concatenate([x.numpy() for x, _ in dataset])
+
+        self.assertEqual(len(paths), 48)
+        self.assertFalse(np.any(np.isnan(paths)))
+
+    def test_mixed_shuffled(self):
+        dataset = make_dataset(
+            self.file_name,
+            "mixed",
+            self.stats,
+            batch_size=10,
+            shuffle_buffer_size=20,
+            cache="",
+            seed=1,
+        )
+        labels = [
+            np.concatenate([y.numpy()[:, 0] for _, y in dataset]) for _ in range(2)
+        ]
+
+        for epoch_labels in labels:
+            np.testing.assert_allclose(
+                np.sort(epoch_labels),
+                np.sort(np.delete(self.batch["MovingTime"], [3, 30])),
+                rtol=1e-6,
+            )
+
+    def test_train_validation(self):
+        train_dataset, validation_dataset, stats = make_train_validation_datasets(
+            self.file_name, "simple", batch_size=8
+        )
+
+        self.assertEqual(sum(len(y) for _, y in train_dataset), 40)
+        self.assertEqual(sum(len(y) for _, y in validation_dataset), 10)
+
+        stats_file_name = os.path.join(self.tmp_dir.name, "stats.csv")
+        stats.to_csv(stats_file_name)
+        np.testing.assert_allclose(
+            NormalizationStats.from_csv(stats_file_name).mean, stats.mean
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
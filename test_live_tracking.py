@@ -0,0 +1,149 @@
+import unittest
+
+import numpy as np
+
+from array_segment import ArraySegment
+from live_tracking import (
+    LIVE_DATA_PREPARATION_CONFIG,
+    LiveTrack,
+    predict_live_tracks,
+)
+from moving_data import get_moving_data
+from prepare_data import process_segments
+from test_predictor import FakeModelPredictor
+
+
+def create_track(num_points: int, seed: int) -> ArraySegment:
+    "Create track heading east with noise, which unlike a random walk does not cross itself."
+    rng = np.random.default_rng(seed)
+
+    return ArraySegment(
+        8.0 + np.cumsum(3e-5 + rng.normal(scale=1e-5, size=num_points)),
+        47.0 + np.cumsum(rng.normal(scale=1e-5, size=num_points)),
+        1000.0 + np.cumsum(rng.normal(scale=0.5, size=num_points)),
+        1.6e9 + np.cumsum(rng.integers(1, 5, size=num_points)),
+    )
+
+
+def add_points_in_chunks(live_track: LiveTrack, track: ArraySegment, seed: int):
+    "Add points of track in chunks of random sizes, yielding after every chunk."
+    rng = np.random.default_rng(seed)
+    start = 0
+    while start < len(track):
+        stop = start + int(rng.integers(1, 40))
+        live_track.add_points(track[start:stop])
+        start = stop
+        yield
+
+
+class TestLiveTrack(unittest.TestCase):
+    def setUp(self):
+        self.predictor = FakeModelPredictor()
+        self.track = create_track(1500, seed=1)
+
+    def predict_complete_track(self, track: ArraySegment):
+        gpx_data = process_segments(
+            [track[np.arange(len(track))]], LIVE_DATA_PREPARATION_CONFIG
+        )
+        return self.predictor.predict_segments(gpx_data)
+
+    def test_same_as_complete_track(self):
+        live_track = LiveTrack()
+        rng = np.random.default_rng(4)
+        for _ in add_points_in_chunks(live_track, self.track, seed=2):
+            if rng.random() < 0.3:
+                live_track.predict(self.predictor)
+        prediction = live_track.predict(self.predictor)
+
+        expected_predictions = self.predict_complete_track(self.track)
+        self.assertEqual(prediction.num_segments, len(expected_predictions))
+        self.assertAlmostEqual(
+            prediction.moving_time_s, float(np.sum(expected_predictions[:, 0])), 6
+        )
+        self.assertAlmostEqual(
+            prediction.moving_time_std_s, np.sqrt(len(expected_predictions)), 6
+        )
+        self.assertAlmostEqual(
+            prediction.true_moving_time_s, get_moving_data(self.track).moving_time, 6
+        )
+        self.assertIsNone(prediction.remaining_moving_time_s)
+
+    def test_only_changed_segments_are_predicted(self):
+        live_track = LiveTrack()
+        live_track.add_points(self.track[:1000])
+        live_track.predict(self.predictor)
+
+        # Without new points, all predictions are reused
+        self.predictor.model.batch_sizes.clear()
+        live_track.predict(self.predictor)
+        self.assertEqual(self.predictor.model.batch_sizes, [])
+
+        # A few new points close at most one segment and change the open one
+        live_track.add_points(self.track[1000:1005])
+        live_track.predict(self.predictor)
+        self.assertEqual(len(self.predictor.model.batch_sizes), 1)
+        self.assertLessEqual(self.predictor.model.batch_sizes[0], 2)
+
+    def test_remaining_time(self):
+        planned_route = ArraySegment(
+            self.track.longitude,
+            self.track.latitude,
+            self.track.elevation,
+            np.full(len(self.track), np.nan),
+        )
+        live_track = LiveTrack(planned_route)
+
+        prediction = live_track.predict(self.predictor)
+        self.assertAlmostEqual(
+            prediction.remaining_moving_time_s,
+            float(np.sum(self.predict_complete_track(planned_route)[:, 0])),
+            6,
+        )
+        self.assertEqual(prediction.moving_time_s, 0.0)
+        self.assertIsNone(prediction.true_moving_time_s)
+
+        remaining_moving_times = [prediction.remaining_moving_time_s]
+        for _ in add_points_in_chunks(live_track, self.track, seed=3):
+            prediction = live_track.predict(self.predictor)
+            remaining_moving_times.append(prediction.remaining_moving_time_s)
+            self.assertLess(prediction.distance_to_route_m, 10.0)
+
+        self.assertLess(
+            remaining_moving_times[-1],
+            0.05 * remaining_moving_times[0],
+        )
+        self.assertGreater(
+            remaining_moving_times[len(remaining_moving_times) // 2],
+            remaining_moving_times[-1],
+        )
+
+    def test_bad_planned_route(self):
+        with self.assertRaises(ValueError):
+            LiveTrack(self.track[:0])
+
+
+class TestPredictLiveTracks(unittest.TestCase):
+    def test_single_model_call(self):
+        predictor = FakeModelPredictor()
+        tracks = [create_track(300, seed=seed) for seed in range(3)]
+
+        planned_routes = [None, tracks[1], None]
+
+        live_tracks = [LiveTrack(planned_route) for planned_route in planned_routes]
+        for live_track, track in zip(live_tracks, tracks):
+            live_track.add_points(track[:200])
+        predictions = predict_live_tracks(predictor, live_tracks)
+        self.assertEqual(len(predictor.model.batch_sizes), 1)
+
+        for prediction, track, planned_route in zip(
+            predictions, tracks, planned_routes
+        ):
+            live_track = LiveTrack(planned_route)
+            live_track.add_points(track[:200])
+            self.assertEqual(live_track.predict(predictor), prediction)
+
+        self.assertEqual(predict_live_tracks(predictor, []), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
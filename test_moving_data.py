@@ -0,0 +1,170 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from gpxpy.gpx import GPXTrackPoint, GPXTrackSegment
+
+from array_segment import ArraySegment
+from gpx_data_utils import gpx_segment_to_array_segment
+from moving_data import (
+    compute_moving_data,
+    get_moving_data,
+    get_moving_distances,
+)
+
+
+def create_segment_with_stops(
+    num_points: int, seed: int, time_step_s: float = 5.0
+) -> GPXTrackSegment:
+    "Create a GPX track segment with walking and resting phases, and some recording errors."
+    rng = np.random.default_rng(seed)
+
+    # Steps of about 0 to 20 m, with about every fourth step at rest
+    steps = rng.normal(scale=6e-5, size=(num_points, 2))
+    steps[rng.random(num_points) < 0.25] = 0.0
+    steps[rng.random(num_points) < 0.1] *= 0.005
+    coordinates = np.array([47.0, 8.0]) + np.cumsum(steps, axis=0)
+
+    elevation = 1000.0 + np.cumsum(rng.normal(scale=0.5, size=num_points))
+    seconds = np.cumsum(rng.exponential(scale=time_step_s, size=num_points))
+
+    start_time = datetime(2021, 6, 1, 8, tzinfo=timezone.utc)
+
+    return GPXTrackSegment(
+        [
+            GPXTrackPoint(
+                latitude=coordinates[i, 0],
+                longitude=coordinates[i, 1],
+                elevation=elevation[i],
+                time=start_time + timedelta(microseconds=int(seconds[i] * 1e6)),
+            )
+            for i in range(num_points)
+        ]
+    )
+
+
+class TestMovingDataParity(unittest.TestCase):
+    def assert_same_as_gpxpy(self, segment: GPXTrackSegment, **kwargs):
+        expected = segment.get_moving_data(**kwargs)
+        moving_data = get_moving_data(gpx_segment_to_array_segment(segment), **kwargs)
+
+        self.assertAlmostEqual(moving_data.moving_time, expected.moving_time, places=4)
+        self.assertAlmostEqual(
+            moving_data.stopped_time, expected.stopped_time, places=4
+        )
+        self.assertAlmostEqual(
+            moving_data.moving_distance, expected.moving_distance, places=6
+        )
+        self.assertAlmostEqual(
+            moving_data.stopped_distance, expected.stopped_distance, places=6
+        )
+
+    def test_random_segments(self):
+        for seed in range(10):
+            self.assert_same_as_gpxpy(create_segment_with_stops(300, seed))
+
+    def test_thresholds(self):
+        segment = create_segment_with_stops(300, 11)
+        for stopped_speed_threshold in [0.5, 1.0, 3.0, 10.0]:
+            self.assert_same_as_gpxpy(
+                segment, stopped_speed_threshold=stopped_speed_threshold
+            )
+
+    def test_missing_timestamps(self):
+        segment = create_segment_with_stops(100, 12)
+        for idx in [0, 10, 11, 50, 99]:
+            segment.points[idx].time = None
+
+        self.assert_same_as_gpxpy(segment)
+
+    def test_unordered_and_equal_timestamps(self):
+        segment = create_segment_with_stops(100, 13)
+        segment.points[20].time = segment.points[19].time
+        segment.points[30].time = segment.points[28].time
+
+        self.assert_same_as_gpxpy(segment)
+
+    def test_missing_and_zero_elevations(self):
+        segment = create_segment_with_stops(100, 14)
+        for idx in [0, 5, 6, 40]:
+            segment.points[idx].elevation = None
+        for idx in [20, 60, 61]:
+            segment.points[idx].elevation = 0.0
+
+        self.assert_same_as_gpxpy(segment)
+
+    def test_without_elevations(self):
+        segment = create_segment_with_stops(100, 15)
+        for point in segment.points:
+            point.elevation = None
+
+        self.assert_same_as_gpxpy(segment)
+
+    def test_without_timestamps(self):
+        segment = create_segment_with_stops(100, 16)
+        for point in segment.points:
+            point.time = None
+
+        self.assert_same_as_gpxpy(segment)
+
+    def test_large_jumps(self):
+        segment = create_segment_with_stops(50, 17)
+        for point in segment.points[25:]:
+            point.latitude += 0.5
+
+        self.assert_same_as_gpxpy(segment)
+
+    def test_short_segments(self):
+        for num_points in [0, 1, 2]:
+            segment = create_segment_with_stops(num_points, 18)
+            self.assert_same_as_gpxpy(segment)
+
+
+class TestComputeMovingData(unittest.TestCase):
+    def test_several_segments(self):
+        gpx_segments = [create_segment_with_stops(100, seed) for seed in range(3)]
+        segments = [gpx_segment_to_array_segment(segment) for segment in gpx_segments]
+
+        segment_indices = np.repeat(np.arange(3), [len(s) for s in segments])
+        same_segment = segment_indices[1:] == segment_indices[:-1]
+        latitude, longitude, elevation, time = (
+            np.concatenate([getattr(segment, name) for segment in segments])
+            for name in ["latitude", "longitude", "elevation", "time"]
+        )
+
+        moving_data = compute_moving_data(
+            time,
+            get_moving_distances(latitude, longitude, elevation),
+            np.where(same_segment, segment_indices[1:], -1),
+            num_segments=3,
+        )
+
+        for i, segment in enumerate(gpx_segments):
+            expected = segment.get_moving_data()
+            self.assertAlmostEqual(
+                moving_data.moving_time[i], expected.moving_time, places=4
+            )
+            self.assertAlmostEqual(
+                moving_data.stopped_time[i], expected.stopped_time, places=4
+            )
+
+    def test_simple_example(self):
+        # Points 10 m apart, first at 36 km/h, then at 0.36 km/h
+        segment = ArraySegment(
+            longitude=np.full(3, 8.0),
+            latitude=47.0 + np.arange(3) * 10 / 111319.49,
+            elevation=np.full(3, np.nan),
+            time=np.array([0.0, 1.0, 101.0]),
+        )
+
+        moving_data = get_moving_data(segment)
+
+        self.assertAlmostEqual(moving_data.moving_time, 1.0)
+        self.assertAlmostEqual(moving_data.stopped_time, 100.0)
+        self.assertAlmostEqual(moving_data.moving_distance, 10.0, places=3)
+        self.assertAlmostEqual(moving_data.stopped_distance, 10.0, places=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
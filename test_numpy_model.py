@@ -0,0 +1,244 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from export_numpy_model import (
+    REFERENCE_FILE,
+    export_model,
+    read_checkpoint_object_graph,
+    read_checkpoint_variables,
+)
+from numpy_model import NumpyModel, conv1d, load_numpy_model, lstm, sigmoid
+from predictor import MODEL_DIRECTORIES
+
+TENSORFLOW_AVAILABLE = importlib.util.find_spec("tensorflow") is not None
+
+
+def create_model(seed: int = 0) -> NumpyModel:
+    "Create mixed model with random weights."
+    rng = np.random.default_rng(seed)
+    layers = [
+        {"class_name": "InputLayer", "name": "path", "inputs": [], "config": {}},
+        {"class_name": "InputLayer", "name": "stats", "inputs": [], "config": {}},
+        {
+            "class_name": "Conv1D",
+            "name": "conv",
+            "inputs": ["path"],
+            "config": {"activation": "relu", "padding": "same"},
+        },
+        {
+            "class_name": "BatchNormalization",
+            "name": "norm",
+            "inputs": ["conv"],
+            "config": {"epsilon": 1e-3},
+        },
+        {
+            "class_name": "LSTM",
+            "name": "lstm",
+            "inputs": ["norm"],
+            "config": {
+                "activation": "tanh",
+                "recurrent_activation": "sigmoid",
+                "return_sequences": False,
+            },
+        },
+        {
+            "class_name": "Dense",
+            "name": "dense",
+            "inputs": ["stats"],
+            "config": {"activation": "relu"},
+        },
+        {
+            "class_name": "Concatenate",
+            "name": "concatenate",
+            "inputs": ["lstm", "dense"],
+            "config": {"axis": -1},
+        },
+        {
+            "class_name": "Dense",
+            "name": "output",
+            "inputs": ["concatenate"],
+            "config": {"activation": "linear"},
+        },
+    ]
+    shapes = {
+        "conv/kernel": (3, 3, 6),
+        "conv/bias": (6,),
+        "norm/gamma": (6,),
+        "norm/beta": (6,),
+        "norm/moving_mean": (6,),
+        "lstm/kernel": (6, 32),
+        "lstm/recurrent_kernel": (8, 32),
+        "lstm/bias": (32,),
+        "dense/kernel": (4, 8),
+        "dense/bias": (8,),
+        "output/kernel": (16, 2),
+        "output/bias": (2,),
+    }
+    weights = {name: rng.standard_normal(shape) for name, shape in shapes.items()}
+    weights["norm/moving_variance"] = rng.random(6) + 0.5
+
+    return NumpyModel(layers, ["stats", "path"], "output", weights)
+
+
+class TestLayers(unittest.TestCase):
+    def test_conv1d(self):
+        rng = np.random.default_rng(0)
+        x = rng.standard_normal((2, 7, 3))
+        kernel = rng.standard_normal((3, 3, 4))
+        bias = rng.standard_normal(4)
+
+        padded = np.pad(x, [(0, 0), (1, 1), (0, 0)])
+        expected = np.array(
+            [
+                [
+                    np.einsum("kc,kcf->f", padded[row, step : step + 3], kernel) + bias
+                    for step in range(7)
+                ]
+                for row in range(2)
+            ]
+        )
+
+        np.testing.assert_allclose(conv1d(x, kernel, bias, padding="same"), expected)
+        np.testing.assert_allclose(conv1d(x, kernel, bias), expected[:, 1:-1])
+
+    def test_lstm(self):
+        rng = np.random.default_rng(1)
+        x = rng.standard_normal((5, 4, 3))
+        kernel = rng.standard_normal((3, 8))
+        recurrent_kernel = rng.standard_normal((2, 8))
+        bias = rng.standard_normal(8)
+
+        sequences = lstm(x, kernel, recurrent_kernel, bias, return_sequences=True)
+        self.assertEqual(sequences.shape, (5, 4, 2))
+        np.testing.assert_allclose(
+            lstm(x, kernel, recurrent_kernel, bias), sequences[:, -1]
+        )
+
+        # First step starts from zero states, so only input, cell and output gates contribute
+        z = x[:, 0] @ kernel + bias
+        expected = sigmoid(z[:, 6:]) * np.tanh(sigmoid(z[:, :2]) * np.tanh(z[:, 4:6]))
+        np.testing.assert_allclose(sequences[:, 0], expected)
+
+
+class TestNumpyModel(unittest.TestCase):
+    def test_save_load(self):
+        model = create_model()
+        rng = np.random.default_rng(2)
+        inputs = [rng.standard_normal((10, 4)), rng.standard_normal((10, 25, 3))]
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, "model.npz")
+            model.save(file_name)
+            loaded_model = NumpyModel.load(file_name, block_rows=3)
+
+        predictions = model(inputs)
+        self.assertEqual(predictions.shape, (10, 2))
+        self.assertEqual(predictions.dtype, np.float32)
+        np.testing.assert_allclose(loaded_model(inputs), predictions, rtol=1e-5)
+
+        with self.assertRaises(ValueError):
+            model(inputs[0])
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, "model.npz")
+            model = export_model(MODEL_DIRECTORIES["mixed"], file_name)
+            loaded_model = NumpyModel.load(file_name)
+
+        self.assertEqual(model.input_layers, ["statistics_input", "path_inputs"])
+        self.assertEqual(
+            [layer["class_name"] for layer in model.layers].count("LSTM"), 2
+        )
+        self.assertEqual(loaded_model.weights["lstm/kernel"].shape, (6, 64))
+        self.assertEqual(
+            loaded_model.weights["lstm_1/recurrent_kernel"].shape, (16, 64)
+        )
+
+        variables = read_checkpoint_variables(MODEL_DIRECTORIES["mixed"])
+        np.testing.assert_array_equal(
+            loaded_model.weights["conv1d/kernel"],
+            variables["layer_with_weights-0/kernel/.ATTRIBUTES/VARIABLE_VALUE"],
+        )
+
+        rng = np.random.default_rng(3)
+        predictions = loaded_model(
+            [rng.standard_normal((20, 4)), rng.standard_normal((20, 25, 3))]
+        )
+        self.assertEqual(predictions.shape, (20, 2))
+        self.assertTrue(np.all(np.isfinite(predictions)))
+
+    def test_object_graph(self):
+        object_graph = read_checkpoint_object_graph(MODEL_DIRECTORIES["mixed"])
+        variables = read_checkpoint_variables(MODEL_DIRECTORIES["mixed"])
+
+        # Weights of the first LSTM are only stored by their position in the trainable variables of the model
+        lstm_node = object_graph[object_graph[0].children["layer-8"]]
+        cell_node = object_graph[lstm_node.children["cell"]]
+        key = object_graph[cell_node.children["kernel"]].attributes["VARIABLE_VALUE"]
+        self.assertEqual(key, "trainable_variables/12/.ATTRIBUTES/VARIABLE_VALUE")
+        self.assertEqual(variables[key].shape, (6, 64))
+
+
+class TestReferencePredictions(unittest.TestCase):
+    "Comparison with predictions of the SavedModels in TensorFlow, written by export_numpy_model.py --reference-file."
+
+    def setUp(self):
+        with np.load(REFERENCE_FILE) as content:
+            self.reference = dict(content)
+
+    def get_inputs(self, model: NumpyModel) -> list:
+        return [self.reference[name] for name in model.input_layers]
+
+    def test_exported_models(self):
+        for model_type in MODEL_DIRECTORIES:
+            model = load_numpy_model(model_type)
+            np.testing.assert_allclose(
+                model(self.get_inputs(model)),
+                self.reference[f"predictions_{model_type}"],
+                rtol=1e-4,
+                atol=1e-4,
+            )
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for model_type, model_dir in MODEL_DIRECTORIES.items():
+                model = export_model(model_dir, os.path.join(folder, "model.npz"))
+                np.testing.assert_allclose(
+                    model(self.get_inputs(model)),
+                    self.reference[f"predictions_{model_type}"],
+                    rtol=1e-4,
+                    atol=1e-4,
+                )
+
+
+@unittest.skipUnless(TENSORFLOW_AVAILABLE, "TensorFlow is not installed")
+class TestTensorFlowEquivalence(unittest.TestCase):
+    def test_models(self):
+        import tensorflow as tf
+
+        rng = np.random.default_rng(4)
+        features = rng.standard_normal((50, 4)).astype(np.float32)
+        paths = rng.standard_normal((50, 25, 3)).astype(np.float32)
+        inputs = {"simple": features, "recurrent": paths, "mixed": [features, paths]}
+
+        with tempfile.TemporaryDirectory() as folder:
+            for model_type, model_dir in MODEL_DIRECTORIES.items():
+                numpy_model = export_model(
+                    model_dir, os.path.join(folder, f"{model_type}.npz")
+                )
+                keras_model = tf.keras.models.load_model(model_dir, compile=False)
+
+                np.testing.assert_allclose(
+                    numpy_model(inputs[model_type]),
+                    keras_model(inputs[model_type], training=False).numpy(),
+                    rtol=1e-4,
+                    atol=1e-4,
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from prediction_cache import PredictionCache, get_segment_fingerprints
+from test_feature_cache import create_batch
+
+
+class TestFingerprints(unittest.TestCase):
+    def test_quantization(self):
+        batch = create_batch(3, seed=0)
+        fingerprints = get_segment_fingerprints(batch, "mixed")
+
+        self.assertEqual(len(set(fingerprints)), 3)
+        self.assertTrue(all(len(fingerprint) == 16 for fingerprint in fingerprints))
+
+        # Differences below the resolution do not change fingerprints
+        batch["Length2d"][0] += 1e-4
+        batch["Path"][1, 0, 0] += 1e-9
+        self.assertEqual(get_segment_fingerprints(batch, "mixed"), fingerprints)
+
+        batch["Length2d"][0] += 1.0
+        self.assertNotEqual(get_segment_fingerprints(batch, "mixed"), fingerprints)
+
+    def test_model_inputs(self):
+        batch = create_batch(2, seed=1)
+        fingerprints = {
+            model_type: get_segment_fingerprints(batch, model_type)
+            for model_type in ["simple", "recurrent", "mixed"]
+        }
+        self.assertEqual(len(set(sum(fingerprints.values(), []))), 6)
+
+        # Models with other weights or normalization statistics have other fingerprints
+        self.assertNotEqual(
+            get_segment_fingerprints(batch, "simple", "retrained"),
+            fingerprints["simple"],
+        )
+
+        # Columns that are not inputs of a model do not change its fingerprints
+        batch["MovingTime"][:] += 100.0
+        batch["Path"][:] += 1.0
+        self.assertEqual(
+            get_segment_fingerprints(batch, "simple"), fingerprints["simple"]
+        )
+
+        # Missing elevations are treated as zero
+        batch["Path"][:, :, 2] = np.nan
+        nan_fingerprints = get_segment_fingerprints(batch, "recurrent")
+        batch["Path"][:, :, 2] = 0.0
+        self.assertEqual(get_segment_fingerprints(batch, "recurrent"), nan_fingerprints)
+
+        with self.assertRaises(ValueError):
+            get_segment_fingerprints(batch, "linear")
+
+
+class TestPredictionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp_dir.name, "predictions.npz")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_lookup_and_eviction(self):
+        cache = PredictionCache(max_entries=3)
+        keys = [bytes([i]) * 16 for i in range(5)]
+        predictions = np.arange(10, dtype=np.float32).reshape(5, 2)
+
+        cache.store(keys[:3], predictions[:3])
+        found_predictions, found = cache.lookup([keys[0], keys[3]])
+        np.testing.assert_array_equal(found, [True, False])
+        np.testing.assert_array_equal(found_predictions[0], predictions[0])
+
+        # Key 1 is the least recently used entry after key 0 was looked up
+        cache.store(keys[3:4], predictions[3:4])
+        self.assertEqual(len(cache), 3)
+        np.testing.assert_array_equal(
+            cache.lookup(keys[:4])[1], [True, False, True, True]
+        )
+
+        self.assertEqual(cache.stats.hits, 4)
+        self.assertEqual(cache.stats.misses, 2)
+        self.assertEqual(cache.stats.stores, 4)
+        self.assertEqual(cache.stats.evictions, 1)
+        self.assertIn("66.7% hit rate", cache.report())
+
+        with self.assertRaises(ValueError):
+            PredictionCache(max_entries=0)
+
+    def test_save_and_load(self):
+        cache = PredictionCache(cache_file=self.cache_file)
+        # Trailing zero bytes have to be kept in keys
+        keys = [b"\x01" * 15 + b"\x00", b"\x02" * 16, b"\x03" * 16]
+        predictions = np.array([[1.0, 0.5], [2.0, 0.25], [3.0, 0.125]])
+        cache.store(keys, predictions)
+        cache.lookup(keys[:1])
+        cache.save()
+
+        loaded_cache = PredictionCache(max_entries=2, cache_file=self.cache_file)
+        found_predictions, found = loaded_cache.lookup(keys)
+        np.testing.assert_array_equal(found, [True, False, True])
+        np.testing.assert_array_equal(found_predictions[[0, 2]], predictions[[0, 2]])
+        self.assertEqual(loaded_cache.stats.stores, 0)
+
+        # Keys computed with other resolutions are not loaded
+        other_cache = PredictionCache(
+            cache_file=self.cache_file, distance_resolution_m=1.0
+        )
+        self.assertEqual(len(other_cache), 0)
+
+        with self.assertRaises(ValueError):
+            PredictionCache().save()
+
+
+if __name__ == "__main__":
+    unittest.main()
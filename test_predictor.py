@@ -0,0 +1,292 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import gpxpy
+import numpy as np
+
+import utils
+from export_numpy_model import export_model
+from test_gpx_stream_parser import GPX_CONTENT
+from normalization import DATA_COLUMNS, NormalizationStats
+from numpy_model import NUMPY_MODEL_FILES
+from prediction_cache import PredictionCache
+from predictor import (
+    MODEL_DIRECTORIES,
+    HikingTimePredictor,
+    StandardTimePredictor,
+    compute_standard_estimate,
+    get_model_fingerprint,
+    get_model_inputs,
+    load_predictor,
+)
+from test_feature_cache import create_batch
+from test_prepare_data import write_gpx_files
+
+
+class FakeModel(object):
+    "Model predicting the sum of the inputs as moving time, counting its calls."
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, inputs):
+        self.batch_sizes.append(len(inputs))
+        return np.column_stack([np.sum(inputs, axis=1), np.zeros(len(inputs))])
+
+
+class FakeModelPredictor(HikingTimePredictor):
+    def __init__(
+        self, prediction_cache=None, elevation_model=None, model_fingerprint="fake"
+    ):
+        self.model_type = "simple"
+        self.model = FakeModel()
+        self.prediction_cache = prediction_cache
+        self.model_fingerprint = model_fingerprint
+        self.elevation_model = elevation_model
+        self.normalization_stats = NormalizationStats(
+            DATA_COLUMNS, np.zeros(len(DATA_COLUMNS)), np.ones(len(DATA_COLUMNS))
+        )
+
+
+class TestGetModelInputs(unittest.TestCase):
+    def test_model_types(self):
+        batch = create_batch(5, seed=0)
+        batch["Path"][0, 0] = np.nan
+        stats = NormalizationStats(DATA_COLUMNS, np.ones(4), np.full(4, 2.0))
+
+        features = get_model_inputs(batch, "simple", stats)
+        paths = get_model_inputs(batch, "recurrent", None)
+
+        self.assertEqual(features.dtype, np.float32)
+        np.testing.assert_allclose(
+            features[:, 0], (batch["Length2d"] - 1) / 2, rtol=1e-6
+        )
+        self.assertEqual(paths.shape, (5, 25, 3))
+        self.assertFalse(np.any(np.isnan(paths)))
+        self.assertEqual(len(get_model_inputs(batch, "mixed", stats)), 2)
+
+        with self.assertRaises(ValueError):
+            get_model_inputs(batch, "linear", stats)
+
+
+class TestPredictTracks(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_list = write_gpx_files(self.tmp_dir.name, 4)
+
+        self.bad_file = os.path.join(self.tmp_dir.name, "bad.gpx")
+        with open(self.bad_file, "w") as gpx_file:
+            gpx_file.write("<gpx>")
+        self.file_list.insert(2, self.bad_file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_same_as_single_tracks(self):
+        predictor = FakeModelPredictor()
+        expected = {
+            file_name: predictor.predict_track(file_name)
+            for file_name in self.file_list
+            if file_name != self.bad_file
+        }
+
+        for jobs in [1, 2]:
+            predictor = FakeModelPredictor()
+            results = list(
+                predictor.predict_tracks(self.file_list, batch_size=20, jobs=jobs)
+            )
+
+            self.assertEqual([result[0] for result in results], self.file_list)
+            for file_name, prediction, error in results:
+                if file_name == self.bad_file:
+                    self.assertIsNone(prediction)
+                    self.assertIn("ParseError", error)
+                else:
+                    self.assertIsNone(error)
+                    self.assertAlmostEqual(
+                        prediction.moving_time_s,
+                        expected[file_name].moving_time_s,
+                        places=3,
+                    )
+                    self.assertEqual(
+                        prediction.standard_estimate_s,
+                        expected[file_name].standard_estimate_s,
+                    )
+
+            # Segments of several tracks are predicted together
+            self.assertLess(len(predictor.model.batch_sizes), 4)
+
+    def test_prediction_cache(self):
+        prediction_cache = PredictionCache()
+        predictor = FakeModelPredictor(prediction_cache)
+        expected = FakeModelPredictor().predict_track(self.file_list[0])
+
+        for _ in range(2):
+            prediction = predictor.predict_track(self.file_list[0])
+            self.assertAlmostEqual(
+                prediction.moving_time_s, expected.moving_time_s, places=3
+            )
+            self.assertEqual(prediction.num_segments, expected.num_segments)
+
+        # The second prediction is answered from the cache
+        self.assertEqual(len(predictor.model.batch_sizes), 1)
+        self.assertEqual(prediction_cache.stats.hits, expected.num_segments)
+
+        # Repeated segments in one batch are predicted once
+        batch = create_batch(3, seed=1)
+        batch = batch.select(np.array([0, 1, 0, 2, 1]))
+        predictions = predictor.predict_segments(batch)
+        self.assertEqual(predictor.model.batch_sizes[-1], 3)
+        np.testing.assert_allclose(
+            predictions, FakeModelPredictor().predict_segments(batch), rtol=1e-6
+        )
+
+    def test_retrained_model(self):
+        prediction_cache = PredictionCache()
+        FakeModelPredictor(prediction_cache).predict_track(self.file_list[0])
+
+        # Predictions of a model with other weights or statistics are not reused
+        predictor = FakeModelPredictor(prediction_cache, model_fingerprint="retrained")
+        predictor.predict_track(self.file_list[0])
+        self.assertEqual(len(predictor.model.batch_sizes), 1)
+        self.assertEqual(prediction_cache.stats.hits, 0)
+
+    def test_model_fingerprint(self):
+        model_file = os.path.join(self.tmp_dir.name, NUMPY_MODEL_FILES["mixed"])
+        stats_file = os.path.join(self.tmp_dir.name, "stats.csv")
+        export_model(MODEL_DIRECTORIES["mixed"], model_file)
+        NormalizationStats(DATA_COLUMNS, np.zeros(4), np.ones(4)).to_csv(stats_file)
+
+        fingerprint = get_model_fingerprint(
+            "mixed", self.tmp_dir.name, stats_file, backend="numpy"
+        )
+        self.assertEqual(
+            get_model_fingerprint("mixed", self.tmp_dir.name, stats_file, "numpy"),
+            fingerprint,
+        )
+        self.assertNotEqual(
+            get_model_fingerprint("mixed", ".", stats_file, "tensorflow"), fingerprint
+        )
+
+        NormalizationStats(DATA_COLUMNS, np.zeros(4), np.full(4, 2.0)).to_csv(
+            stats_file
+        )
+        stats_fingerprint = get_model_fingerprint(
+            "mixed", self.tmp_dir.name, stats_file, "numpy"
+        )
+        self.assertNotEqual(stats_fingerprint, fingerprint)
+
+        export_model(MODEL_DIRECTORIES["recurrent"], model_file)
+        self.assertNotEqual(
+            get_model_fingerprint("mixed", self.tmp_dir.name, stats_file, "numpy"),
+            stats_fingerprint,
+        )
+
+    def test_numpy_backend(self):
+        export_model(
+            MODEL_DIRECTORIES["recurrent"],
+            os.path.join(self.tmp_dir.name, NUMPY_MODEL_FILES["recurrent"]),
+        )
+        predictor = load_predictor("recurrent", self.tmp_dir.name, backend="numpy")
+
+        prediction = predictor.predict_track(self.file_list[0])
+        self.assertGreater(prediction.num_segments, 0)
+        self.assertGreater(prediction.moving_time_s, 0.0)
+        self.assertGreater(prediction.moving_time_std_s, 0.0)
+
+        with self.assertRaises(ValueError):
+            load_predictor(
+                "recurrent", self.tmp_dir.name, bucket_sizes=[16], backend="numpy"
+            )
+
+
+class TestStandardTimePredictor(unittest.TestCase):
+    # Modules that must not be imported when predicting standard estimates, since they dominate the startup time
+    HEAVY_MODULES = ["tensorflow", "pandas", "matplotlib", "h5py"]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_list = write_gpx_files(self.tmp_dir.name, 3)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_predict_tracks(self):
+        predictor = load_predictor("standard")
+        self.assertIsInstance(predictor, StandardTimePredictor)
+
+        file_list = self.file_list + [os.path.join(self.tmp_dir.name, "missing.gpx")]
+        results = list(predictor.predict_tracks(file_list, jobs=2))
+
+        self.assertEqual([result[0] for result in results], file_list)
+        for file_name, prediction, error in results[:-1]:
+            standard_estimate = compute_standard_estimate(file_name)
+            self.assertIsNone(error)
+            self.assertIsNone(prediction.moving_time_std_s)
+            self.assertEqual(
+                prediction.moving_time_s, standard_estimate["standard_estimate_s"]
+            )
+            self.assertEqual(
+                prediction.true_moving_time_s, standard_estimate["true_moving_time_s"]
+            )
+        self.assertIsNone(results[-1][1])
+        self.assertIn("FileNotFoundError", results[-1][2])
+
+        with self.assertRaises(ValueError):
+            load_predictor("linear")
+
+    def test_compute_standard_estimate(self):
+        file_name = os.path.join(self.tmp_dir.name, "tracks.gpx")
+        with open(file_name, "w") as gpx_file:
+            gpx_file.write(GPX_CONTENT)
+
+        for gpx_input in self.file_list + [file_name]:
+            with open(gpx_input, "r") as gpx_file:
+                track = gpxpy.parse(gpx_file).tracks[0]
+            uphill, downhill = track.get_uphill_downhill()
+
+            with open(gpx_input, "rb") as gpx_file:
+                estimates = [
+                    compute_standard_estimate(gpx_input),
+                    compute_standard_estimate(gpx_file),
+                ]
+            for estimate in estimates:
+                self.assertAlmostEqual(
+                    estimate["standard_estimate_s"],
+                    utils.compute_standard_walking_time(
+                        track.length_2d(), uphill, downhill
+                    ),
+                    places=6,
+                )
+                self.assertAlmostEqual(
+                    estimate["true_moving_time_s"],
+                    track.get_moving_data().moving_time,
+                    places=3,
+                )
+
+    def test_startup(self):
+        folder = os.path.dirname(os.path.abspath(__file__))
+        code = (
+            "import runpy, sys\n"
+            "sys.argv = ['inference.py', sys.argv[1], 'standard']\n"
+            "runpy.run_path('inference.py', run_name='__main__')\n"
+            "print(','.join(m for m in {} if m in sys.modules))\n"
+        ).format(self.HEAVY_MODULES)
+
+        output = subprocess.run(
+            [sys.executable, "-c", code, self.file_list[0]],
+            cwd=folder,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+        self.assertIn("The result of the standard estimate is", output)
+        self.assertEqual(output.splitlines()[-1], "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import filecmp
+import os
+import threading
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import gpxpy.gpx
+import numpy as np
+
+from config import DEFAULT_DATA_PREPARATION_CONFIG
+from feature_cache import FeatureCache
+from hdf5_writer import write_batches_to_hdf5
+from prepare_data import (
+    extract_segment_data,
+    generate_segment_data,
+    map_in_window,
+    write_data_to_hdf5,
+)
+from test_moving_data import create_segment_with_stops
+
+
+def write_gpx_files(folder: str, num_files: int) -> list:
+    "Write GPX files with random tracks to folder and return their names."
+    file_names = []
+    for idx in range(num_files):
+        gpx = gpxpy.gpx.GPX()
+        track = gpxpy.gpx.GPXTrack()
+        track.segments.append(create_segment_with_stops(400, seed=idx))
+        gpx.tracks.append(track)
+
+        file_name = os.path.join(folder, "track{}.gpx".format(idx))
+        with open(file_name, "w") as gpx_file:
+            gpx_file.write(gpx.to_xml())
+        file_names.append(file_name)
+
+    return file_names
+
+
+class TestMapInWindow(unittest.TestCase):
+    def test_bounded_window(self):
+        submitted = []
+        lock = threading.Lock()
+
+        def square(value: int) -> int:
+            with lock:
+                submitted.append(value)
+            return value**2
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = map_in_window(executor, square, range(100), window_size=8)
+            for idx, result in enumerate(results):
+                self.assertEqual(result, idx**2)
+                # Items are submitted lazily, one per consumed result
+                self.assertLessEqual(len(submitted), idx + 1 + 8)
+
+            self.assertEqual(list(map_in_window(executor, square, [], 8)), [])
+
+
+class TestExtractSegmentData(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_list = write_gpx_files(self.tmp_dir.name, 5)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_parallel_output_identical(self):
+        num_points_path = DEFAULT_DATA_PREPARATION_CONFIG.num_points_path
+
+        file_names = []
+        for jobs in [1, 2]:
+            gpx_data = extract_segment_data(
+                self.file_list, DEFAULT_DATA_PREPARATION_CONFIG, jobs=jobs
+            )
+            self.assertGreater(len(gpx_data), 0)
+
+            file_name = os.path.join(self.tmp_dir.name, "data_{}.hdf5".format(jobs))
+            write_data_to_hdf5(gpx_data, file_name, num_points_path)
+            file_names.append(file_name)
+
+        self.assertTrue(filecmp.cmp(*file_names, shallow=False))
+
+    def test_streaming_output_identical(self):
+        num_points_path = DEFAULT_DATA_PREPARATION_CONFIG.num_points_path
+        file_names = [
+            os.path.join(self.tmp_dir.name, name)
+            for name in ["data.hdf5", "data_streamed.hdf5"]
+        ]
+
+        write_data_to_hdf5(
+            extract_segment_data(self.file_list, DEFAULT_DATA_PREPARATION_CONFIG),
+            file_names[0],
+            num_points_path,
+        )
+        write_batches_to_hdf5(
+            generate_segment_data(
+                self.file_list, DEFAULT_DATA_PREPARATION_CONFIG, jobs=2
+            ),
+            file_names[1],
+            num_points_path,
+        )
+
+        self.assertTrue(filecmp.cmp(*file_names, shallow=False))
+
+    def test_feature_cache(self):
+        feature_cache = FeatureCache(os.path.join(self.tmp_dir.name, "cache"))
+
+        expected = extract_segment_data(self.file_list, DEFAULT_DATA_PREPARATION_CONFIG)
+        for _ in range(2):
+            gpx_data = extract_segment_data(
+                self.file_list,
+                DEFAULT_DATA_PREPARATION_CONFIG,
+                feature_cache=feature_cache,
+            )
+            for name in gpx_data.get_header():
+                np.testing.assert_array_equal(gpx_data[name], expected[name])
+
+        self.assertEqual(feature_cache.stats.misses, len(self.file_list))
+        self.assertEqual(feature_cache.stats.hits, len(self.file_list))
+
+    def test_empty_file_list(self):
+        gpx_data = extract_segment_data([], DEFAULT_DATA_PREPARATION_CONFIG, jobs=2)
+        self.assertEqual(len(gpx_data), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from array_segment import ArraySegment
+from geodesy import cumulative_distances
+from test_predictor import FakeModelPredictor
+from trail_network import (
+    TrailNetwork,
+    read_geojson_lines,
+    resample_segment,
+    split_lines_at_junctions,
+)
+
+# About 100 m in both directions at the latitude of the grid
+LONGITUDE_STEP = 100 / 75800
+LATITUDE_STEP = 100 / 111200
+
+
+def create_grid_geojson(num_rows: int, num_columns: int) -> dict:
+    """
+    Create GeoJSON with one line per row and column of a grid, elevation rising by 10 m per column.
+
+    Lines have three points between neighboring nodes, and rows are written as one MultiLineString.
+    """
+
+    def _point(row: float, column: float) -> list:
+        return [
+            8.0 + column * LONGITUDE_STEP,
+            47.0 + row * LATITUDE_STEP,
+            1000.0 + 10.0 * column,
+        ]
+
+    def _line(points: list) -> list:
+        return [
+            _point(*(np.array(start) + fraction * (np.array(end) - np.array(start))))
+            for start, end in zip(points[:-1], points[1:])
+            for fraction in [0.0, 0.5]
+        ] + [_point(*points[-1])]
+
+    rows = [
+        _line([(row, column) for column in range(num_columns)])
+        for row in range(num_rows)
+    ]
+    columns = [
+        _line([(row, column) for row in range(num_rows)])
+        for column in range(num_columns)
+    ]
+
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {"type": "MultiLineString", "coordinates": rows},
+            },
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [8, 47]}},
+        ]
+        + [
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {"type": "LineString", "coordinates": column},
+            }
+            for column in columns
+        ],
+    }
+
+
+class UphillModel(object):
+    "Model predicting the normalized uphill as moving time, which differs between directions."
+
+    def __call__(self, inputs):
+        return np.column_stack([inputs[:, 2], np.zeros(len(inputs))])
+
+
+class TestGraph(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.geojson_file = os.path.join(self.tmp_dir.name, "trails.geojson")
+        with open(self.geojson_file, "w") as output_file:
+            json.dump(create_grid_geojson(3, 4), output_file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read_geojson_lines(self):
+        lines = read_geojson_lines(self.geojson_file)
+
+        self.assertEqual([len(line) for line in lines], [7] * 3 + [5] * 4)
+        self.assertEqual(lines[0].elevation[-1], 1030.0)
+        self.assertTrue(np.all(np.isnan(lines[0].time)))
+
+    def test_split_lines_at_junctions(self):
+        node_coordinates, edge_nodes, edges = split_lines_at_junctions(
+            read_geojson_lines(self.geojson_file)
+        )
+
+        self.assertEqual(len(node_coordinates), 12)
+        self.assertEqual(len(edge_nodes), 3 * 3 + 2 * 4)
+        self.assertTrue(all(len(edge) == 3 for edge in edges))
+        for (start_node, end_node), edge in zip(edge_nodes, edges):
+            np.testing.assert_array_equal(
+                node_coordinates[start_node], edge.to_array()[0]
+            )
+            np.testing.assert_array_equal(
+                node_coordinates[end_node], edge.to_array()[-1]
+            )
+
+    def test_resample_segment(self):
+        segment = ArraySegment.from_array(
+            np.array([[8.0, 47.0, 0.0], [8.0, 47.0 + 3 * LATITUDE_STEP, 30.0]])
+        )
+        resampled_segment = resample_segment(segment, 7.0)
+
+        distances = np.diff(
+            cumulative_distances(
+                resampled_segment.latitude, resampled_segment.longitude
+            )
+        )
+        self.assertEqual(len(resampled_segment), 43)
+        np.testing.assert_allclose(distances, distances[0])
+        self.assertGreaterEqual(distances[0], 7.0)
+        np.testing.assert_array_equal(
+            resampled_segment.to_array()[[0, -1]], segment.to_array()
+        )
+
+
+class TestTrailNetwork(unittest.TestCase):
+    def setUp(self):
+        self.predictor = FakeModelPredictor()
+        self.network = TrailNetwork.from_lines(
+            read_geojson_lines_from_dict(create_grid_geojson(3, 4)), self.predictor
+        )
+
+    def test_edges(self):
+        self.assertEqual(len(self.network), 12)
+        np.testing.assert_allclose(self.network.edge_lengths_m, 100.0, rtol=0.01)
+        self.assertTrue(np.all(self.network.edge_moving_times_s > 0))
+        self.assertTrue(np.all(self.network.edge_variances >= 1.0))
+
+        # All edges are predicted with one model call
+        self.assertEqual(len(self.predictor.model.batch_sizes), 1)
+
+    def test_directions(self):
+        self.predictor.model = UphillModel()
+        network = TrailNetwork.from_lines(
+            read_geojson_lines_from_dict(create_grid_geojson(1, 2)), self.predictor
+        )
+
+        forward, backward = network.edge_moving_times_s[0]
+        self.assertGreater(forward, backward)
+
+    def test_fastest_path(self):
+        source = self.network.get_nearest_node(8.0, 47.0)
+        target = self.network.get_nearest_node(
+            8.0 + 3 * LONGITUDE_STEP, 47.0 + 2 * LATITUDE_STEP
+        )
+        path = self.network.get_fastest_path(source, target)
+
+        self.assertEqual(path.node_indices[0], source)
+        self.assertEqual(path.node_indices[-1], target)
+        self.assertEqual(len(path.node_indices), 6)
+        self.assertAlmostEqual(path.length_m, 500.0, delta=5.0)
+
+        # Times and variances of the path are sums over its edges in the direction of the path
+        arcs = {}
+        for (start, end), moving_times, variances in zip(
+            self.network.edge_nodes,
+            self.network.edge_moving_times_s,
+            self.network.edge_variances,
+        ):
+            arcs[start, end] = (moving_times[0], variances[0])
+            arcs[end, start] = (moving_times[1], variances[1])
+        path_arcs = np.array(
+            [
+                arcs[nodes]
+                for nodes in zip(path.node_indices[:-1], path.node_indices[1:])
+            ]
+        )
+        self.assertAlmostEqual(path.moving_time_s, np.sum(path_arcs[:, 0]))
+        self.assertAlmostEqual(path.moving_time_std_s, np.sqrt(np.sum(path_arcs[:, 1])))
+        self.assertEqual(path.get_coordinates(self.network).shape, (6, 3))
+
+        self.assertEqual(
+            self.network.get_fastest_path(source, source).node_indices, [source]
+        )
+
+    def test_unreachable(self):
+        network = TrailNetwork(
+            np.zeros((3, 3)), [[0, 1]], [1.0], [[1.0, 1.0]], [[1.0, 1.0]], "simple"
+        )
+        self.assertIsNone(network.get_fastest_path(0, 2))
+        self.assertEqual(network.get_fastest_path(1, 0).node_indices, [1, 0])
+
+    def test_isochrone(self):
+        source = self.network.get_nearest_node(8.0, 47.0)
+        node_indices, moving_times = self.network.get_isochrone(source, np.inf)
+        self.assertEqual(sorted(node_indices), list(range(12)))
+        self.assertTrue(np.all(np.diff(moving_times) >= 0))
+
+        for node, moving_time in zip(node_indices, moving_times):
+            self.assertAlmostEqual(
+                self.network.get_fastest_path(source, node).moving_time_s, moving_time
+            )
+
+        max_moving_time_s = float(np.median(moving_times))
+        reachable_nodes, reachable_times = self.network.get_isochrone(
+            source, max_moving_time_s
+        )
+        self.assertEqual(
+            sorted(reachable_nodes),
+            sorted(node_indices[moving_times <= max_moving_time_s]),
+        )
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "network.npz")
+            self.network.save(file_name)
+            loaded_network = TrailNetwork.load(file_name)
+
+        self.assertEqual(loaded_network.model_type, "simple")
+        np.testing.assert_array_equal(
+            loaded_network.edge_nodes, self.network.edge_nodes
+        )
+        path = self.network.get_fastest_path(0, 11)
+        loaded_path = loaded_network.get_fastest_path(0, 11)
+        self.assertEqual(loaded_path.node_indices, path.node_indices)
+        self.assertAlmostEqual(loaded_path.moving_time_s, path.moving_time_s, places=3)
+
+
+def read_geojson_lines_from_dict(content: dict):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = os.path.join(tmp_dir, "trails.geojson")
+        with open(file_name, "w") as output_file:
+            json.dump(content, output_file)
+        return read_geojson_lines(file_name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,545 @@
+"""
+Trail networks with predicted walking times of their edges, for fast fastest path and isochrone queries.
+
+Edges are cut into segments in the same way as tracks during inference and predicted with a trained model once, in
+both directions. Queries then only search the graph and never call the model.
+"""
+
+import argparse
+import heapq
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import gpx_array_stats
+from array_segment import ArraySegment
+from config import BACKENDS, MODEL_TYPES, DataPreparationConfig
+from elevation_model import ElevationModel
+from geodesy import cumulative_distances, distance
+from predictor import (
+    INFERENCE_DATA_PREPARATION_CONFIG,
+    HikingTimePredictor,
+    load_predictor,
+)
+
+# Increase when the format of saved networks changes
+NETWORK_FORMAT_VERSION: int = 1
+
+# Points of edges are resampled at about this distance, which is close to the spacing of filtered GPS tracks
+DEFAULT_POINT_SPACING_M: float = 5.0
+
+
+def read_geojson_lines(file_name: str) -> List[ArraySegment]:
+    """
+    Read the lines of a GeoJSON file, for example ways exported from OpenStreetMap.
+
+    Features with LineString or MultiLineString geometries are read, all other features are ignored. Elevations are
+    taken from the third coordinate and are NaN if it is missing.
+
+    :param: file_name:  Name of GeoJSON file with a FeatureCollection, a Feature or a geometry
+
+    :return: Array segment for every line, with missing timestamps
+    """
+    with open(file_name, "r") as geojson_file:
+        content = json.load(geojson_file)
+
+    if content.get("type") == "FeatureCollection":
+        geometries = [feature.get("geometry") for feature in content["features"]]
+    elif content.get("type") == "Feature":
+        geometries = [content.get("geometry")]
+    else:
+        geometries = [content]
+
+    lines = []
+    for geometry in geometries:
+        if geometry is None:
+            continue
+        if geometry["type"] == "LineString":
+            lines.append(geometry["coordinates"])
+        elif geometry["type"] == "MultiLineString":
+            lines.extend(geometry["coordinates"])
+
+    segments_list = []
+    for line in lines:
+        coordinates = np.array(
+            [(point + [np.nan])[:3] for point in line], dtype=float
+        ).reshape(-1, 3)
+        if len(coordinates) >= 2:
+            segments_list.append(ArraySegment.from_array(coordinates))
+
+    return segments_list
+
+
+def split_lines_at_junctions(
+    lines: List[ArraySegment], coordinate_resolution_deg: float = 1e-7
+) -> Tuple[np.array, np.array, List[ArraySegment]]:
+    """
+    Build a graph from lines, with nodes at the ends of lines and at points shared by several lines.
+
+    Points are identified by their coordinates rounded to the resolution.
+
+    :param: lines:                      Array segments of lines
+    :param: coordinate_resolution_deg:  Resolution of longitudes and latitudes for identifying points
+
+    :return: Array of shape (num_nodes, 3) with longitudes, latitudes and elevations of nodes, array of shape
+             (num_edges, 2) with the nodes at the start and end of every edge and the points of every edge
+    """
+    point_keys = [
+        list(
+            zip(
+                np.rint(line.longitude / coordinate_resolution_deg).astype(np.int64),
+                np.rint(line.latitude / coordinate_resolution_deg).astype(np.int64),
+            )
+        )
+        for line in lines
+    ]
+
+    # Points of several lines or ends of lines become nodes
+    counts: Dict[Tuple[int, int], int] = {}
+    for keys in point_keys:
+        for key in keys[1:-1]:
+            counts[key] = counts.get(key, 0) + 1
+        for key in [keys[0], keys[-1]]:
+            counts[key] = counts.get(key, 0) + 2
+
+    node_indices: Dict[Tuple[int, int], int] = {}
+    node_coordinates = []
+    edge_nodes = []
+    edges = []
+
+    def _get_node(line: ArraySegment, index: int, key: Tuple[int, int]) -> int:
+        if key not in node_indices:
+            node_indices[key] = len(node_coordinates)
+            node_coordinates.append(line.to_array()[index])
+        return node_indices[key]
+
+    for line, keys in zip(lines, point_keys):
+        start = 0
+        for index in range(1, len(line)):
+            if counts[keys[index]] < 2:
+                continue
+
+            start_node = _get_node(line, start, keys[start])
+            end_node = _get_node(line, index, keys[index])
+            if start_node != end_node or index - start > 1:
+                edge_nodes.append((start_node, end_node))
+                edges.append(line[start : index + 1])
+            start = index
+
+    return (
+        np.array(node_coordinates, dtype=float).reshape(-1, 3),
+        np.array(edge_nodes, dtype=np.int64).reshape(-1, 2),
+        edges,
+    )
+
+
+def resample_segment(segment: ArraySegment, point_spacing_m: float) -> ArraySegment:
+    """
+    Resample the points of a segment at equal distances along it, keeping its first and last point.
+
+    The distance between points is at least point_spacing_m, unless the segment is shorter, and less than twice of
+    it. Lines of maps often have points far apart, which could not be split into short enough parts otherwise.
+
+    :param: segment:            Array segment
+    :param: point_spacing_m:    Minimum distance between resampled points in meters
+
+    :return: Resampled segment with missing timestamps
+    """
+    distances = cumulative_distances(segment.latitude, segment.longitude)
+    num_intervals = max(1, int(distances[-1] // point_spacing_m))
+    resampled_distances = np.linspace(0.0, distances[-1], num_intervals + 1)
+
+    return ArraySegment(
+        *(
+            np.interp(resampled_distances, distances, getattr(segment, name))
+            for name in ["longitude", "latitude", "elevation"]
+        ),
+        np.full(num_intervals + 1, np.nan),
+    )
+
+
+def get_edge_segments(
+    edge: ArraySegment,
+    config: DataPreparationConfig = INFERENCE_DATA_PREPARATION_CONFIG,
+    point_spacing_m: float = DEFAULT_POINT_SPACING_M,
+) -> List[ArraySegment]:
+    """
+    Cut an edge into segments, see gpx_array_stats.split_segments_by_length.
+
+    :param: edge:               Points of the edge
+    :param: config:             Configuration of data preparation, only the maximum length and split mode are used
+    :param: point_spacing_m:    Distance between resampled points, see resample_segment
+
+    :return: Segments of the edge
+    """
+    return gpx_array_stats.split_segments_by_length(
+        [resample_segment(edge, point_spacing_m)],
+        max_length_m=config.max_length_m,
+        split_mode=config.split_mode,
+    )
+
+
+def predict_edge_times(
+    predictor: HikingTimePredictor,
+    edges: List[ArraySegment],
+    config: DataPreparationConfig = INFERENCE_DATA_PREPARATION_CONFIG,
+    point_spacing_m: float = DEFAULT_POINT_SPACING_M,
+    batch_size: int = 65536,
+) -> Tuple[np.array, np.array]:
+    """
+    Predict walking times of edges in both directions.
+
+    The segments of many edges are collected until a batch has at least batch_size segments, which are predicted
+    with one model call.
+
+    :param: predictor:          Predictor with loaded model
+    :param: edges:              Points of the edges
+    :param: config:             Configuration of data preparation
+    :param: point_spacing_m:    Distance between resampled points, see resample_segment
+    :param: batch_size:         Minimum number of segments per model call, except for the last one
+
+    :return: Arrays of shape (num_edges, 2) with the moving times in seconds and their variances, forwards in the
+             first and backwards in the second column
+    """
+    moving_times = np.zeros((len(edges), 2))
+    variances = np.zeros((len(edges), 2))
+
+    pending_segments: List[ArraySegment] = []
+    pending_edges: List[Tuple[int, int, int]] = []
+
+    def _predict_pending() -> None:
+        gpx_data = gpx_array_stats.extract_stats_batch(
+            pending_segments, num_points_path=config.num_points_path
+        )
+        predictions = predictor.predict_segments(gpx_data)
+        # Segments without timestamps are never dropped, so rows follow the pending segments
+        segment_ends = np.cumsum([num_segments for _, _, num_segments in pending_edges])
+        for (edge_index, direction, num_segments), end in zip(
+            pending_edges, segment_ends
+        ):
+            edge_predictions = predictions[end - num_segments : end]
+            moving_times[edge_index, direction] = np.sum(edge_predictions[:, 0])
+            variances[edge_index, direction] = np.sum(np.exp(edge_predictions[:, 1]))
+
+        pending_segments.clear()
+        pending_edges.clear()
+
+    for edge_index, edge in enumerate(edges):
+        for direction, points in enumerate([edge, edge[::-1]]):
+            edge_segments = get_edge_segments(points, config, point_spacing_m)
+            pending_segments.extend(edge_segments)
+            pending_edges.append((edge_index, direction, len(edge_segments)))
+
+        if len(pending_segments) >= batch_size:
+            _predict_pending()
+
+    if len(pending_segments) > 0:
+        _predict_pending()
+
+    return moving_times, variances
+
+
+@dataclass
+class TrailPath:
+    "Fastest path between two nodes of a trail network."
+
+    node_indices: List[int]
+    moving_time_s: float
+    moving_time_std_s: float
+    length_m: float
+
+    def get_coordinates(self, network: "TrailNetwork") -> np.array:
+        "Return longitudes, latitudes and elevations of the nodes of the path as columns of an array."
+        return network.node_coordinates[self.node_indices]
+
+
+class TrailNetwork(object):
+    """
+    Graph of a trail network with predicted walking times of its edges in both directions.
+
+    Nodes and edges are stored in arrays, and the outgoing edges of every node in compressed sparse row format, such
+    that networks are small on disk and quick to load. Paths are searched with Dijkstra's algorithm.
+    """
+
+    def __init__(
+        self,
+        node_coordinates: np.array,
+        edge_nodes: np.array,
+        edge_lengths_m: np.array,
+        edge_moving_times_s: np.array,
+        edge_variances: np.array,
+        model_type: str,
+    ) -> None:
+        """
+        Construct TrailNetwork object.
+
+        :param: node_coordinates:       Array of shape (num_nodes, 3) with longitudes, latitudes and elevations
+        :param: edge_nodes:             Array of shape (num_edges, 2) with start and end node of every edge
+        :param: edge_lengths_m:         Lengths of the edges in meters
+        :param: edge_moving_times_s:    Array of shape (num_edges, 2) with the moving times forwards and backwards
+        :param: edge_variances:         Array of shape (num_edges, 2) with the variances of the moving times
+        :param: model_type:             Model type with which the moving times were predicted
+        """
+        self.node_coordinates = np.asarray(node_coordinates, dtype=float)
+        self.edge_nodes = np.asarray(edge_nodes, dtype=np.int64).reshape(-1, 2)
+        self.edge_lengths_m = np.asarray(edge_lengths_m, dtype=float)
+        self.edge_moving_times_s = np.asarray(edge_moving_times_s, dtype=float)
+        self.edge_variances = np.asarray(edge_variances, dtype=float)
+        self.model_type = model_type
+
+        # Directed arcs, the forward arcs of all edges followed by the backward arcs
+        num_edges = len(self.edge_nodes)
+        arc_sources = np.concatenate([self.edge_nodes[:, 0], self.edge_nodes[:, 1]])
+        order = np.argsort(arc_sources, kind="stable")
+
+        self._arc_edges = np.tile(np.arange(num_edges), 2)[order]
+        self._arc_targets = np.concatenate(
+            [self.edge_nodes[:, 1], self.edge_nodes[:, 0]]
+        )[order]
+        self._arc_moving_times = self.edge_moving_times_s.T.reshape(-1)[order]
+        self._arc_offsets = np.searchsorted(
+            arc_sources[order], np.arange(len(self.node_coordinates) + 1)
+        )
+
+        # Python lists are much faster than arrays for the element access of the search
+        self._arc_offsets_list = self._arc_offsets.tolist()
+        self._arc_targets_list = self._arc_targets.tolist()
+        self._arc_moving_times_list = self._arc_moving_times.tolist()
+
+        self._arc_variances = self.edge_variances.T.reshape(-1)[order]
+        self._arc_directions = np.repeat([0, 1], num_edges)[order]
+
+    def __len__(self) -> int:
+        return len(self.node_coordinates)
+
+    @classmethod
+    def from_lines(
+        cls,
+        lines: List[ArraySegment],
+        predictor: HikingTimePredictor,
+        config: DataPreparationConfig = INFERENCE_DATA_PREPARATION_CONFIG,
+        point_spacing_m: float = DEFAULT_POINT_SPACING_M,
+        batch_size: int = 65536,
+    ) -> "TrailNetwork":
+        """
+        Build a trail network from lines and predict the walking times of its edges.
+
+        :param: lines:              Array segments of lines, see read_geojson_lines
+        :param: predictor:          Predictor with loaded model
+        :param: config:             Configuration of data preparation
+        :param: point_spacing_m:    Distance between resampled points, see resample_segment
+        :param: batch_size:         Minimum number of segments per model call, see predict_edge_times
+        """
+        node_coordinates, edge_nodes, edges = split_lines_at_junctions(lines)
+        edge_lengths_m = np.array(
+            [cumulative_distances(edge.latitude, edge.longitude)[-1] for edge in edges]
+        )
+        edge_moving_times_s, edge_variances = predict_edge_times(
+            predictor, edges, config, point_spacing_m, batch_size
+        )
+
+        return cls(
+            node_coordinates,
+            edge_nodes,
+            edge_lengths_m,
+            edge_moving_times_s,
+            edge_variances,
+            predictor.model_type,
+        )
+
+    def save(self, file_name: str) -> None:
+        """
+        Write network to npz file.
+
+        :param: file_name:  Name of npz file
+        """
+        np.savez_compressed(
+            file_name,
+            version=NETWORK_FORMAT_VERSION,
+            model_type=self.model_type,
+            node_coordinates=self.node_coordinates,
+            edge_nodes=self.edge_nodes.astype(np.int32),
+            edge_lengths_m=self.edge_lengths_m.astype(np.float32),
+            edge_moving_times_s=self.edge_moving_times_s.astype(np.float32),
+            edge_variances=self.edge_variances.astype(np.float32),
+        )
+
+    @classmethod
+    def load(cls, file_name: str) -> "TrailNetwork":
+        """
+        Read network from npz file written by save.
+
+        :param: file_name:  Name of npz file
+        """
+        with np.load(file_name) as content:
+            if int(content["version"]) != NETWORK_FORMAT_VERSION:
+                raise ValueError(
+                    f"Encountered unsupported network format {int(content['version'])}."
+                )
+            return cls(
+                content["node_coordinates"],
+                content["edge_nodes"],
+                content["edge_lengths_m"],
+                content["edge_moving_times_s"],
+                content["edge_variances"],
+                str(content["model_type"]),
+            )
+
+    def get_nearest_node(self, longitude: float, latitude: float) -> int:
+        """
+        Return index of the node closest to a position.
+
+        :param: longitude:  Longitude in degrees
+        :param: latitude:   Latitude in degrees
+        """
+        return int(
+            np.argmin(
+                distance(
+                    self.node_coordinates[:, 1],
+                    self.node_coordinates[:, 0],
+                    None,
+                    latitude,
+                    longitude,
+                    None,
+                )
+            )
+        )
+
+    def _search(
+        self,
+        source: int,
+        target: Optional[int] = None,
+        max_moving_time_s: float = np.inf,
+    ) -> Tuple[Dict[int, float], Dict[int, int]]:
+        "Dijkstra's algorithm, returning the times of the settled nodes and the arcs by which they were reached."
+        offsets = self._arc_offsets_list
+        arc_targets = self._arc_targets_list
+        arc_moving_times = self._arc_moving_times_list
+
+        moving_times = {source: 0.0}
+        settled: Dict[int, float] = {}
+        predecessor_arcs = {source: -1}
+        heap = [(0.0, source)]
+
+        while heap:
+            moving_time, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = moving_time
+            if node == target:
+                break
+
+            for arc in range(offsets[node], offsets[node + 1]):
+                new_moving_time = moving_time + arc_moving_times[arc]
+                neighbor = arc_targets[arc]
+                if new_moving_time <= max_moving_time_s and new_moving_time < (
+                    moving_times.get(neighbor, np.inf)
+                ):
+                    moving_times[neighbor] = new_moving_time
+                    predecessor_arcs[neighbor] = arc
+                    heapq.heappush(heap, (new_moving_time, neighbor))
+
+        return settled, predecessor_arcs
+
+    def get_fastest_path(self, source: int, target: int) -> Optional[TrailPath]:
+        """
+        Find the path with the shortest predicted moving time between two nodes.
+
+        :param: source:     Index of start node
+        :param: target:     Index of end node
+
+        :return: Fastest path, None if the target cannot be reached
+        """
+        settled, predecessor_arcs = self._search(source, target)
+        if target not in settled:
+            return None
+
+        arcs = []
+        node = target
+        while predecessor_arcs[node] >= 0:
+            arc = predecessor_arcs[node]
+            arcs.append(arc)
+            node = self.edge_nodes[self._arc_edges[arc], self._arc_directions[arc]]
+        arcs.reverse()
+
+        return TrailPath(
+            node_indices=[source] + [self._arc_targets_list[arc] for arc in arcs],
+            moving_time_s=settled[target],
+            moving_time_std_s=float(np.sqrt(np.sum(self._arc_variances[arcs]))),
+            length_m=float(np.sum(self.edge_lengths_m[self._arc_edges[arcs]])),
+        )
+
+    def get_isochrone(
+        self, source: int, max_moving_time_s: float
+    ) -> Tuple[np.array, np.array]:
+        """
+        Find all nodes that can be reached from a node within a moving time.
+
+        :param: source:             Index of start node
+        :param: max_moving_time_s:  Maximum predicted moving time in seconds
+
+        :return: Indices of reachable nodes and their fastest moving times, sorted by moving time
+        """
+        settled, _ = self._search(source, max_moving_time_s=max_moving_time_s)
+
+        return (
+            np.fromiter(settled.keys(), dtype=np.int64, count=len(settled)),
+            np.fromiter(settled.values(), dtype=float, count=len(settled)),
+        )
+
+    def report(self) -> str:
+        "Return summary of the network."
+        return "Trail network with {} nodes and {} edges of {:.1f} km, predicted with '{}' model".format(
+            len(self),
+            len(self.edge_nodes),
+            np.sum(self.edge_lengths_m) / 1000,
+            self.model_type,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build a trail network with predicted walking times from a GeoJSON file with lines."
+    )
+    parser.add_argument("input_file", help="GeoJSON file with trails.")
+    parser.add_argument(
+        "--output", default="trail_network.npz", help="npz file of the network."
+    )
+    parser.add_argument(
+        "--model-type", choices=MODEL_TYPES, default="mixed", help="Name of model."
+    )
+    parser.add_argument(
+        "--model-folder",
+        default=".",
+        help="Folder containing the models and train_dataset_stats.csv.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="tensorflow",
+        help="Run the SavedModel with TensorFlow or the model exported by export_numpy_model.py with NumPy.",
+    )
+    parser.add_argument(
+        "--dem-folder",
+        default=None,
+        help="Folder with SRTM tiles (.hgt files) for filling in missing elevations of trails.",
+    )
+    cmd_line_args = vars(parser.parse_args())
+
+    lines = read_geojson_lines(cmd_line_args["input_file"])
+    if cmd_line_args["dem_folder"] is not None:
+        ElevationModel(cmd_line_args["dem_folder"]).correct_elevations(lines)
+
+    trail_network = TrailNetwork.from_lines(
+        lines,
+        load_predictor(
+            cmd_line_args["model_type"],
+            cmd_line_args["model_folder"],
+            backend=cmd_line_args["backend"],
+        ),
+    )
+    trail_network.save(cmd_line_args["output"])
+
+    print("{} written to '{}'.".format(trail_network.report(), cmd_line_args["output"]))
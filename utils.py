@@ -2,8 +2,6 @@ from typing import Union
 
 import hashlib
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 
 from pathlib import Path
 
@@ -40,6 +38,9 @@ def scatter_plot(
     :param: predictions:    Array containing predicted values
     :param: label_text:     Label text for plot
     """
+    # Plotting libraries are only imported when needed, since they dominate the startup time of inference
+    import matplotlib.pyplot as plt
+
     plt.scatter(ground_truth, predictions, label="{} scatter plot".format(label_text))
     max_val: float = max([max(ground_truth), max(predictions)])
     plt.xlabel("True Values [{}]".format(label_text))
@@ -62,6 +63,8 @@ def plot_error_hist(
     :param: predictions:    Array containing predicted values
     :param: label_text:     Label text for plot
     """
+    import matplotlib.pyplot as plt
+
     error = ground_truth - predictions
     plt.xlabel("Prediction Error [{}]".format(label_text))
     plt.ylabel("Count")
@@ -75,6 +78,9 @@ def plot_history(history, mse_column_name: str, mae_column_name: str):
 
     :param: history: Keras History object
     """
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
     hist = pd.DataFrame(history.history)
     hist["epoch"] = history.epoch
 
@@ -105,6 +111,38 @@ def plot_history(history, mse_column_name: str, mae_column_name: str):
         plt.show()
 
 
+def get_path_hash(path: str) -> str:
+    """Compute SHA-256 hash of a path, as used for the assignment of files to dataset splits.
+
+    Parameters
+    ----------
+    path
+        Path to file
+
+    Returns
+    -------
+    Hexadecimal digest
+    """
+    return hashlib.sha256(str.encode(path)).hexdigest()
+
+
+def get_pseudo_probability_from_hash(path_hash: str, max_int: int = 4096) -> float:
+    """Convert path hash to pseudo probability, so that stored hashes need not be recomputed.
+
+    Parameters
+    ----------
+    path_hash
+        Hexadecimal digest from get_path_hash
+    max_int
+        Maximal integer number that should be allowed for modulo operations
+
+    Returns
+    -------
+    Pseudo-probability score, see get_pseudo_probability_for_path
+    """
+    return (int(path_hash, 16) % max_int) / (max_int - 1)
+
+
 def get_pseudo_probability_for_path(
     path: Union[str, Path], max_int: int = 4096
 ) -> float:
@@ -122,10 +160,6 @@ def get_pseudo_probability_for_path(
     Pseudo-probability score that is useful for unique and reproducible assignment of files to dataset split
     """
     if isinstance(path, Path):
-        path = str(Path)
-
-    encoded_path = str.encode(path)
-
-    hash_as_int = int(hashlib.sha256(encoded_path).hexdigest(), 16)
+        path = str(path)
 
-    return (hash_as_int % max_int) / (max_int - 1)
+    return get_pseudo_probability_from_hash(get_path_hash(path), max_int)